@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# measures the overhead of checking contracts at runtime on calls to the
+# examples, for both vm engines; repeated runs reuse memoized fn and pred calls
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import optparse
+import time
+
+import hldcompiler
+import hldinterpreter
+import hldparser
+import hldsemantic
+
+calls = [
+    ('fib.hld', 'calc_fib', [2000]),
+    ('pow.hld', 'calc_pow', [3, 2000]),
+    ('prime.hld', 'is_prime', [1009]),
+    ('mutual_rec.hld', 'calc_fct', [300]),
+    ('gcd.hld', 'calc_gcd_iter', [832040, 514229]),
+    ('sum.hld', 'sum', [10000]),
+]
+
+engines = {
+    'stack': hldinterpreter.Vm,
+    'flat': hldinterpreter.FlatVm,
+}
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    p.add_option('-n', '--repeat',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=3,
+                 help='run each call N times and keep the best time'
+                 )
+    return p.parse_args(argv)
+
+def best_time(vm, start: int, args: list[int], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        vm.run(start, args)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    examples = os.path.join(os.path.dirname(__file__), '..', 'examples')
+    columns = [f'{name}{suffix}' for name in engines for suffix in ['', '+checks', ' ovh']]
+    print(f'{"call":<32}' + ''.join(f'{c:>14}' for c in columns))
+    for filename, proc, args in calls:
+        decls = hldparser.parser.parse_file(os.path.join(examples, filename), parse_all=True).as_list()
+        hldsemantic.check_program(decls)
+        procs, prog, strtab = hldcompiler.compile_program(decls)
+        row = []
+        for engine in engines.values():
+            plain = best_time(engine(prog, strtab), procs[proc], args, options.repeat)
+            # fresh checks per engine, so memoized fn and pred calls are not shared
+            checks = []
+            checked_procs, checked_prog, checked_strtab = hldcompiler.compile_program(decls, checks)
+            checked = best_time(engine(checked_prog, checked_strtab, checks), checked_procs[proc], args, options.repeat)
+            row += [f'{plain:.4f}', f'{checked:.4f}', f'{checked / plain:.2f}x']
+        call = f'{proc}({", ".join(map(str, args))})'
+        print(f'{call:<32}' + ''.join(f'{c:>14}' for c in row))
+
+if __name__ == '__main__':
+    main(sys.argv)
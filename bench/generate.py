@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# generates synthetic programs of any size for the pipeline benchmark. Every
+# program passes the semantic checks, verifies for partial correctness and
+# terminates: procs only call procs declared after them, loops count up to a
+# fixed bound and division is only by constants
+
+import optparse
+import random
+import sys
+
+shapes = ['none', 'chain', 'tree', 'random']
+
+class Generator:
+    def __init__(self, statements: int, depth: int, nesting: int, iterations: int, rng: random.Random):
+        self.statements = statements
+        self.depth = depth
+        self.nesting = nesting
+        self.iterations = iterations
+        self.rng = rng
+        self.locals = ['v0', 'v1', 'v2']
+        self.variables = ['a', 'b']
+
+    def arithmetic(self, depth: int) -> str:
+        if depth <= 1 or self.rng.random() < 0.2:
+            if self.rng.random() < 0.3:
+                return str(self.rng.randrange(1, 10))
+            return self.rng.choice(self.variables)
+        op = self.rng.choice(['+', '-', '*', '+', '-'])
+        lhs = self.arithmetic(depth - 1)
+        rhs = self.arithmetic(depth - 1)
+        if self.rng.random() < 0.1:
+            return f'({self.condition(depth - 1)} ? {lhs} : {rhs})'
+        return f'({lhs} {op} {rhs})'
+
+    def condition(self, depth: int) -> str:
+        if depth > 2 and self.rng.random() < 0.3:
+            op = self.rng.choice(['&&', '||'])
+            return f'({self.condition(depth - 1)} {op} {self.condition(depth - 1)})'
+        op = self.rng.choice(['<', '<=', '>', '>=', '==', '!='])
+        return f'{self.arithmetic(depth - 1)} {op} {self.arithmetic(depth - 1)}'
+
+    def assignment(self) -> str:
+        # the modulo keeps the values small however many times loops run
+        dest = self.rng.choice(self.locals)
+        return f'{dest} := {self.arithmetic(self.depth)} % 1009;'
+
+    def block(self, budget: int, level: int, indent: str) -> tuple[list[str], int]:
+        lines = []
+        n = self.rng.randrange(1, 4)
+        while n > 0 and budget > 0:
+            n -= 1
+            budget -= 1
+            choice = self.rng.random()
+            if choice < 0.2 and level < self.nesting and budget > 0:
+                counter = f'i{level}'
+                # the counters of the enclosing loops are below the bound
+                bounds = [f'0 <= i{k} && i{k} < {self.iterations}' for k in range(level)]
+                invariant = ' && '.join(bounds + [f'0 <= {counter} && {counter} <= {self.iterations}'])
+                lines.append(f'{indent}{counter} := 0;')
+                lines.append(f'{indent}#invariant {invariant}')
+                lines.append(f'{indent}#variant {self.iterations} - {counter}')
+                lines.append(f'{indent}while {counter} < {self.iterations} {{')
+                body, budget = self.block(budget, level + 1, indent + '  ')
+                lines.extend(body)
+                lines.append(f'{indent}  {counter} := {counter} + 1;')
+                lines.append(f'{indent}}}')
+            elif choice < 0.4 and budget > 0:
+                lines.append(f'{indent}if {self.condition(self.depth)} {{')
+                then_block, budget = self.block(budget, level, indent + '  ')
+                lines.extend(then_block)
+                lines.append(f'{indent}}} else {{')
+                else_block, budget = self.block(budget, level, indent + '  ')
+                lines.extend(else_block)
+                lines.append(f'{indent}}}')
+            else:
+                lines.append(indent + self.assignment())
+        return lines, budget
+
+    def proc(self, name: str, callees: list[str]) -> list[str]:
+        lines = ['#post true', f'proc {name}(a, b) {{']
+        self.variables = ['a', 'b']
+        for v in self.locals:
+            lines.append(f'  {v} := {self.arithmetic(2)};')
+            self.variables.append(v)
+        for callee in callees:
+            lines.append(f'  v0 := {callee}({self.arithmetic(2)}, {self.arithmetic(2)});')
+        budget = self.statements
+        while budget > 0:
+            body, budget = self.block(budget, 0, '  ')
+            lines.extend(body)
+        lines.append('  return v0;')
+        lines.append('}')
+        return lines
+
+def call_graph(procs: int, shape: str, rng: random.Random) -> list[list[int]]:
+    # callees of each proc, always a tree rooted at proc 0 so that every proc
+    # runs once per call to it
+    callees: list[list[int]] = [[] for _ in range(procs)]
+    for i in range(1, procs):
+        if shape == 'chain':
+            callees[i - 1].append(i)
+        elif shape == 'tree':
+            callees[(i - 1) // 2].append(i)
+        elif shape == 'random':
+            callees[rng.randrange(i)].append(i)
+    return callees
+
+def generate(procs: int = 10, statements: int = 20, depth: int = 3, nesting: int = 2, shape: str = 'tree', iterations: int = 10, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    generator = Generator(statements, depth, nesting, iterations, rng)
+    lines = []
+    for i, callees in enumerate(call_graph(procs, shape, rng)):
+        lines.extend(generator.proc(f'p{i}', [f'p{callee}' for callee in callees]))
+        lines.append('')
+    return '\n'.join(lines)
+
+def add_options(p: optparse.OptionParser, type: str):
+    p.add_option('--procs',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='10',
+                 help='number of procs (default: %default)'
+                 )
+    p.add_option('--statements',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='20',
+                 help='number of statements of each proc (default: %default)'
+                 )
+    p.add_option('--depth',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='3',
+                 help='depth of the expressions (default: %default)'
+                 )
+    p.add_option('--nesting',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='2',
+                 help='maximum nesting of loops (default: %default)'
+                 )
+    p.add_option('--iterations',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='10',
+                 help='iterations of each loop (default: %default)'
+                 )
+    p.add_option('--shape',
+                 metavar='SHAPE',
+                 action='store',
+                 type='string',
+                 default='tree',
+                 help=f'shape of the call graph, one of {", ".join(shapes)} (default: %default)'
+                 )
+    p.add_option('--seed',
+                 metavar='N',
+                 action='store',
+                 type=type,
+                 default='0',
+                 help='seed of the random choices (default: %default)'
+                 )
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    add_options(p, 'int')
+    return p.parse_args(argv)
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    if options.shape not in shapes:
+        sys.exit(f'unknown shape `{options.shape}`')
+    sys.stdout.write(generate(options.procs, options.statements, options.depth, options.nesting,
+                              options.shape, options.iterations, options.seed))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# compares the code of hldcompiler before and after the peephole optimizer on
+# the calls of bench/vm.py: the number of instructions, the number of
+# instructions dispatched by the call and the time of the flat engine
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import optparse
+import time
+
+import hldcompiler
+import hldinterpreter
+import hldparser
+import hldsemantic
+
+from vm import calls
+
+class CountingProg(list):
+    # the stack engine fetches every instruction it dispatches by index
+    dispatched = 0
+
+    def __getitem__(self, i):
+        self.dispatched += 1
+        return super().__getitem__(i)
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    p.add_option('-n', '--repeat',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=3,
+                 help='run each call N times and keep the best time'
+                 )
+    return p.parse_args(argv)
+
+def measure(decls: list, optimize: bool, proc: str, args: list[int], repeat: int) -> tuple[int, int, float, int]:
+    procs, prog, strtab = hldcompiler.compile_program(decls, optimize=optimize)
+    counting = CountingProg(prog)
+    result = hldinterpreter.Vm(counting, strtab).run(procs[proc], args)
+    vm = hldinterpreter.FlatVm(prog, strtab)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        vm.run(procs[proc], args)
+        best = min(best, time.perf_counter() - start)
+    return len(prog), counting.dispatched, best, result
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    examples = os.path.join(os.path.dirname(__file__), '..', 'examples')
+    columns = ['size', 'opt size', 'dispatches', 'opt dispatches', 'time', 'opt time']
+    print(f'{"call":<32}' + ''.join(f'{c:>16}' for c in columns))
+    for filename, proc, args in calls:
+        decls = hldparser.parse_file(os.path.join(examples, filename), 'pratt')
+        hldsemantic.check_program(decls)
+        size, dispatched, seconds, result = measure(decls, False, proc, args, options.repeat)
+        opt_size, opt_dispatched, opt_seconds, opt_result = measure(decls, True, proc, args, options.repeat)
+        assert result == opt_result
+        row = [str(size), str(opt_size), str(dispatched), str(opt_dispatched), f'{seconds:.4f}', f'{opt_seconds:.4f}']
+        call = f'{proc}({", ".join(map(str, args))})'
+        print(f'{call:<32}' + ''.join(f'{c:>16}' for c in row))
+
+if __name__ == '__main__':
+    main(sys.argv)
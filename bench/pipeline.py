@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# times each stage of the pipeline on generated programs, from parsing to
+# verification, and prints the results as json to compare between releases.
+# Every generator option takes a comma separated list of values, and each
+# combination of them is measured, e.g. --procs 1,10,100 --depth 2,4
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import itertools
+import json
+import multiprocessing
+import optparse
+import platform
+import time
+import z3
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import generate
+import hldast
+import hldcompiler
+import hldinterpreter
+import hlddebug
+import hldparser
+import hldsemantic
+
+params = ['procs', 'statements', 'depth', 'nesting', 'iterations', 'shape', 'seed']
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    generate.add_options(p, 'string')
+    p.add_option('--parser',
+                 metavar='PARSER',
+                 action='store',
+                 type='choice',
+                 choices=hldparser.parsers,
+                 default='pyparsing',
+                 help=f'parser to time, one of {", ".join(hldparser.parsers)} (default: %default)'
+                 )
+    p.add_option('-n', '--repeat',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=3,
+                 help='time each stage N times and keep the best time'
+                 )
+    p.add_option('--no-verify',
+                 action='store_true',
+                 default=False,
+                 help='skip the verification stage'
+                 )
+    p.add_option('-o', '--output',
+                 metavar='FILE',
+                 action='store',
+                 type='string',
+                 help='write the results to FILE instead of stdout'
+                 )
+    return p.parse_args(argv)
+
+def best(repeat: int, f: Callable[[], object]) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def verify(src: str, parser: str) -> tuple[float, Optional[str]]:
+    decls = hldparser.parse_string(src, parser)
+    symtab, call_graph = hldsemantic.check_program(decls)
+    start = time.perf_counter()
+    error = None
+    try:
+        hlddebug.get_pre(decls, hlddebug.Correctness.PARTIAL, symtab, call_graph)
+    except hldast.HLDError as e:
+        error = str(e)
+    return time.perf_counter() - start, error
+
+def measure(src: str, options: optparse.Values, executor: ProcessPoolExecutor) -> dict:
+    seconds = {}
+    seconds['parse'] = best(options.repeat, lambda: hldparser.parse_string(src, options.parser))
+    decls = hldparser.parse_string(src, options.parser)
+    seconds['check'] = best(options.repeat, lambda: hldsemantic.check_program(decls))
+    seconds['compile'] = best(options.repeat, lambda: hldcompiler.compile_program(decls))
+    procs, prog, strtab = hldcompiler.compile_program(decls)
+    vm = hldinterpreter.Vm(prog, strtab)
+    seconds['run'] = best(options.repeat, lambda: vm.run(procs['p0'], [3, 5]))
+    record = {'seconds': seconds}
+    if not options.no_verify:
+        # recursive definitions live in the global z3 context, so every run
+        # gets a fresh process to keep earlier runs from affecting the solver
+        runs = [executor.submit(verify, src, options.parser).result() for _ in range(options.repeat)]
+        seconds['verify'] = min(t for t, _ in runs)
+        if runs[0][1] != None:
+            record['error'] = runs[0][1]
+    return record
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    values = {}
+    for param in params:
+        values[param] = getattr(options, param).split(',')
+        if param != 'shape':
+            values[param] = list(map(int, values[param]))
+    for shape in values['shape']:
+        if shape not in generate.shapes:
+            sys.exit(f'unknown shape `{shape}`')
+    mp_ctx = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(1, mp_ctx, max_tasks_per_child=1)
+    results = []
+    for combination in itertools.product(*values.values()):
+        config = dict(zip(params, combination))
+        src = generate.generate(**config)
+        record = {**config, 'lines': src.count('\n')}
+        record.update(measure(src, options, executor))
+        results.append(record)
+    executor.shutdown()
+    report = {
+        'python': platform.python_version(),
+        'z3': z3.get_version_string(),
+        'parser': options.parser,
+        'results': results,
+    }
+    if options.output != None:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main(sys.argv)
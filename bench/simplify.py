@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# compares the size of the preconditions reported and the time spent
+# simplifying them with the cheap and the full simplification
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import glob
+import multiprocessing
+import optparse
+
+from concurrent.futures import ProcessPoolExecutor
+
+import hldast
+import hlddebug
+import hldparser
+import hldsemantic
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    usage = 'usage: %prog [options] [files...]'
+    p = optparse.OptionParser(usage=usage)
+    p.add_option('--simplify-limit',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=hlddebug.Options.simplify_limit,
+                 help='size limit of the full simplification (default: %default)'
+                 )
+    return p.parse_args(argv)
+
+def verify(filename: str, correctness: hlddebug.Correctness, options: hlddebug.Options) -> tuple[int, float]:
+    # total size of the preconditions found and time spent simplifying
+    decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
+    symtab, call_graph = hldsemantic.check_program(decls)
+    stats = []
+    try:
+        pres = hlddebug.get_pre(decls, correctness, symtab, call_graph, options=options, stats=stats)
+        size = sum(hlddebug._size(pre) for pre in pres.values())
+    except hldast.HLDError:
+        size = 0
+    seconds = sum(record['seconds'] for record in stats if record['kind'] == 'simplify')
+    return size, seconds
+
+def main(argv: list[str]):
+    options, args = parse_args(argv)
+    root = os.path.join(os.path.dirname(__file__), '..')
+    filenames = args[1:] or sorted(glob.glob(os.path.join(root, 'examples', '*.hld')))
+    modes = {
+        'cheap': hlddebug.Options(),
+        'full': hlddebug.Options(full_simplify=True, simplify_limit=options.simplify_limit),
+    }
+    totals = {mode: [0, 0.0] for mode in modes}
+    # recursive definitions live in the global z3 context, so every run gets a
+    # fresh process to keep earlier runs from affecting the solver
+    mp_ctx = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(1, mp_ctx, max_tasks_per_child=1)
+    print(f'{"file":<24} {"mode":<8} {"cheap size":>10} {"time":>9} {"full size":>10} {"time":>9}')
+    for filename in filenames:
+        for correctness in hlddebug.Correctness:
+            name = os.path.basename(filename)
+            line = f'{name:<24} {correctness.value:<8}'
+            for mode, opts in modes.items():
+                size, seconds = executor.submit(verify, filename, correctness, opts).result()
+                totals[mode][0] += size
+                totals[mode][1] += seconds
+                line += f' {size:>10} {seconds:9.4f}'
+            print(line)
+    line = f'{"total":<33}'
+    for size, seconds in totals.values():
+        line += f' {size:>10} {seconds:9.4f}'
+    print(line)
+    executor.shutdown()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# compares verification time with a fresh solver per query against the
+# incremental solver kept by each verification context
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import glob
+import optparse
+import time
+
+import hldast
+import hlddebug
+import hldparser
+import hldsemantic
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    usage = 'usage: %prog [options] [files...]'
+    p = optparse.OptionParser(usage=usage)
+    p.add_option('-n', '--repeat',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=3,
+                 help='verify each file N times and keep the best time'
+                 )
+    return p.parse_args(argv)
+
+def verify(decls, correctness: hlddebug.Correctness, options: hlddebug.Options) -> float:
+    symtab, call_graph = hldsemantic.check_program(decls)
+    start = time.perf_counter()
+    try:
+        hlddebug.get_pre(decls, correctness, symtab, call_graph, options=options)
+    except hldast.HLDError:
+        pass
+    return time.perf_counter() - start
+
+def main(argv: list[str]):
+    options, args = parse_args(argv)
+    root = os.path.join(os.path.dirname(__file__), '..')
+    filenames = args[1:] or sorted(glob.glob(os.path.join(root, 'examples', '*.hld')))
+    modes = {
+        'fresh': hlddebug.Options(incremental=False),
+        'incremental': hlddebug.Options(incremental=True),
+    }
+    totals = dict.fromkeys(modes, 0.0)
+    print(f'{"file":<24} {"mode":<8} {"fresh":>9} {"incr":>9} {"speedup":>8}')
+    for filename in filenames:
+        decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
+        for correctness in hlddebug.Correctness:
+            times = {}
+            for mode, opts in modes.items():
+                times[mode] = min(verify(decls, correctness, opts) for _ in range(options.repeat))
+                totals[mode] += times[mode]
+            name = os.path.basename(filename)
+            speedup = times['fresh'] / times['incremental']
+            print(f'{name:<24} {correctness.value:<8} {times["fresh"]:9.4f} {times["incremental"]:9.4f} {speedup:7.2f}x')
+    speedup = totals['fresh'] / totals['incremental']
+    print(f'{"total":<33} {totals["fresh"]:9.4f} {totals["incremental"]:9.4f} {speedup:7.2f}x')
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# compares the verification conditions generated by substitution and in
+# passive single assignment form on procs made of N if statements in a row,
+# which double the substituted conditions each
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import optparse
+import time
+
+import hlddebug
+import hldparser
+import hldsemantic
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    p.add_option('--ifs',
+                 metavar='N,...',
+                 action='store',
+                 type='string',
+                 default='2,4,8,12',
+                 help='numbers of if statements in a row to measure (default: %default)'
+                 )
+    p.add_option('--vcgen',
+                 metavar='VCGEN,...',
+                 action='store',
+                 type='string',
+                 default=','.join(hlddebug.vcgens),
+                 help='verification condition generators to compare (default: %default)'
+                 )
+    p.add_option('--total',
+                 action='store_true',
+                 default=False,
+                 help='check for total correctness instead of partial'
+                 )
+    return p.parse_args(argv)
+
+def stress(ifs: int) -> str:
+    lines = ['#pre n >= 0', '#post result >= 0', 'proc stress(n) {', '  x := n;']
+    for i in range(1, ifs + 1):
+        lines.append(f'  if x > {i} {{')
+        lines.append(f'    x := x - {i};')
+        lines.append('  } else {')
+        lines.append(f'    x := x + {i};')
+        lines.append('  }')
+    lines.append('  return x;')
+    lines.append('}')
+    return '\n'.join(lines)
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    vcgens = options.vcgen.split(',')
+    for vcgen in vcgens:
+        if vcgen not in hlddebug.vcgens:
+            sys.exit(f'unknown vcgen `{vcgen}`')
+    correctness = hlddebug.Correctness.TOTAL if options.total else hlddebug.Correctness.PARTIAL
+    columns = [f'{vcgen}{suffix}' for vcgen in vcgens for suffix in [' size', ' time']]
+    print(f'{"ifs":>6}' + ''.join(f'{c:>14}' for c in columns))
+    for ifs in map(int, options.ifs.split(',')):
+        decls = hldparser.parse_string(stress(ifs), 'pratt')
+        symtab, call_graph = hldsemantic.check_program(decls)
+        row = []
+        for vcgen in vcgens:
+            stats: list[dict] = []
+            start = time.perf_counter()
+            hlddebug.get_pre(decls, correctness, symtab, call_graph,
+                             options=hlddebug.Options(vcgen=vcgen), stats=stats)
+            seconds = time.perf_counter() - start
+            # the size of the largest query, the one on the whole body
+            size = max(record['size'] for record in stats if record['kind'] == 'precondition')
+            row += [str(size), f'{seconds:.4f}']
+        print(f'{ifs:>6}' + ''.join(f'{c:>14}' for c in row))
+
+if __name__ == '__main__':
+    main(sys.argv)
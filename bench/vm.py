@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# compares the execution engines of hldinterpreter on calls to the examples
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hld'))
+
+import optparse
+import time
+
+from typing import Callable
+
+import hldcompiler
+import hldinterpreter
+import hldparser
+import hldpycompiler
+import hldsemantic
+
+calls = [
+    ('fib.hld', 'calc_fib', [20000]),
+    ('pow.hld', 'calc_pow', [3, 20000]),
+    ('prime.hld', 'is_prime', [100003]),
+    ('mutual_rec.hld', 'calc_fct', [400]),
+    ('gcd.hld', 'calc_gcd_rec', [832040, 514229]),
+    ('sum.hld', 'sum', [100000]),
+]
+
+def stack_engine(decls: list) -> Callable[[str, list[int]], int]:
+    procs, prog, strtab = hldcompiler.compile_program(decls)
+    vm = hldinterpreter.Vm(prog, strtab)
+    return lambda proc, args: vm.run(procs[proc], args)
+
+def flat_engine(decls: list) -> Callable[[str, list[int]], int]:
+    procs, prog, strtab = hldcompiler.compile_program(decls)
+    vm = hldinterpreter.FlatVm(prog, strtab)
+    return lambda proc, args: vm.run(procs[proc], args)
+
+def python_engine(decls: list) -> Callable[[str, list[int]], int]:
+    fns = hldpycompiler.compile_program(decls)
+    return lambda proc, args: fns[proc](*args)
+
+engines = {
+    'stack': stack_engine,
+    'flat': flat_engine,
+    'python': python_engine,
+}
+
+def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
+    p = optparse.OptionParser(usage='usage: %prog [options]')
+    p.add_option('-n', '--repeat',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=3,
+                 help='run each call N times and keep the best time'
+                 )
+    return p.parse_args(argv)
+
+def main(argv: list[str]):
+    options, _ = parse_args(argv)
+    examples = os.path.join(os.path.dirname(__file__), '..', 'examples')
+    print(f'{"call":<32}' + ''.join(f'{name:>10}' for name in engines))
+    for filename, proc, args in calls:
+        decls = hldparser.parser.parse_file(os.path.join(examples, filename), parse_all=True).as_list()
+        hldsemantic.check_program(decls)
+        times = {}
+        results = set()
+        for name, engine in engines.items():
+            execute = engine(decls)
+            best = float('inf')
+            for _ in range(options.repeat):
+                start = time.perf_counter()
+                results.add(execute(proc, args))
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+        assert len(results) == 1
+        call = f'{proc}({", ".join(map(str, args))})'
+        print(f'{call:<32}' + ''.join(f'{t:10.4f}' for t in times.values()))
+
+if __name__ == '__main__':
+    main(sys.argv)
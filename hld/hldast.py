@@ -1,134 +1,173 @@
 #!/usr/bin/env python3
 
-import dataclasses
-import pyparsing
+import bisect
+import re
 
 from abc import ABC
-from dataclasses import dataclass
-from operator import attrgetter
-from typing import Optional, NoReturn, Union
-
-@dataclass(frozen=True, repr=False)
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, NoReturn, Union
+
+class Source:
+    # the text of a parsed file, shared by all of its nodes. The offsets of
+    # its lines are only found on the first lookup, lookups then bisect them
+    __slots__ = ('text', 'line_starts')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.line_starts: Optional[list[int]] = None
+
+    def __getstate__(self):
+        return self.text
+
+    def __setstate__(self, text: str):
+        self.text = text
+        self.line_starts = None
+
+    def _line_index(self, loc: int) -> int:
+        if self.line_starts == None:
+            self.line_starts = [0] + [m.end() for m in re.finditer('\n', self.text)]
+        return bisect.bisect_right(self.line_starts, loc) - 1
+
+    def lineno(self, loc: int) -> int:
+        return self._line_index(loc) + 1
+
+    def col(self, loc: int) -> int:
+        i = self._line_index(loc)
+        assert self.line_starts != None
+        return loc - self.line_starts[i] + 1
+
+    def line(self, loc: int) -> str:
+        i = self._line_index(loc)
+        assert self.line_starts != None
+        if i + 1 < len(self.line_starts):
+            return self.text[self.line_starts[i]:self.line_starts[i + 1] - 1]
+        return self.text[self.line_starts[i]:]
+
+def format_error(src: Source, loc: int, msg: str) -> str:
+    lineno = src.lineno(loc)
+    col = src.col(loc)
+    line = src.line(loc)
+    ptr = f'{" " * (col-1)}^'
+    return f'{lineno}:{col}: error: {msg}\n{line}\n{ptr}'
+
+# nodes compare and hash by their location and children, never by the source
+@dataclass(frozen=True, repr=False, slots=True, weakref_slot=True)
 class ASTNode(ABC):
-    src: str
+    src: Source = field(compare=False)
     loc: int
 
     def error(self, msg: str) -> NoReturn:
-        lineno = pyparsing.lineno(self.loc, self.src)
-        col = pyparsing.col(self.loc, self.src)
-        line = pyparsing.line(self.loc, self.src)
-        ptr = f'{" " * (col-1)}^'
-        raise HLDError(f'{lineno}:{col}: error: {msg}\n{line}\n{ptr}')
+        raise HLDError(format_error(self.src, self.loc, msg), self.loc, msg)
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, k) for k in self.__match_args__)
 
     def __repr__(self) -> str:
-        pairs = (((f.name, attrgetter(f.name)(self))
-                  for f in dataclasses.fields(self)
-                    if not f.name in {'src', 'loc'}
-                  ))
-        as_str = ', '.join(f'{k}={repr(v)}' for k, v in pairs)
+        # the fields are those of __init__, after src and loc
+        as_str = ', '.join(f'{k}={repr(getattr(self, k))}' for k in self.__match_args__[2:])
         return f'{self.__class__.__name__}({as_str})'
 
 class Declaration(ASTNode, ABC):
-    pass
+    __slots__ = ()
 
 class Statement(ASTNode, ABC):
-    pass
+    __slots__ = ()
 
 class Expr(ASTNode, ABC):
-    pass
+    __slots__ = ()
 
 class Literal(Expr, ABC):
-    pass
+    __slots__ = ()
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Identifier(Expr):
     value: str
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class BoolLiteral(Literal):
     value: bool
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class IntLiteral(Literal):
     value: int
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class PrefixExpr(Expr, ABC):
     op: str
     expr: Expr
 
 class PrefixArithmeticExpr(PrefixExpr):
-    pass
+    __slots__ = ()
 
 class PrefixLogicalExpr(PrefixExpr):
-    pass
+    __slots__ = ()
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class InfixExpr(Expr, ABC):
     op: str
     left: Expr
     right: Expr
 
 class InfixArithmeticExpr(InfixExpr):
-    pass
+    __slots__ = ()
 
 class InfixLogicalExpr(InfixExpr):
-    pass
+    __slots__ = ()
 
 class InfixRelationalExpr(InfixExpr):
-    pass
+    __slots__ = ()
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class TernaryExpr(Expr):
     cond: Expr
     then_expr: Expr
     else_expr: Expr
 
 class ResultExpr(Expr):
-    pass
+    __slots__ = ()
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class CallExpr(Expr):
     callee: Identifier
     args: list[Expr]
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class QuantifiedExpr(Expr):
   quantifier: str
   bindings: list[Identifier]
   expr: Expr
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Assignment(Statement):
     dest: Identifier
     value: Expr
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Block(Statement):
     statements: list[Statement]
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class IfElse(Statement):
     cond: Expr
     then_block: Block
     else_block: Union[Block, 'IfElse']
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class While(Statement):
     invariant: Optional[Expr]
     variant: Optional[Expr]
     cond: Expr
     body: Block
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Assert(Statement):
     expr: Expr
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Return(Statement):
     expr: Expr
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Proc(Declaration):
     pre: Optional[Expr]
     post: Optional[Expr]
@@ -137,17 +176,30 @@ class Proc(Declaration):
     params: list[Identifier]
     body: Block
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Fn(Declaration):
     name: Identifier
     params: list[Identifier]
     expr: Expr
 
-@dataclass(frozen=True, repr=False)
+@dataclass(frozen=True, repr=False, slots=True)
 class Pred(Declaration):
     name: Identifier
     params: list[Identifier]
     expr: Expr
 
+def walk(node: ASTNode) -> Iterator[ASTNode]:
+    yield node
+    for name in node.__match_args__[2:]:
+        value = getattr(node, name)
+        if isinstance(value, ASTNode):
+            yield from walk(value)
+        elif isinstance(value, list):
+            for child in value:
+                yield from walk(child)
+
 class HLDError(RuntimeError):
-    pass
+    def __init__(self, message: str, loc: Optional[int] = None, msg: Optional[str] = None):
+        super().__init__(message)
+        self.loc = loc
+        self.msg = msg
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import pyparsing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from hldast import *
+import hlddebug
+import hldparser
+import hldsemantic
+
+# verifies many files in one process tree, so the grammar and z3 are loaded
+# once per worker rather than once per file. Each file is verified
+# sequentially in its worker, the workers share the verification cache
+
+# fn and pred definitions this process added to the global z3 context, which
+# keeps every definition given to a name
+_defined: dict[str, str] = {}
+
+def find_files(paths: list[str]) -> list[str]:
+    # directories stand for the .hld files below them
+    filenames = []
+    for path in paths:
+        if not os.path.isdir(path):
+            filenames.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            filenames.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.hld'))
+    return filenames
+
+def verify_file(filename: str, parser: str, correctness: hlddebug.Correctness, cache_dir: Optional[str], use_cache: bool, options: hlddebug.Options) -> dict:
+    # the status is `verified`, `failed` on an error in the program, `unknown`
+    # when the solver gave up or `error` when the file could not be parsed
+    start = time.perf_counter()
+    record: dict = {'file': filename}
+    try:
+        decls = hldparser.parse_file(filename, parser)
+        symtab, call_graph = hldsemantic.check_program(decls)
+        definitions = {decl.name.value: repr(decl) for decl in decls if isinstance(decl, (Fn, Pred))}
+        if any(_defined.get(name, definition) != definition for name, definition in definitions.items()):
+            # another definition of the same name would make the solver
+            # reason about both, verify the file in a fresh process instead
+            mp_ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(1, mp_ctx) as executor:
+                return executor.submit(verify_file, filename, parser, correctness, cache_dir, use_cache, options).result()
+        _defined.update(definitions)
+        cache = hlddebug.VerificationCache(cache_dir) if use_cache else None
+        pres = hlddebug.get_pre(decls, correctness, symtab, call_graph, cache=cache, options=options)
+        record['status'] = 'verified'
+        record['pres'] = {name: str(pre) for name, pre in pres.items()}
+    except OSError as os_err:
+        record['status'] = 'error'
+        record['message'] = f'error: {os_err.filename}: {os_err.strerror}'
+    except pyparsing.exceptions.ParseBaseException as pe:
+        record['status'] = 'error'
+        record['message'] = f'{filename}:{format_error(Source(pe.pstr), pe.loc, pe.msg)}'
+    except hlddebug.UnknownResult as e:
+        record['status'] = 'unknown'
+        record['message'] = f'{filename}:{e.args[0]}'
+    except HLDError as e:
+        record['status'] = 'failed'
+        record['message'] = f'{filename}:{e.args[0]}'
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    return record
+
+def verify_files(filenames: list[str], parser: str, correctness: hlddebug.Correctness, jobs: int = 1, cache_dir: Optional[str] = None, use_cache: bool = True, options: hlddebug.Options = hlddebug.Options()) -> Iterator[dict]:
+    # yields the record of each file in the order given
+    args = (parser, correctness, cache_dir, use_cache, options)
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield verify_file(filename, *args)
+        return
+    mp_ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(jobs, mp_ctx) as executor:
+        futures = [executor.submit(verify_file, filename, *args) for filename in filenames]
+        try:
+            for future in futures:
+                yield future.result()
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -1,9 +1,39 @@
 #!/usr/bin/env python3
 
 from functools import singledispatchmethod
-from typing import Optional
+from typing import Any, Callable, Optional
 from hldast import *
-from hldinterpreter import Opcode, Inst
+from hldeval import Evaluator
+from hldinterpreter import Check, Opcode, Inst
+from hldpeephole import optimize
+
+class ContractError(HLDError):
+    # proc is the proc whose code contains the failed check
+    def __init__(self, message: str, loc: int, msg: str, proc: str):
+        super().__init__(message, loc, msg)
+        self.proc = proc
+
+def _make_check(test: Callable[[list[int], int], Any], node: ASTNode, what: str, msg: str, proc: str) -> Check:
+    failed = f'{what} {msg}'
+    message = format_error(node.src, node.loc, failed)
+    def check(stack: list[int], fp: int):
+        try:
+            ok = test(stack, fp)
+        except (ArithmeticError, RecursionError) as e:
+            raise RuntimeError(format_error(node.src, node.loc, f'{what} could not be evaluated: {e}'))
+        if not ok:
+            raise ContractError(message, node.loc, failed, proc)
+    return check
+
+def _make_store(value: Callable[[list[int], int], int], slot: int) -> Callable[[list[int], int], bool]:
+    def test(stack: list[int], fp: int) -> bool:
+        v = value(stack, fp)
+        stack[fp + slot] = v
+        return v >= 0
+    return test
+
+def _make_decrease(value: Callable[[list[int], int], int], slot: int) -> Callable[[list[int], int], bool]:
+    return lambda stack, fp: value(stack, fp) < stack[fp + slot]
 
 class __Context:
     __bin_arith_opcodes = {
@@ -22,12 +52,20 @@ class __Context:
         '!=': Opcode.NE,
     }
 
-    def __init__(self):
+    def __init__(self, checks: Optional[list[Check]], variants: bool, smt_division: bool, optimize: bool):
         self.vars: dict[str, int] = {}
         self.prog: list[Inst] = []
         self.procs: dict[str, int] = {}
         self.calls: dict[int, str] = {}
         self.strtab: list[str] = []
+        self.checks = checks
+        self.variants = variants
+        self.smt_division = smt_division
+        self.optimize = optimize
+        self.evaluator: Optional[Evaluator] = None
+        self.decls: dict[str, Proc] = {}
+        self.callees: dict[str, set[str]] = {}
+        self.current: Optional[Proc] = None
 
     def allocate_variable(self, id: str) -> int:
         i = len(self.vars)
@@ -43,6 +81,50 @@ class __Context:
     def emit(self, opcode: Opcode, x=0):
         self.prog.append(Inst(opcode, x))
 
+    def emit_check(self, test: Callable[[list[int], int], Any], node: ASTNode, what: str, msg: str):
+        assert self.checks != None and self.current != None
+        self.emit(Opcode.CHECK, len(self.checks))
+        self.checks.append(_make_check(test, node, what, msg, self.current.name.value))
+
+    def emit_contract(self, expr: Optional[Expr], what: str):
+        if expr == None:
+            return
+        test = self.contract(expr)
+        if test != None:
+            self.emit_check(test, expr, what, 'violated')
+
+    def emit_variant(self, expr: Optional[Expr], slot: str) -> Optional[Callable[[list[int], int], int]]:
+        # the value is kept in a hidden local to check that it decreases
+        if expr == None or not self.variants:
+            return None
+        value = self.contract(expr)
+        if value != None:
+            self.emit_check(_make_store(value, self.allocate_variable(slot)), expr, 'variant', 'is negative')
+        return value
+
+    def contract(self, expr: Expr) -> Optional[Callable[[list[int], int], Any]]:
+        # locals are addressed relative to the frame, the value to be returned
+        # is on top of the stack
+        assert self.evaluator != None
+        bound = {binding.value for node in walk(expr) if isinstance(node, QuantifiedExpr)
+                 for binding in node.bindings}
+        callees = {node.callee.value for node in walk(expr) if isinstance(node, CallExpr)}
+        env = {node.value: f'stack[fp + {self.get_variable(node.value)}]' for node in walk(expr)
+               if isinstance(node, Identifier) and not node.value in bound | callees}
+        env['result'] = 'stack[-1]'
+        return self.evaluator.compile(expr, env)
+
+    def is_recursive(self, callee: str, caller: str) -> bool:
+        visited = set()
+        search_set = {callee}
+        while len(search_set) > 0:
+            cur = search_set.pop()
+            if cur == caller:
+                return True
+            visited.add(cur)
+            search_set.update(c for c in self.callees[cur] if c not in visited)
+        return False
+
     @singledispatchmethod
     def compile(self, _: ASTNode):
         raise NotImplementedError
@@ -79,9 +161,43 @@ class __Context:
     def _(self, expr: InfixArithmeticExpr):
         self.compile(expr.left)
         self.compile(expr.right)
+        if self.smt_division and expr.op in {'/', '%'}:
+            self.emit_smt_divmod(expr.op)
+            return
         opcode = self.__bin_arith_opcodes[expr.op]
         self.emit(opcode)
 
+    def emit_smt_divmod(self, op: str):
+        # the remainder of smt-lib division is never negative, unlike python's
+        #   a % b == a % abs(b)
+        #   a / b == (a - a % abs(b)) // b
+        dividend = self.get_variable('#dividend')
+        divisor = self.get_variable('#divisor')
+        self.emit(Opcode.STORE, divisor)
+        self.emit(Opcode.STORE, dividend)
+        if op == '/':
+            self.emit(Opcode.LOAD, dividend)
+        self.emit(Opcode.LOAD, dividend)
+        self.emit(Opcode.LOAD, divisor)
+        self.emit(Opcode.CONST, 0)
+        self.emit(Opcode.LT)
+        l0 = len(self.prog)
+        self.emit(Opcode.JMP_UNLESS)
+        self.emit(Opcode.POP)
+        self.emit(Opcode.LOAD, divisor)
+        self.emit(Opcode.NEG)
+        l1 = len(self.prog)
+        self.emit(Opcode.JMP)
+        self.backpatch(l0)
+        self.emit(Opcode.POP)
+        self.emit(Opcode.LOAD, divisor)
+        self.backpatch(l1)
+        self.emit(Opcode.MOD)
+        if op == '/':
+            self.emit(Opcode.SUB)
+            self.emit(Opcode.LOAD, divisor)
+            self.emit(Opcode.DIV)
+
     @compile.register
     def _(self, expr: InfixRelationalExpr):
         self.compile(expr.left)
@@ -131,9 +247,12 @@ class __Context:
 
     @compile.register
     def _(self, call: CallExpr):
-        for arg in reversed(call.args):
+        for arg in call.args:
             self.compile(arg)
         callee = call.callee.value
+        if self.checks != None:
+            self.check_call_pre(call)
+            self.check_call_variant(call)
         try:
             self.emit(Opcode.FRAME, len(call.args))
             self.emit(Opcode.CALL, self.procs[callee])
@@ -141,6 +260,33 @@ class __Context:
             self.emit(Opcode.CALL)
             self.calls[len(self.prog)-1] = callee
 
+    def check_call_pre(self, call: CallExpr):
+        # checked by the caller too, so a violation is attributed to it
+        assert self.evaluator != None
+        callee = self.decls[call.callee.value]
+        if callee.pre == None:
+            return
+        n = len(callee.params)
+        env = {param.value: f'stack[{i - n}]' for i, param in enumerate(callee.params)}
+        test = self.evaluator.compile(callee.pre, env)
+        if test != None:
+            self.emit_check(test, callee.pre, 'precondition', 'violated')
+
+    def check_call_variant(self, call: CallExpr):
+        assert self.current != None and self.evaluator != None
+        callee = self.decls[call.callee.value]
+        caller = self.current
+        if callee.variant == None or caller.variant == None or not self.variants:
+            return
+        if not self.is_recursive(callee.name.value, caller.name.value):
+            return
+        # the arguments of the call are on top of the stack
+        n = len(callee.params)
+        env = {param.value: f'stack[{i - n}]' for i, param in enumerate(callee.params)}
+        value = self.evaluator.compile(callee.variant, env)
+        if value != None and '#variant' in self.vars:
+            self.emit_check(_make_decrease(value, self.vars['#variant']), call, 'variant', 'does not decrease')
+
     @compile.register
     def _(self, assignment: Assignment):
         self.compile(assignment.value)
@@ -164,11 +310,19 @@ class __Context:
     @compile.register
     def _(self, while_: While):
         l0 = len(self.prog)
+        variant = None
+        slot = f'#variant{l0}'
+        if self.checks != None:
+            self.emit_contract(while_.invariant, 'invariant')
+            variant = self.emit_variant(while_.variant, slot)
         self.compile(while_.cond)
         l1 = len(self.prog)
         self.emit(Opcode.JMP_UNLESS)
         self.emit(Opcode.POP)
         self.compile(while_.body)
+        if variant != None:
+            assert while_.variant != None
+            self.emit_check(_make_decrease(variant, self.vars[slot]), while_.variant, 'variant', 'does not decrease')
         self.emit(Opcode.JMP, l0)
         self.backpatch(l1)
         self.emit(Opcode.POP)
@@ -180,17 +334,22 @@ class __Context:
 
     @compile.register
     def _(self, assert_: Assert):
+        if self.checks != None:
+            # the failure is attributed to the current proc like other checks
+            test = self.contract(assert_.expr)
+            assert test != None
+            self.emit_check(test, assert_, 'assertion', 'failed')
+            return
         self.compile(assert_.expr)
         self.emit(Opcode.ASSERT, len(self.strtab))
-        lineno = pyparsing.lineno(assert_.loc, assert_.src)
-        col = pyparsing.col(assert_.loc, assert_.src)
-        line = pyparsing.line(assert_.loc, assert_.src)
-        ptr = f'{" " * (col-1)}^'
-        self.strtab.append(f'{lineno}:{col}: error: assertion failed\n{line}\n{ptr}')
+        self.strtab.append(format_error(assert_.src, assert_.loc, 'assertion failed'))
 
     @compile.register
     def _(self, return_: Return):
         self.compile(return_.expr)
+        if self.checks != None:
+            assert self.current != None
+            self.emit_contract(self.current.post, 'postcondition')
         self.emit(Opcode.RET)
 
     @compile.register
@@ -200,10 +359,22 @@ class __Context:
         self.emit(Opcode.ENTER)
         for param in proc.params:
             self.allocate_variable(param.value)
+        if self.checks != None:
+            self.current = proc
+            self.emit_contract(proc.pre, 'precondition')
+            name = proc.name.value
+            if any(self.is_recursive(callee, name) for callee in self.callees[name]):
+                self.emit_variant(proc.variant, '#variant')
         self.compile(proc.body)
         self.prog[start] = Inst(Opcode.ENTER, len(self.vars))
 
     def compile_program(self, decls: list[Declaration]) -> tuple[dict[str, int], list[Inst], list[str]]:
+        if self.checks != None:
+            self.evaluator = Evaluator(decls)
+            self.decls = {decl.name.value: decl for decl in decls if isinstance(decl, Proc)}
+            self.callees = {name: {node.callee.value for node in walk(proc.body)
+                                   if isinstance(node, CallExpr) and node.callee.value in self.decls}
+                            for name, proc in self.decls.items()}
         for decl in decls:
             if isinstance(decl, Proc):
                 self.compile(decl)
@@ -211,6 +382,8 @@ class __Context:
         for i, callee in self.calls.items():
             assert self.prog[i].op == Opcode.CALL
             self.prog[i] = Inst(Opcode.CALL, self.procs[callee])
+        if self.optimize:
+            self.procs, self.prog = optimize(self.procs, self.prog)
         return self.procs, self.prog, self.strtab
 
     def backpatch(self, inst: int, to: Optional[int] = None):
@@ -218,6 +391,9 @@ class __Context:
             to = len(self.prog)
         self.prog[inst] = Inst(self.prog[inst].op, to)
 
-def compile_program(decls: list[Declaration]) -> tuple[dict[str, int], list[Inst], list[str]]:
-    ctx = __Context()
+def compile_program(decls: list[Declaration], checks: Optional[list[Check]] = None, variants: bool = True, smt_division: bool = False, optimize: bool = True) -> tuple[dict[str, int], list[Inst], list[str]]:
+    # contract checks are only emitted if a list to collect them is given,
+    # smt_division makes `/` and `%` agree with the verifier on negative divisors
+    # and optimize runs the peephole optimizer of hldpeephole on the code
+    ctx = __Context(checks, variants, smt_division, optimize)
     return ctx.compile_program(decls)
@@ -1,12 +1,26 @@
 #!/usr/bin/env python3
 
+import hashlib
+import itertools
+import json
+import multiprocessing
 import operator
+import os
+import random
+import re
+import time
 import z3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
 from enum import Enum
-from functools import cache, singledispatchmethod
-from typing import Union
+from collections import OrderedDict
+from functools import singledispatchmethod
+from typing import Callable, Hashable, Iterator, Optional, Union, get_args, get_origin
 
 from hldast import *
+from hldcompiler import ContractError, compile_program
+from hldeval import Evaluator
+from hldinterpreter import FlatVm
 from hldsemantic import ValueType
 
 _infix_arith_ops = {
@@ -23,27 +37,156 @@ _infix_rel_ops = {
 
 _ValRef = Union[z3.BoolRef, z3.ArithRef]
 
-def simplify(expr: _ValRef) -> _ValRef:
-    ret = z3.Tactic('ctx-solver-simplify').apply(expr).as_expr()
-    ret = z3.simplify(ret)
+def simplify(expr: _ValRef, full: bool = False) -> _ValRef:
+    # ctx-solver-simplify calls the solver on every subterm, which can take
+    # longer than verification itself
+    if full:
+        expr = z3.Tactic('ctx-solver-simplify').apply(expr).as_expr()
+    ret = z3.simplify(expr)
     assert isinstance(ret, (z3.BoolRef, z3.ArithRef))
     return ret
 
+def _size(expr: z3.ExprRef) -> int:
+    # number of distinct nodes of the term dag
+    seen = set()
+    search = [expr]
+    while len(search) > 0:
+        cur = search.pop()
+        if cur.get_id() in seen:
+            continue
+        seen.add(cur.get_id())
+        search.extend(cur.children())
+    return len(seen)
+
 class Correctness(Enum):
     PARTIAL = 'partial'
     TOTAL = 'total'
 
+@dataclass(frozen=True)
+class Options:
+    incremental: bool = True
+    incremental_timeout: int = 200
+    lazy_checks: bool = False
+    concrete_tests: int = 0
+    concrete_steps: int = 10000
+    emit_smt2: Optional[str] = None
+    # limits of each one-shot query, None for no limit
+    timeout: Optional[int] = None
+    rlimit: Optional[int] = None
+    # one-shot queries that time out are restarted with another random seed
+    # and twice the time, starting from restart_timeout, within timeout
+    restart_timeout: int = 1000
+    # tactics tried in turn on queries that end up unknown
+    retry: tuple[str, ...] = ()
+    # simplify reported formulas with ctx-solver-simplify instead of pruning
+    # implied conjuncts, unless they are larger than simplify_limit nodes
+    full_simplify: bool = False
+    simplify_limit: int = 500
+    term_cache_size: int = 4096
+    # how verification conditions are generated, one of vcgens
+    vcgen: str = 'wp'
+
+    def __post_init__(self):
+        if not self.vcgen in vcgens:
+            raise ValueError(f'unknown vcgen `{self.vcgen}`')
+        if self.lazy_checks and self.vcgen == 'ssa':
+            raise ValueError('lazy_checks only applies to the wp vcgen')
+
+# `wp` substitutes the value of each assignment into the postcondition, which
+# can double the condition at each if else in sequence. `ssa` puts bodies in
+# passive single assignment form instead, where the variables of both branches
+# of an if else are merged into shared terms, so conditions grow linearly with
+# the body
+vcgens = ['wp', 'ssa']
+
+def options_from_json(values: dict) -> Options:
+    # options sent by the clients of the servers, which must not take a
+    # server down when malformed
+    types = {field.name: field.type for field in fields(Options)}
+    values = dict(values)
+    for name, value in values.items():
+        if not name in types:
+            raise ValueError(f'unknown option `{name}`')
+        if get_origin(types[name]) == tuple:
+            if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+                raise ValueError(f'option `{name}` must be a list of strings')
+            values[name] = tuple(value)
+            continue
+        # Optional[T] is Union[T, None]
+        expected = get_args(types[name]) if get_origin(types[name]) == Union else (types[name],)
+        if not isinstance(value, expected) or isinstance(value, bool) and not bool in expected:
+            raise ValueError(f'option `{name}` must be of type {expected[0].__name__}')
+    for tactic in values.get('retry', ()):
+        if tactic not in z3.tactics():
+            raise ValueError(f'unknown tactic `{tactic}`')
+    return Options(**values)
+
+# the result of each kind of query that lets verification go on
+_expected_results = {
+    'satisfiable': 'sat',
+    'loop-exit': 'unsat',
+    'loop-body': 'unsat',
+    'precondition': 'unsat',
+}
+
+# what the solver failed to show when a query ends up unknown
+_query_descriptions = {
+    'loop-exit': 'invariant and guard negation imply postcondition',
+    'loop-body': 'invariant and guard imply while loop body precondition',
+    'precondition': 'precondition implies assertion found',
+}
+
+class UnknownResult(HLDError):
+    # the solver gave up, a larger timeout or resource limit may still prove
+    # the query, so these are never cached
+    pass
+
+class TermCache:
+    # z3 terms shared by all the procs of a context, so that e.g. the
+    # postcondition of a callee is translated once rather than at every call.
+    # The least recently used terms are dropped beyond maxsize
+    def __init__(self, maxsize: int):
+        self.terms: OrderedDict[Hashable, _ValRef] = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, translate: Callable[[], _ValRef]) -> _ValRef:
+        if key in self.terms:
+            self.hits += 1
+            self.terms.move_to_end(key)
+            return self.terms[key]
+        self.misses += 1
+        term = translate()
+        self.terms[key] = term
+        if len(self.terms) > self.maxsize:
+            self.terms.popitem(last=False)
+        return term
+
 class __Context:
     result = z3.Int('result')
 
-    def __init__(self, correctness: Correctness, symtab: dict[str, dict[str, ValueType]], call_graph: dict[str, set[str]]):
+    def __init__(self, correctness: Correctness, symtab: dict[str, dict[str, ValueType]], call_graph: dict[str, set[str]], options: Options):
         self.correctness = correctness
+        self.options = options
+        self.solver = z3.Solver()
+        self.model_solver = self.solver
         self.call_graph = call_graph
         self.symtab = symtab
         self.current: Declaration
         self.variables: dict[str, ValueType] = {}
         self.fns: dict[str, z3.FuncDeclRef] = {}
         self.procs: dict[str, Proc] = {}
+        # query records, only kept when asked for
+        self.stats: Optional[list[dict]] = None
+        self.terms = TermCache(options.term_cache_size)
+        self.recursive_calls: dict[tuple[str, str], bool] = {}
+        # the current term of each variable assigned in the passive form of a
+        # body, the fresh versions made so far and what is known to hold on
+        # the path to the current statement
+        self.versions: dict[str, _ValRef] = {}
+        self.fresh: list[_ValRef] = []
+        self.path: list[z3.BoolRef] = []
 
     def declare_fn_or_pred(self, fn_or_pred: Union[Fn, Pred]):
         name = fn_or_pred.name.value
@@ -60,26 +203,179 @@ class __Context:
         expr = self.expr_to_z3(fn_or_pred.expr)
         z3.RecAddDefinition(f, params, expr)
 
-    def _get_model(self, solver: z3.Solver) -> str:
-        model = solver.model()
-        assigns = (f'{sym} = {model[sym]}'
-                   for sym in model if sym.name() in self.variables) # type: ignore
+    def _check(self, formula: z3.BoolRef, node: ASTNode, kind: str) -> z3.CheckSatResult:
+        start = time.perf_counter()
+        res = self._solve(formula)
+        seconds = time.perf_counter() - start
+        if self.options.emit_smt2 != None:
+            self._emit_smt2(formula, node, kind, res, seconds)
+        if self.stats != None:
+            st = self.model_solver.statistics()
+            solver_stats = {key: st.get_key_value(key) for key in st.keys()}
+            self._record(kind, node, seconds, _size(formula), str(res), solver_stats)
+        # an unknown satisfiability check only means the check is skipped
+        if res == z3.unknown and kind != 'satisfiable':
+            reason = self.model_solver.reason_unknown()
+            if reason == 'canceled':
+                reason = 'resource limit exceeded'
+            msg = f'could not decide whether {_query_descriptions[kind]}: {reason}'
+            raise UnknownResult(format_error(node.src, node.loc, msg), node.loc, msg)
+        return res
+
+    def _record(self, kind: str, node: ASTNode, seconds: float, size: int, result: Optional[str], solver_stats: dict):
+        assert self.stats != None
+        self.stats.append({
+            'proc': self.current.name.value, 'kind': kind,
+            'line': node.src.lineno(node.loc), 'col': node.src.col(node.loc),
+            'seconds': round(seconds, 6), 'size': size, 'result': result, 'solver': solver_stats,
+        })
+
+    def _simplify(self, expr: _ValRef, node: ASTNode) -> _ValRef:
+        start = time.perf_counter()
+        size = _size(expr)
+        full = self.options.full_simplify and size <= self.options.simplify_limit
+        res = simplify(expr, full)
+        if not full and z3.is_bool(res):
+            res = self._prune_conjuncts(res)
+        if self.stats != None:
+            self._record('simplify', node, time.perf_counter() - start, size, None, {})
+        return res
+
+    def _prune_conjuncts(self, expr: z3.BoolRef) -> z3.BoolRef:
+        # drops the top level conjuncts implied by the others, one quick query
+        # each, which keeps most of what ctx-solver-simplify finds. All the
+        # queries share incremental_timeout, the conjuncts left once it runs
+        # out are kept
+        conjuncts = expr.children() if z3.is_and(expr) else [expr]
+        kept = []
+        deadline = time.perf_counter() + self.options.incremental_timeout / 1000
+        for i, conjunct in enumerate(conjuncts):
+            remaining = int((deadline - time.perf_counter()) * 1000)
+            if remaining <= 0:
+                kept.append(conjunct)
+                continue
+            # the simple solver skips the preprocessing, which dominates on
+            # these small queries
+            s = z3.SimpleSolver()
+            s.set(timeout=remaining)
+            s.add(*kept, *conjuncts[i + 1:], z3.Not(conjunct))
+            if s.check() != z3.unsat:
+                kept.append(conjunct)
+        if len(kept) == len(conjuncts):
+            return expr
+        res = z3.And(kept) if len(kept) > 1 else kept[0] if len(kept) == 1 else z3.BoolVal(True)
+        assert isinstance(res, z3.BoolRef)
+        return res
+
+    def _emit_smt2(self, formula: z3.BoolRef, node: ASTNode, kind: str, res: z3.CheckSatResult, seconds: float):
+        assert self.options.emit_smt2 != None
+        s = z3.Solver()
+        s.add(formula)
+        # z3 applies recursive functions as `((_ f 0) x)`, other solvers only
+        # understand `(f x)`
+        body = re.sub(r'\(_ ([^\s()]+) 0\)', r'\1', s.sexpr())
+        proc = self.current.name.value
+        lineno = node.src.lineno(node.loc)
+        col = node.src.col(node.loc)
+        text = f'; {kind} query of proc {proc} at {lineno}:{col}\n{body}(check-sat)\n'
+        filename = f'{proc}-{hashlib.sha256(text.encode()).hexdigest()[:16]}.smt2'
+        with open(os.path.join(self.options.emit_smt2, filename), 'w') as f:
+            f.write(text)
+        record = {
+            'file': filename, 'proc': proc, 'kind': kind, 'line': lineno, 'col': col,
+            'expected': _expected_results[kind], 'result': str(res), 'seconds': round(seconds, 6),
+        }
+        # a single short append per query, so that workers can share the manifest
+        with open(os.path.join(self.options.emit_smt2, 'manifest.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _solve(self, formula: z3.BoolRef) -> z3.CheckSatResult:
+        if self.options.incremental:
+            # queries are guarded by fresh literals instead of being popped, so that
+            # lemmas learned while proving one obligation are kept for the next ones
+            guard = z3.FreshBool('q')
+            self.solver.add(z3.Implies(guard, formula))
+            # the incremental attempt stays within the limits of a one-shot query
+            timeout = self.options.incremental_timeout
+            if self.options.timeout != None:
+                timeout = min(timeout, self.options.timeout)
+            self.solver.set(timeout=timeout)
+            if self.options.rlimit != None:
+                self.solver.set(rlimit=self.options.rlimit)
+            res = self.solver.check(guard)
+            if res != z3.unknown:
+                self.model_solver = self.solver
+                return res
+        # the incremental core gives up on some nonlinear queries that the
+        # preprocessing of a one-shot solver dispatches immediately
+        res = self._solve_restarting(formula)
+        for tactic in self.options.retry:
+            if res != z3.unknown:
+                break
+            res = self._solve_with(z3.Tactic(tactic).solver(), formula)
+        return res
+
+    def _solve_restarting(self, formula: z3.BoolRef) -> z3.CheckSatResult:
+        # the time z3 takes on nonlinear queries varies wildly with the random
+        # seed and with the ids of the terms alive, a query stuck for minutes
+        # is often proved at once after a restart
+        budget = self.options.timeout
+        timeout = self.options.restart_timeout
+        seed = 0
+        while True:
+            s = z3.Solver()
+            s.set(random_seed=seed)
+            last = budget != None and budget <= timeout
+            res = self._solve_with(s, formula, budget if last else timeout)
+            if res != z3.unknown or last or s.reason_unknown() != 'timeout':
+                return res
+            if budget != None:
+                budget -= timeout
+            seed += 1
+            timeout *= 2
+
+    def _solve_with(self, s: z3.Solver, formula: z3.BoolRef, timeout: Optional[int] = None) -> z3.CheckSatResult:
+        if timeout == None:
+            timeout = self.options.timeout
+        if timeout != None:
+            s.set(timeout=timeout)
+        if self.options.rlimit != None:
+            s.set(rlimit=self.options.rlimit)
+        s.add(formula)
+        self.model_solver = s
+        return s.check()
+
+    def _get_model(self, versions: Optional[dict[str, _ValRef]] = None) -> str:
+        model = self.model_solver.model()
+        assigns = [f'{sym} = {model[sym]}'
+                   for sym in model if sym.name() in self.variables] # type: ignore
+        # the variables that only appear as their fresh versions in the
+        # passive form
+        for name, version in (versions or {}).items():
+            if any(version.eq(fresh) for fresh in self.fresh):
+                assigns.append(f'{name} = {model.eval(version, True)}')
         return f'[{", ".join(assigns)}]'
 
+    def expr_to_z3(self, expr: Expr) -> _ValRef:
+        # the translation only depends on the shape of expr, which its repr
+        # gives without source locations, and on the types of its variables
+        types = frozenset((node.value, self.variables.get(node.value))
+                          for node in walk(expr) if isinstance(node, Identifier))
+        return self.terms.get((repr(expr), types), lambda: self._expr_to_z3(expr))
+
     @singledispatchmethod
-    @cache
-    def expr_to_z3(self, _: Expr) -> _ValRef:
+    def _expr_to_z3(self, _: Expr) -> _ValRef:
         raise NotImplementedError
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: BoolLiteral) -> z3.BoolRef:
         return z3.BoolVal(expr.value)
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: IntLiteral) -> z3.IntNumRef:
         return z3.IntVal(expr.value)
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: Identifier) -> _ValRef:
         value = expr.value
         type = self.variables[value]
@@ -89,9 +385,9 @@ class __Context:
             assert type == ValueType.Bool
             return z3.Bool(value)
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, pref: PrefixArithmeticExpr) -> z3.ArithRef:
-        expr = self.expr_to_z3(pref.expr)
+        expr = self._expr_to_z3(pref.expr)
         assert isinstance(expr, z3.ArithRef)
         if pref.op == '+':
             return +expr
@@ -99,75 +395,75 @@ class __Context:
             assert pref.op == '-'
             return -expr
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, pref: PrefixLogicalExpr) -> z3.BoolRef:
-        expr = self.expr_to_z3(pref.expr)
+        expr = self._expr_to_z3(pref.expr)
         assert isinstance(expr, z3.BoolRef)
         assert pref.op == '!'
         res = z3.Not(expr)
         assert isinstance(res, z3.BoolRef)
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: InfixArithmeticExpr) -> z3.ArithRef:
-        left = self.expr_to_z3(expr.left)
+        left = self._expr_to_z3(expr.left)
         assert isinstance(left, z3.ArithRef)
-        right = self.expr_to_z3(expr.right)
+        right = self._expr_to_z3(expr.right)
         assert isinstance(right, z3.ArithRef)
         res = _infix_arith_ops[expr.op](left, right)
         assert isinstance(res, z3.ArithRef)
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: InfixLogicalExpr) -> z3.BoolRef:
-        left = self.expr_to_z3(expr.left)
+        left = self._expr_to_z3(expr.left)
         assert isinstance(left, z3.BoolRef)
-        right = self.expr_to_z3(expr.right)
+        right = self._expr_to_z3(expr.right)
         assert isinstance(right, z3.BoolRef)
         res = _infix_logical_ops[expr.op](left, right)
         assert isinstance(res, z3.BoolRef)
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: InfixRelationalExpr) -> z3.BoolRef:
-        left = self.expr_to_z3(expr.left)
+        left = self._expr_to_z3(expr.left)
         assert isinstance(left, z3.ArithRef)
-        right = self.expr_to_z3(expr.right)
+        right = self._expr_to_z3(expr.right)
         assert isinstance(right, z3.ArithRef)
         res = _infix_rel_ops[expr.op](left, right)
         assert isinstance(res, z3.BoolRef)
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, expr: TernaryExpr) -> _ValRef:
-        cond = self.expr_to_z3(expr.cond)
-        then_expr = self.expr_to_z3(expr.then_expr)
-        else_expr = self.expr_to_z3(expr.else_expr)
+        cond = self._expr_to_z3(expr.cond)
+        then_expr = self._expr_to_z3(expr.then_expr)
+        else_expr = self._expr_to_z3(expr.else_expr)
         res = z3.If(cond, then_expr, else_expr)
         assert isinstance(res, (z3.BoolRef, z3.ArithRef))
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, call: CallExpr) -> _ValRef:
         name = call.callee.value
-        args = (self.expr_to_z3(arg) for arg in call.args)
+        args = (self._expr_to_z3(arg) for arg in call.args)
         f = self.fns[name]
         res = f(*args)
         assert isinstance(res, (z3.BoolRef, z3.ArithRef))
         return res
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, _: ResultExpr) -> z3.ArithRef:
         return self.result
 
-    @expr_to_z3.register
+    @_expr_to_z3.register
     def _(self, quantified: QuantifiedExpr) -> z3.BoolRef:
         cur = self.variables.copy()
         vars = [z3.Int(var.value) for var in quantified.bindings]
         for var in quantified.bindings:
             self.variables[var.value] = ValueType.Int
         quantifier = z3.ForAll if quantified.quantifier == 'forall' else z3.Exists
-        e = quantifier(vars, self.expr_to_z3(quantified.expr))
+        e = quantifier(vars, self._expr_to_z3(quantified.expr))
         self.variables = cur
         return e
 
@@ -201,26 +497,39 @@ class __Context:
         assert isinstance(res, z3.BoolRef)
         return res
 
-    @cache
     def call_is_recursive(self, callee: str, caller: str) -> bool:
+        if (callee, caller) in self.recursive_calls:
+            return self.recursive_calls[callee, caller]
         call_graph = self.call_graph
         visited = set()
         search_set = {callee}
+        res = False
         while len(search_set) > 0:
             cur = search_set.pop()
             if cur == caller:
-                return True
+                res = True
+                break
             visited.add(cur)
             search_set.update(c for c in call_graph[cur] if c not in visited)
-        return False
+        self.recursive_calls[callee, caller] = res
+        return res
 
     def _assignment_call(self, assignment: Assignment, post: z3.BoolRef) -> z3.BoolRef:
         call = assignment.value
         assert isinstance(call, CallExpr)
         dest = self.expr_to_z3(assignment.dest)
+        requires, ensures = self._call_contract(call, dest, self.expr_to_z3)
+        res = z3.And(requires, z3.ForAll(dest, z3.Implies(ensures, post)))
+        assert isinstance(res, z3.BoolRef)
+        return res
+
+    def _call_contract(self, call: CallExpr, dest: _ValRef, translate: Callable[[Expr], _ValRef]) -> tuple[z3.BoolRef, z3.BoolRef]:
+        # what the caller has to establish before the call and what it gets to
+        # assume about dest after it, with the expressions of the caller
+        # translated by translate
         callee = call.callee.value
         proc = self.procs[callee]
-        args = map(self.expr_to_z3, call.args)
+        args = map(translate, call.args)
         params = map(self.expr_to_z3, proc.params)
         subs = [*zip(params, args)]
         assert isinstance(self.current, Proc)
@@ -230,7 +539,7 @@ class __Context:
                 self.current.error('missing variant expression')
             if proc.variant == None:
                 proc.error('missing variant expression')
-            cur_variant = self.expr_to_z3(self.current.variant)
+            cur_variant = translate(self.current.variant)
             callee_variant = self.expr_to_z3(proc.variant)
             callee_variant = z3.substitute(callee_variant, subs)
             assert isinstance(callee_variant, z3.ArithRef)
@@ -246,9 +555,9 @@ class __Context:
             proc.error('missing postcondition')
         proc_post = self.expr_to_z3(proc.post)
         proc_post = z3.substitute(proc_post, *subs, (self.result, dest))
-        res = z3.And(proc_pre, variant_cond, z3.ForAll(dest, z3.Implies(proc_post, post)))
-        assert isinstance(res, z3.BoolRef)
-        return res
+        requires = z3.And(proc_pre, variant_cond)
+        assert isinstance(requires, z3.BoolRef) and isinstance(proc_post, z3.BoolRef)
+        return requires, proc_post
 
     @propagate.register
     def _(self, ifelse: IfElse, post: z3.BoolRef) -> z3.BoolRef:
@@ -261,15 +570,46 @@ class __Context:
 
     @propagate.register
     def _(self, block: Block, post: z3.BoolRef) -> z3.BoolRef:
+        if self.options.lazy_checks:
+            return self._propagate_lazy(block, post)
         assertion = post
         for statement in reversed(block.statements):
             assertion = self.propagate(statement, assertion)
-            s = z3.Solver()
-            s.add(assertion)
-            if s.check() == z3.unsat:
+            if self._check(assertion, statement, 'satisfiable') == z3.unsat:
                 statement.error(f'precondition `{assertion}` found is unsatisfiable')
         return assertion
 
+    def _propagate_lazy(self, block: Block, post: z3.BoolRef) -> z3.BoolRef:
+        # plain assignments and asserts keep an unsatisfiable assertion
+        # unsatisfiable, so only the assertions found before any other statement
+        # and at the start of the block need to be checked
+        assertion = post
+        pending: list[tuple[Statement, z3.BoolRef]] = []
+        for statement in reversed(block.statements):
+            keeps_unsat = isinstance(statement, Assert) or\
+                isinstance(statement, Assignment) and not isinstance(statement.value, CallExpr)
+            if not keeps_unsat:
+                self._check_pending(pending)
+                pending = []
+            assertion = self.propagate(statement, assertion)
+            pending.append((statement, assertion))
+        self._check_pending(pending)
+        return assertion
+
+    def _check_pending(self, pending: list[tuple[Statement, z3.BoolRef]]):
+        if len(pending) == 0 or self._check(pending[-1][1], pending[-1][0], 'satisfiable') != z3.unsat:
+            return
+        # unsatisfiable assertions form a suffix of pending, find where it starts
+        lo, hi = 0, len(pending) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._check(pending[mid][1], pending[mid][0], 'satisfiable') == z3.unsat:
+                hi = mid
+            else:
+                lo = mid + 1
+        statement, assertion = pending[lo]
+        statement.error(f'precondition `{assertion}` found is unsatisfiable')
+
     @propagate.register
     def _(self, while_: While, post: z3.BoolRef) -> z3.BoolRef:
         if self.correctness == Correctness.PARTIAL:
@@ -305,19 +645,15 @@ class __Context:
             invariant = z3.And(invariant, self.expr_to_z3(self.current.pre))
         assert isinstance(invariant, z3.BoolRef)
         cond = self.expr_to_z3(while_.cond)
-        s = z3.Solver()
         # (invariant && !cond) -> post
-        s.add(z3.And(invariant, z3.Not(cond), z3.Not(post)))
-        if s.check() != z3.unsat:
-            supplementary = f'\tpost: {simplify(post)}'
-            while_.body.error(f'invariant and guard negation do not imply post condition.\n{supplementary}\ncounter-example: {self._get_model(s)}')
+        if self._check(z3.And(invariant, z3.Not(cond), z3.Not(post)), while_, 'loop-exit') != z3.unsat:
+            supplementary = f'\tpost: {self._simplify(post, while_)}'
+            while_.body.error(f'invariant and guard negation do not imply post condition.\n{supplementary}\ncounter-example: {self._get_model()}')
         body_pre = self.propagate(while_.body, invariant)
-        s.reset()
         # (invariant && cond) -> body_pre
-        s.add(z3.And(invariant, cond, z3.Not(body_pre)))
-        if s.check() != z3.unsat:
-            supplementary = f'\tbody pre: {simplify(body_pre)}'
-            while_.body.error(f'invariant and guard do not imply while loop body precondition.\n{supplementary}\ncounter-example: {self._get_model(s)}')
+        if self._check(z3.And(invariant, cond, z3.Not(body_pre)), while_, 'loop-body') != z3.unsat:
+            supplementary = f'\tbody pre: {self._simplify(body_pre, while_)}'
+            while_.body.error(f'invariant and guard do not imply while loop body precondition.\n{supplementary}\ncounter-example: {self._get_model()}')
         return invariant
 
     def _total_while(self, while_: While, post: z3.BoolRef) -> z3.BoolRef:
@@ -335,23 +671,246 @@ class __Context:
         cond = self.expr_to_z3(while_.cond)
         pre = z3.And(invariant, 0 <= variant)
         assert isinstance(pre, z3.BoolRef)
-        s = z3.Solver()
         # (invariant && !cond) -> post
-        s.add(z3.And(invariant, z3.Not(cond), z3.Not(post)))
-        if s.check() != z3.unsat:
-            supplementary = f'\tpost: {simplify(post)}'
-            while_.body.error(f'invariant and guard negation do not imply postcondition.\n{supplementary}\ncounter-example: {self._get_model(s)}')
+        if self._check(z3.And(invariant, z3.Not(cond), z3.Not(post)), while_, 'loop-exit') != z3.unsat:
+            supplementary = f'\tpost: {self._simplify(post, while_)}'
+            while_.body.error(f'invariant and guard negation do not imply postcondition.\n{supplementary}\ncounter-example: {self._get_model()}')
         upper = z3.FreshInt('e')
         body_post = z3.And(pre, variant < upper)
         body_pre = self.propagate(while_.body, body_post)
-        s.reset()
         # (invariant && cond && 0 <= variant = upper) -> body_pre
-        s.add(z3.And(pre, cond, variant == upper, z3.Not(body_pre)))
-        if s.check() != z3.unsat:
-            supplementary = f'\tbody pre: {simplify(body_pre)}'
-            while_.body.error(f'invariant and guard and variant do not imply while body precondition.\n{supplementary}\ncounter-example: {self._get_model(s)}')
+        if self._check(z3.And(pre, cond, variant == upper, z3.Not(body_pre)), while_, 'loop-body') != z3.unsat:
+            supplementary = f'\tbody pre: {self._simplify(body_pre, while_)}'
+            while_.body.error(f'invariant and guard and variant do not imply while body precondition.\n{supplementary}\ncounter-example: {self._get_model()}')
         return pre
 
+    def _variable(self, name: str) -> _ValRef:
+        if self.variables[name] == ValueType.Int:
+            return z3.Int(name)
+        else:
+            assert self.variables[name] == ValueType.Bool
+            return z3.Bool(name)
+
+    def _versioned(self, term: _ValRef) -> _ValRef:
+        # term in the current state of the passive form
+        subs = [(self._variable(name), version) for name, version in self.versions.items()]
+        if len(subs) == 0:
+            return term
+        res = z3.substitute(term, *subs)
+        assert isinstance(res, (z3.BoolRef, z3.ArithRef))
+        return res
+
+    def _passive_expr(self, expr: Expr) -> _ValRef:
+        return self._versioned(self.expr_to_z3(expr))
+
+    def _fresh_version(self, name: str) -> _ValRef:
+        if self.variables[name] == ValueType.Int:
+            version = z3.FreshInt(name)
+        else:
+            version = z3.FreshBool(name)
+        self.fresh.append(version)
+        return version
+
+    # the passive form of a statement is a list of commands, which are
+    # ('assume', cond), ('assert', cond), ('return', cond),
+    # ('choice', ifelse, cond, then_commands, else_commands, versions) and
+    # ('loop', while_, entry, exit, body_commands, body_hypothesis, body_post, path, versions),
+    # where versions are those of the variables where the branches or the
+    # loop body start.
+    # Assignments bind variables to the terms of their values rather than
+    # substituting them into the postcondition, and after an if else each
+    # variable its branches disagree on is joined into a single `If` term, so
+    # the rest of the body is stated once for both branches. Only call results
+    # and the variables a loop assigns get fresh versions, as the solver stops
+    # unfolding recursive fns on fresh versions joined by equations
+    @singledispatchmethod
+    def passivize(self, _: Statement) -> list[tuple]:
+        raise NotImplementedError
+
+    @passivize.register
+    def _(self, assignment: Assignment) -> list[tuple]:
+        name = assignment.dest.value
+        value = assignment.value
+        if isinstance(value, CallExpr):
+            version = self._fresh_version(name)
+            requires, ensures = self._call_contract(value, version, self._passive_expr)
+            self.versions[name] = version
+            self.path += [requires, ensures]
+            return [('assert', requires), ('assume', ensures)]
+        commands = []
+        if isinstance(value, InfixArithmeticExpr) and value.op in { '/', '%' }:
+            nonzero = self._passive_expr(value.right) != 0
+            self.path.append(nonzero)
+            commands.append(('assert', nonzero))
+        self.versions[name] = self._passive_expr(value)
+        return commands
+
+    @passivize.register
+    def _(self, ifelse: IfElse) -> list[tuple]:
+        cond = self._passive_expr(ifelse.cond)
+        assert isinstance(cond, z3.BoolRef)
+        versions = self.versions
+        path = self.path
+        self.versions = versions.copy()
+        self.path = path + [cond]
+        then_commands = self.passivize(ifelse.then_block)
+        then_versions = self.versions
+        self.versions = versions.copy()
+        self.path = path + [z3.Not(cond)]
+        else_commands = self.passivize(ifelse.else_block)
+        else_versions = self.versions
+        self.path = path
+        for name in sorted(then_versions.keys() | else_versions.keys()):
+            then_version = then_versions.get(name, self._variable(name))
+            else_version = else_versions.get(name, self._variable(name))
+            if then_version.eq(else_version):
+                self.versions[name] = then_version
+            else:
+                self.versions[name] = z3.If(cond, then_version, else_version)
+        return [('choice', ifelse, cond, then_commands, else_commands, versions.copy())]
+
+    @passivize.register
+    def _(self, block: Block) -> list[tuple]:
+        commands = []
+        for statement in block.statements:
+            commands.extend(self.passivize(statement))
+        return commands
+
+    @passivize.register
+    def _(self, while_: While) -> list[tuple]:
+        if while_.invariant == None:
+            while_.error('missing invariant condition')
+        invariant = self.expr_to_z3(while_.invariant)
+        assert isinstance(self.current, Proc)
+        if self.current.pre != None:
+            invariant = z3.And(invariant, self.expr_to_z3(self.current.pre))
+        cond = self.expr_to_z3(while_.cond)
+        if self.correctness == Correctness.PARTIAL:
+            entry = invariant
+            body_hypothesis = z3.And(invariant, cond)
+            body_post = invariant
+        else:
+            assert self.correctness == Correctness.TOTAL
+            if while_.variant == None:
+                while_.error('missing variant expression')
+            variant = self.expr_to_z3(while_.variant)
+            assert isinstance(variant, z3.ArithRef)
+            entry = z3.And(invariant, 0 <= variant)
+            upper = z3.FreshInt('e')
+            body_hypothesis = z3.And(entry, cond, variant == upper)
+            body_post = z3.And(entry, variant < upper)
+        # the loop is a cut point: the variables it assigns get fresh versions
+        # constrained by the invariant, in the body as well as after the loop.
+        # The loop is only checked where the path to it holds
+        entry = self._versioned(entry)
+        path = z3.And(self.path) if len(self.path) > 0 else z3.BoolVal(True)
+        assigned = {node.dest.value for node in walk(while_.body) if isinstance(node, Assignment)}
+        for name in sorted(assigned):
+            self.versions[name] = self._fresh_version(name)
+        body_hypothesis = self._versioned(body_hypothesis)
+        exit = self._versioned(z3.And(invariant, z3.Not(cond)))
+        versions = self.versions
+        outer_path = self.path
+        self.versions = versions.copy()
+        self.path = outer_path + [body_hypothesis]
+        body_commands = self.passivize(while_.body)
+        body_post = self._versioned(body_post)
+        self.versions = versions
+        self.path = outer_path + [exit]
+        return [('loop', while_, entry, exit, body_commands, body_hypothesis, body_post, path, versions.copy())]
+
+    @passivize.register
+    def _(self, assert_: Assert) -> list[tuple]:
+        assertion = self._passive_expr(assert_.expr)
+        self.path.append(assertion)
+        return [('assert', assertion)]
+
+    @passivize.register
+    def _(self, return_: Return) -> list[tuple]:
+        proc = self.current
+        assert isinstance(proc, Proc)
+        post = self._passive_expr(proc.post)
+        expr = self._passive_expr(return_.expr)
+        res = z3.substitute(post, (self.result, expr))
+        return [('return', res)]
+
+    def passive_pre(self, commands: list[tuple], post: z3.BoolRef) -> z3.BoolRef:
+        # the precondition of passive commands, in which the fresh versions are
+        # free. Both branches of an if else share the term of its postcondition
+        assertion = post
+        for command in reversed(commands):
+            kind = command[0]
+            if kind == 'assume':
+                assertion = z3.Implies(command[1], assertion)
+            elif kind == 'assert':
+                assertion = z3.And(command[1], assertion)
+            elif kind == 'return':
+                assertion = command[1]
+            elif kind == 'choice':
+                # like with wp, the precondition of each branch must be
+                # satisfiable regardless of the condition leading to it, with
+                # the joined terms taking the values of that branch
+                _, ifelse, cond, then_commands, else_commands, versions = command
+                then_pre = self.passive_pre(then_commands, assertion)
+                then_assuming = _assuming(then_pre, cond, True)
+                self._check_passive(then_assuming, _first_statement(ifelse.then_block), versions)
+                else_pre = self.passive_pre(else_commands, assertion)
+                else_assuming = _assuming(else_pre, cond, False)
+                self._check_passive(else_assuming, _first_statement(ifelse.else_block), versions)
+                # the branches keep sharing the term of the postcondition, it
+                # is only split between them when reported
+                assertion = z3.And(z3.Implies(cond, then_pre), z3.Implies(z3.Not(cond), else_pre))
+                self._check_passive(assertion, ifelse, versions, z3.If(cond, then_assuming, else_assuming))
+            else:
+                assert kind == 'loop'
+                assertion = self._passive_loop(command, assertion)
+        assert isinstance(assertion, z3.BoolRef)
+        return assertion
+
+    def _passive_loop(self, command: tuple, post: z3.BoolRef) -> z3.BoolRef:
+        _, while_, entry, exit, body_commands, body_hypothesis, body_post, path, versions = command
+        partial = self.correctness == Correctness.PARTIAL
+        # (invariant && !cond) -> post
+        if self._check(z3.And(path, exit, z3.Not(post)), while_, 'loop-exit') != z3.unsat:
+            supplementary = f'\tpost: {self._simplify(self._named(post, versions), while_)}'
+            postcondition = 'post condition' if partial else 'postcondition'
+            while_.body.error(f'invariant and guard negation do not imply {postcondition}.\n{supplementary}\ncounter-example: {self._get_model(versions)}')
+        body_pre = self.passive_pre(body_commands, body_post)
+        self._check_passive(body_pre, _first_statement(while_.body), versions)
+        # (invariant && cond) -> body_pre, and 0 <= variant = upper when total
+        if self._check(z3.And(path, body_hypothesis, z3.Not(body_pre)), while_, 'loop-body') != z3.unsat:
+            supplementary = f'\tbody pre: {self._simplify(self._named(body_pre, versions), while_)}'
+            if partial:
+                msg = 'invariant and guard do not imply while loop body precondition'
+            else:
+                msg = 'invariant and guard and variant do not imply while body precondition'
+            while_.body.error(f'{msg}.\n{supplementary}\ncounter-example: {self._get_model(versions)}')
+        return entry
+
+    def _check_passive(self, assertion: z3.BoolRef, node: ASTNode, versions: dict[str, _ValRef], shown: Optional[z3.BoolRef] = None):
+        # passive preconditions are only checked at the start of branches,
+        # loop bodies and procs. A free version only makes an assertion easier
+        # to satisfy, so there is no need to quantify over them here
+        if self._check(assertion, node, 'satisfiable') == z3.unsat:
+            shown = self._named(assertion if shown == None else shown, versions)
+            node.error(f'precondition `{shown}` found is unsatisfiable')
+
+    def _named(self, term: z3.BoolRef, versions: dict[str, _ValRef]) -> z3.BoolRef:
+        # term stated over the variables whose versions it mentions, as wp
+        # states it. Values are named before the fresh versions they contain,
+        # constants and plain variables are left alone
+        subs = []
+        for name, version in versions.items():
+            if z3.is_int_value(version) or z3.is_true(version) or z3.is_false(version):
+                continue
+            if z3.is_const(version) and version.decl().name() in self.variables:
+                continue
+            subs.append((version, self._variable(name)))
+        subs.sort(key=lambda sub: z3.is_const(sub[0]))
+        for sub in subs:
+            term = z3.substitute(term, sub)
+        return term
+
     def declare_proc(self, decl):
         self.procs[decl.name.value] = decl
 
@@ -361,6 +920,17 @@ class __Context:
         return any(self.call_is_recursive(callee, caller) for callee in callees)
 
     def verify(self, proc: Proc) -> z3.BoolRef:
+        hits, misses = self.terms.hits, self.terms.misses
+        self.solver.push()
+        try:
+            return self._verify(proc)
+        finally:
+            self.solver.pop()
+            if self.stats != None:
+                self.stats.append({'proc': proc.name.value, 'kind': 'terms',
+                                   'hits': self.terms.hits - hits, 'misses': self.terms.misses - misses})
+
+    def _verify(self, proc: Proc) -> z3.BoolRef:
         name = proc.name.value
         self.procs[name] = proc
         self.current = proc
@@ -368,7 +938,10 @@ class __Context:
         if proc.post == None:
             proc.error('missing postcondition')
         post = self.expr_to_z3(proc.post)
-        assertion = self.propagate(proc.body, post)
+        if self.options.vcgen == 'ssa':
+            assertion = self._passive_body(proc)
+        else:
+            assertion = self.propagate(proc.body, post)
         if self.correctness == Correctness.TOTAL and self.is_recursive(proc):
             if proc.variant == None:
                 proc.error('missing variant expression')
@@ -377,18 +950,55 @@ class __Context:
             assertion = z3.And(assertion, 0 <= variant)
             assert isinstance(assertion, z3.BoolRef)
         if proc.pre != None:
-            s = z3.Solver()
             pre = self.expr_to_z3(proc.pre)
-            s.add(z3.Not(z3.Implies(pre, assertion)))
-            if s.check() != z3.unsat:
-                proc.pre.error(f'precondition {pre} does not imply assertion found {simplify(assertion)}')
-        assertion = simplify(assertion)
+            if self._check(z3.Not(z3.Implies(pre, assertion)), proc.pre, 'precondition') != z3.unsat:
+                proc.pre.error(f'precondition {pre} does not imply assertion found {self._simplify(assertion, proc.pre)}')
+        if self.options.vcgen == 'ssa' and len(self.fresh) > 0:
+            # the versions stand for any value their assumptions allow, those
+            # given by an equality are substituted back for the report
+            assertion = z3.Tactic('qe-light').apply(z3.ForAll(self.fresh, assertion)).as_expr()
+        assertion = self._simplify(assertion, proc)
         assert isinstance(assertion, z3.BoolRef)
         return assertion
 
-def get_pre(decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]]) -> dict[str, z3.BoolRef]:
-    ctx = __Context(correctness, symtab, callees)
-    pres = {}
+    def _passive_body(self, proc: Proc) -> z3.BoolRef:
+        self.versions = {}
+        self.fresh = []
+        self.path = []
+        commands = self.passivize(proc.body)
+        post = self._passive_expr(proc.post)
+        assertion = self.passive_pre(commands, post)
+        self._check_passive(assertion, _first_statement(proc.body), {})
+        return assertion
+
+def _assuming(assertion: z3.BoolRef, cond: z3.BoolRef, value: bool) -> z3.BoolRef:
+    # assertion in a branch, where the terms joined on cond take its values
+    terms: dict[int, z3.ExprRef] = {}
+    def visit(term: z3.ExprRef) -> z3.ExprRef:
+        if term.get_id() in terms:
+            return terms[term.get_id()]
+        if term.eq(cond):
+            res = z3.BoolVal(value)
+        elif z3.is_app_of(term, z3.Z3_OP_ITE) and term.arg(0).eq(cond):
+            res = visit(term.arg(1 if value else 2))
+        elif z3.is_app(term) and term.num_args() > 0:
+            res = term.decl()(*[visit(child) for child in term.children()])
+        else:
+            res = term
+        terms[term.get_id()] = res
+        return res
+    res = visit(assertion)
+    assert isinstance(res, z3.BoolRef)
+    return res
+
+def _first_statement(statement: Statement) -> Statement:
+    # where checks of the passive form of a block are reported
+    if isinstance(statement, Block) and len(statement.statements) > 0:
+        return statement.statements[0]
+    return statement
+
+def _make_context(decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]], options: Options) -> __Context:
+    ctx = __Context(correctness, symtab, callees, options)
     for decl in decls:
         if isinstance(decl, Proc):
             ctx.declare_proc(decl)
@@ -398,9 +1008,272 @@ def get_pre(decls: list[Declaration], correctness: Correctness, symtab: dict[str
     for decl in decls:
         if isinstance(decl, (Pred, Fn)):
             ctx.define_fn_or_pred(decl)
-    for decl in decls:
-        if isinstance(decl, Proc):
-            pres[decl.name.value] = ctx.verify(decl)
+    return ctx
+
+_CACHE_VERSION = 1
+
+class VerificationCache:
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+            path = os.path.join(cache_home, 'hld')
+        self.path = path
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f'{key[2:]}.json')
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, entry: dict):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def key(self, proc: Proc, decls: dict[str, Declaration], call_graph: dict[str, set[str]], correctness: Correctness, options: Options) -> str:
+        h = hashlib.sha256()
+        def add(*parts):
+            for part in parts:
+                h.update(repr(part).encode())
+                h.update(b'\0')
+        add(_CACHE_VERSION, z3.get_version_string(), correctness.value, options)
+        # the body layout is hashed as well, cached errors are replayed by offset
+        add(proc, [node.loc - proc.loc for node in walk(proc)])
+        name = proc.name.value
+        reachable = {name}
+        search = [name]
+        while len(search) > 0:
+            for callee in call_graph[search.pop()]:
+                if callee not in reachable:
+                    reachable.add(callee)
+                    search.append(callee)
+        for caller in sorted(reachable):
+            add(caller, sorted(call_graph[caller]))
+        contracts: list[ASTNode] = [proc]
+        for callee_name in sorted(call_graph[name]):
+            callee = decls[callee_name]
+            assert isinstance(callee, Proc)
+            add(callee.name, callee.params, callee.pre, callee.post, callee.variant)
+            contracts.extend(e for e in (callee.pre, callee.post, callee.variant) if e != None)
+        fns = set()
+        while len(contracts) > 0:
+            for node in walk(contracts.pop()):
+                if isinstance(node, CallExpr) and node.callee.value not in fns:
+                    decl = decls[node.callee.value]
+                    if isinstance(decl, (Fn, Pred)):
+                        fns.add(node.callee.value)
+                        contracts.append(decl)
+        for fn in sorted(fns):
+            add(decls[fn])
+        return h.hexdigest()
+
+class MemoryCache(VerificationCache):
+    # entries only live as long as the process, for servers run without a
+    # cache directory
+    def __init__(self):
+        self.entries: dict[str, dict] = {}
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.entries.get(key)
+
+    def put(self, key: str, entry: dict):
+        self.entries[key] = entry
+
+def _error_entry(err: HLDError, decls: list[Declaration]) -> Optional[dict]:
+    if err.loc == None:
+        return None
+    loc = err.loc
+    decl = max((decl for decl in decls if decl.loc <= loc), key=lambda decl: decl.loc)
+    assert isinstance(decl, (Fn, Pred, Proc))
+    return {'error': {'decl': decl.name.value, 'offset': loc - decl.loc, 'msg': err.msg}}
+
+def _load_entry(entry: dict, decls: list[Declaration]) -> z3.BoolRef:
+    if 'error' in entry:
+        err = entry['error']
+        decl, = (decl for decl in decls if isinstance(decl, (Fn, Pred, Proc)) and decl.name.value == err['decl'])
+        loc = decl.loc + err['offset']
+        raise HLDError(format_error(decl.src, loc, err['msg']), loc, err['msg'])
+    pre = z3.deserialize(entry['pre'])
+    assert isinstance(pre, z3.BoolRef)
+    return pre
+
+_worker_ctx: __Context
+
+def _init_worker(decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]], options: Options, stats: bool):
+    global _worker_ctx
+    _worker_ctx = _make_context(decls, correctness, symtab, callees, options)
+    if stats:
+        _worker_ctx.stats = []
+
+def _verify_in_worker(name: str) -> tuple[Union[str, HLDError], list[dict]]:
+    # z3 terms cannot be pickled, ship them back as smt2 text
+    try:
+        pre = _worker_ctx.verify(_worker_ctx.procs[name]).serialize()
+    except HLDError as e:
+        pre = e
+    # the records of a failed proc are shipped back too, not left to the next
+    records = []
+    if _worker_ctx.stats != None:
+        records, _worker_ctx.stats = _worker_ctx.stats, []
+    return pre, records
+
+# the verifiers yield the precondition of each proc in turn, or its error so
+# that the next procs may still be verified
+
+def _verify_parallel(procs: list[Proc], decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]], options: Options, jobs: int, stats: Optional[list[dict]]) -> Iterator[Union[z3.BoolRef, HLDError]]:
+    mp_ctx = multiprocessing.get_context('spawn')
+    initargs = (decls, correctness, symtab, callees, options, stats != None)
+    with ProcessPoolExecutor(jobs, mp_ctx, _init_worker, initargs) as executor:
+        futures = [executor.submit(_verify_in_worker, proc.name.value) for proc in procs]
+        try:
+            for future in futures:
+                serialized, records = future.result()
+                if stats != None:
+                    stats.extend(records)
+                if isinstance(serialized, HLDError):
+                    yield serialized
+                    continue
+                pre = z3.deserialize(serialized)
+                assert isinstance(pre, z3.BoolRef)
+                yield pre
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+def _verify_sequential(procs: list[Proc], decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]], options: Options, stats: Optional[list[dict]]) -> Iterator[Union[z3.BoolRef, HLDError]]:
+    ctx = _make_context(decls, correctness, symtab, callees, options)
+    ctx.stats = stats
+    for proc in procs:
+        try:
+            pre = ctx.verify(proc)
+        except HLDError as e:
+            pre = e
+        yield pre
+
+def _concrete_inputs(n: int, rng: random.Random) -> Iterator[list[int]]:
+    # boundary values first, then random ones, mostly small
+    for args in itertools.product([0, 1, -1, 2, -2, 3, -3], repeat=n):
+        yield list(args)
+    while True:
+        yield [rng.randint(-1000, 1000) if rng.random() < 0.1 else rng.randint(-50, 50) for _ in range(n)]
+
+def _test_concrete(procs: list[Proc], decls: list[Declaration], correctness: Correctness, options: Options) -> Optional[tuple[int, HLDError]]:
+    # runs procs on inputs satisfying their precondition with contracts checked,
+    # returns the index of the first proc that fails and its error. Only checks
+    # in the proc's own code count: a failure inside a callee, e.g. of its
+    # postcondition, does not show that the proc itself is wrong
+    checks = []
+    starts, prog, strtab = compile_program(decls, checks, correctness == Correctness.TOTAL, True)
+    vm = FlatVm(prog, strtab, checks, options.concrete_steps)
+    evaluator = Evaluator(decls)
+    for i, proc in enumerate(procs):
+        # without a precondition, failing inputs only weaken the precondition
+        # found, they are no error
+        if proc.pre == None:
+            continue
+        name = proc.name.value
+        env = {param.value: f'args[{j}]' for j, param in enumerate(proc.params)}
+        pre = evaluator.compile(proc.pre, env, 'args')
+        if pre == None:
+            continue
+        tested = 0
+        inputs = _concrete_inputs(len(proc.params), random.Random(name))
+        for args in itertools.islice(inputs, 10 * options.concrete_tests):
+            if tested == options.concrete_tests:
+                break
+            try:
+                if not pre(args):
+                    continue
+            except (ArithmeticError, RecursionError):
+                continue
+            tested += 1
+            try:
+                vm.run(starts[name], args)
+            except ContractError as e:
+                if e.proc != name:
+                    continue
+                assigns = ', '.join(f'{param.value} = {arg}' for param, arg in zip(proc.params, args))
+                msg = f'{e.msg}\ncounter-example: [{assigns}]'
+                return i, HLDError(format_error(proc.src, e.loc, msg), e.loc, msg)
+            except (ArithmeticError, RuntimeError):
+                # division by zero, step limit, contracts that cannot be evaluated
+                continue
+    return None
+
+def get_pre(decls: list[Declaration], correctness: Correctness, symtab: dict[str, dict[str, ValueType]], callees: dict[str, set[str]], jobs: int = 1, cache: Optional[VerificationCache] = None, options: Options = Options(), stats: Optional[list[dict]] = None, errors: Optional[list[HLDError]] = None) -> dict[str, z3.BoolRef]:
+    # if stats is given, a record of each solver query and simplification made
+    # is appended to it. If errors is given, the errors of procs are appended
+    # to it instead of raised and the other procs are still verified, taking
+    # the contracts of their callees as given even if those failed; the result
+    # only holds the procs verified
+    procs = [decl for decl in decls if isinstance(decl, Proc)]
+    keys: dict[str, str] = {}
+    hits: dict[str, dict] = {}
+    if cache != None:
+        by_name: dict[str, Declaration] = {decl.name.value: decl for decl in decls} # type: ignore
+        for proc in procs:
+            name = proc.name.value
+            keys[name] = cache.key(proc, by_name, callees, correctness, options)
+            entry = cache.get(keys[name])
+            if entry != None:
+                hits[name] = entry
+    misses = [proc for proc in procs if proc.name.value not in hits]
+    failures: dict[str, HLDError] = {}
+    start = 0
+    while options.concrete_tests > 0 and start < len(misses):
+        failed = _test_concrete(misses[start:], decls, correctness, options)
+        if failed == None:
+            break
+        failed_index = start + failed[0]
+        failures[misses[failed_index].name.value] = failed[1]
+        if errors == None:
+            # procs after the first failure would never be reported
+            misses = misses[:failed_index]
+        start = failed_index + 1
+    misses = [proc for proc in misses if proc.name.value not in failures]
+    if jobs > 1 and len(misses) > 1:
+        verified = _verify_parallel(misses, decls, correctness, symtab, callees, options, jobs, stats)
+    else:
+        verified = _verify_sequential(misses, decls, correctness, symtab, callees, options, stats)
+    pres = {}
+    try:
+        # walk procs in declaration order so that the errors reported are the
+        # same regardless of caching and parallelism
+        for proc in procs:
+            name = proc.name.value
+            try:
+                if name in hits:
+                    pres[name] = _load_entry(hits[name], decls)
+                    continue
+                try:
+                    if name in failures:
+                        raise failures[name]
+                    pre = next(verified)
+                    if isinstance(pre, HLDError):
+                        raise pre
+                except HLDError as e:
+                    entry = _error_entry(e, decls)
+                    if cache != None and entry != None and not isinstance(e, UnknownResult):
+                        cache.put(keys[name], entry)
+                    raise
+                if cache != None:
+                    cache.put(keys[name], {'pre': pre.serialize()})
+                pres[name] = pre
+            except HLDError as e:
+                if errors == None:
+                    raise
+                # an error in the contract of a callee shows up in every caller
+                if not any(err.args == e.args for err in errors):
+                    errors.append(e)
+    finally:
+        verified.close()
     return pres
 
 # NOTE: unused
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache, singledispatchmethod
+from typing import Any, Callable, Optional
+from hldast import *
+
+# evaluates metaconditions on concrete values; expressions are translated to
+# python source over an environment mapping HLD names to python expressions
+
+def _div(a: int, b: int) -> int:
+    # smt-lib integer division, the remainder is never negative
+    return (a - a % abs(b)) // b
+
+def _mod(a: int, b: int) -> int:
+    return a % abs(b)
+
+class _Unbounded(Exception):
+    pass
+
+class Evaluator:
+    __arith_ops = {
+        '*': '*',
+        '+': '+',
+        '-': '-',
+    }
+    __logical_ops = {
+        '||': 'or',
+        '&&': 'and',
+    }
+    __flipped_ops = {'<=': '>=', '<': '>', '>=': '<=', '>': '<'}
+
+    def __init__(self, decls: list[Declaration], cache_size: int = 1 << 16):
+        self.decls = {decl.name.value: decl for decl in decls if isinstance(decl, (Fn, Pred))}
+        self.cache_size = cache_size
+        self.namespace: dict[str, Any] = {'_div': _div, '_mod': _mod}
+        self.defined: set[str] = set()
+        self.unbounded: set[str] = set()
+        self.env: dict[str, str] = {}
+
+    @singledispatchmethod
+    def expr(self, _: Expr) -> str:
+        raise NotImplementedError
+
+    @expr.register
+    def _(self, expr: BoolLiteral) -> str:
+        return str(expr.value)
+
+    @expr.register
+    def _(self, expr: IntLiteral) -> str:
+        return str(expr.value)
+
+    @expr.register
+    def _(self, expr: Identifier) -> str:
+        return self.env[expr.value]
+
+    @expr.register
+    def _(self, _: ResultExpr) -> str:
+        return self.env['result']
+
+    @expr.register
+    def _(self, pref: PrefixArithmeticExpr) -> str:
+        assert pref.op in {'+', '-'}
+        return f'({pref.op}{self.expr(pref.expr)})'
+
+    @expr.register
+    def _(self, pref: PrefixLogicalExpr) -> str:
+        assert pref.op == '!'
+        return f'(not {self.expr(pref.expr)})'
+
+    @expr.register
+    def _(self, expr: InfixArithmeticExpr) -> str:
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        if expr.op == '/':
+            return f'_div({left}, {right})'
+        elif expr.op == '%':
+            return f'_mod({left}, {right})'
+        return f'({left} {self.__arith_ops[expr.op]} {right})'
+
+    @expr.register
+    def _(self, expr: InfixRelationalExpr) -> str:
+        return f'({self.expr(expr.left)} {expr.op} {self.expr(expr.right)})'
+
+    @expr.register
+    def _(self, expr: InfixLogicalExpr) -> str:
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        if expr.op == '->':
+            return f'((not {left}) or {right})'
+        return f'({left} {self.__logical_ops[expr.op]} {right})'
+
+    @expr.register
+    def _(self, ternary: TernaryExpr) -> str:
+        cond = self.expr(ternary.cond)
+        then_expr = self.expr(ternary.then_expr)
+        else_expr = self.expr(ternary.else_expr)
+        return f'({then_expr} if {cond} else {else_expr})'
+
+    @expr.register
+    def _(self, call: CallExpr) -> str:
+        name = call.callee.value
+        self.define(name)
+        args = ', '.join(self.expr(arg) for arg in call.args)
+        return f'f_{name}({args})'
+
+    @expr.register
+    def _(self, quantified: QuantifiedExpr) -> str:
+        # only quantifiers whose bindings are bounded by the antecedent (forall)
+        # or by a conjunct (exists) can be evaluated, e.g.
+        #   forall i. 0 <= i && i < n -> ...
+        #   exists i. 0 <= i && i < n && ...
+        if quantified.quantifier == 'forall':
+            if not (isinstance(quantified.expr, InfixLogicalExpr) and quantified.expr.op == '->'):
+                raise _Unbounded
+            range_cond = quantified.expr.left
+        else:
+            range_cond = quantified.expr
+        conjuncts = self.conjuncts(range_cond)
+        env = self.env
+        self.env = env.copy()
+        try:
+            loops = []
+            later = {binding.value for binding in quantified.bindings}
+            for binding in quantified.bindings:
+                var = binding.value
+                later.remove(var)
+                lower, upper = self.bounds(var, conjuncts, later | {var})
+                self.env[var] = f'v_{var}'
+                loops.append(f'for v_{var} in range({lower}, {upper})')
+            body = self.expr(quantified.expr)
+        finally:
+            self.env = env
+        f = 'all' if quantified.quantifier == 'forall' else 'any'
+        return f'{f}({body} {" ".join(loops)})'
+
+    def conjuncts(self, expr: Expr) -> list[Expr]:
+        if isinstance(expr, InfixLogicalExpr) and expr.op == '&&':
+            return self.conjuncts(expr.left) + self.conjuncts(expr.right)
+        return [expr]
+
+    def bounds(self, var: str, conjuncts: list[Expr], unbound: set[str]) -> tuple[str, str]:
+        lowers = []
+        uppers = []
+        for conjunct in conjuncts:
+            if not isinstance(conjunct, InfixRelationalExpr) or not conjunct.op in self.__flipped_ops:
+                continue
+            # normalize to `bound op var`
+            op, bound, other = conjunct.op, conjunct.left, conjunct.right
+            if isinstance(bound, Identifier) and bound.value == var:
+                op, bound, other = self.__flipped_ops[op], other, bound
+            if not (isinstance(other, Identifier) and other.value == var):
+                continue
+            if any(isinstance(node, Identifier) and node.value in unbound for node in walk(bound)):
+                continue
+            value = self.expr(bound)
+            if op == '<=':
+                lowers.append(value)
+            elif op == '<':
+                lowers.append(f'{value} + 1')
+            elif op == '>=':
+                uppers.append(f'{value} + 1')
+            else:
+                uppers.append(value)
+        if len(lowers) == 0 or len(uppers) == 0:
+            raise _Unbounded
+        lower = lowers[0] if len(lowers) == 1 else f'max({", ".join(lowers)})'
+        upper = uppers[0] if len(uppers) == 1 else f'min({", ".join(uppers)})'
+        return lower, upper
+
+    def define(self, name: str):
+        if name in self.unbounded:
+            raise _Unbounded
+        if name in self.defined:
+            return
+        decl = self.decls[name]
+        self.defined.add(name)
+        env = self.env
+        self.env = {param.value: f'v_{param.value}' for param in decl.params}
+        try:
+            body = self.expr(decl.expr)
+        except _Unbounded:
+            self.defined.remove(name)
+            self.unbounded.add(name)
+            raise
+        finally:
+            self.env = env
+        params = ', '.join(f'v_{param.value}' for param in decl.params)
+        exec(f'def f_{name}({params}):\n    return {body}', self.namespace)
+        self.namespace[f'f_{name}'] = lru_cache(maxsize=self.cache_size)(self.namespace[f'f_{name}'])
+
+    def compile(self, expr: Expr, env: dict[str, str], params: str = 'stack, fp') -> Optional[Callable[..., Any]]:
+        # returns None if expr contains a quantifier that cannot be evaluated
+        self.env = env
+        try:
+            source = self.expr(expr)
+        except _Unbounded:
+            return None
+        return eval(f'lambda {params}: {source}', self.namespace)
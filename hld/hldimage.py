@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import mmap
+import struct
+import sys
+
+from array import array
+from typing import NamedTuple, Sequence
+
+from hldinterpreter import Inst, Opcode
+
+# compiled programs saved to disk, so that running them again needs neither
+# the parser nor the compiler. An image is little endian and holds
+#   header    magic, version and the number of procs, instructions, strings
+#             and big constants
+#   opcodes   one byte per instruction, padded to a multiple of 8 bytes
+#   operands  one signed 64 bit integer per instruction
+#   procs     string index of the name, start and arity of each proc
+#   strings   byte length and utf-8 text of each string, the last one is the
+#             name of the source file
+#   bigs      byte length and decimal text of each constant that does not fit
+#             in an operand, the operand of such a constant is its index and
+#             its opcode has the high bit set
+# the opcodes and operands are used in place from the memory mapped file
+
+_MAGIC = b'HLDC'
+_VERSION = 2
+_HEADER = struct.Struct('<4sIIIII')
+_PROC = struct.Struct('<III')
+_LENGTH = struct.Struct('<I')
+_BIG = 0x80
+_MIN_ARG = -(1 << 63)
+_MAX_ARG = (1 << 63) - 1
+# every byte that is a valid opcode, with or without the big constant bit
+_OPCODES = bytes(op | big for op in Opcode for big in [0, _BIG])
+
+class ImageError(RuntimeError):
+    pass
+
+class Image(NamedTuple):
+    source: str
+    procs: dict[str, int]
+    arities: dict[str, int]
+    ops: Sequence[int]
+    args: Sequence[int]
+    strtab: list[str]
+
+    def prog(self) -> list[Inst]:
+        return [Inst(Opcode(op), arg) for op, arg in zip(self.ops, self.args)]
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+def write_image(path: str, source: str, procs: dict[str, int], arities: dict[str, int], prog: list[Inst], strtab: list[str]):
+    strings = strtab + [source]
+    names = {}
+    for name in procs:
+        names[name] = len(strings)
+        strings.append(name)
+    ops = bytearray()
+    args = array('q')
+    bigs = []
+    for op, arg in prog:
+        if arg < _MIN_ARG or arg > _MAX_ARG:
+            ops.append(op | _BIG)
+            args.append(len(bigs))
+            bigs.append(arg)
+        else:
+            ops.append(op)
+            args.append(arg)
+    if sys.byteorder != 'little':
+        args.byteswap()
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(procs), len(prog), len(strings), len(bigs)))
+        f.write(ops)
+        f.write(bytes(_pad(len(ops))))
+        f.write(args.tobytes())
+        for name, start in procs.items():
+            f.write(_PROC.pack(names[name], start, arities[name]))
+        for text in strings + [str(big) for big in bigs]:
+            data = text.encode()
+            f.write(_LENGTH.pack(len(data)))
+            f.write(data)
+
+def _read_strings(buf: memoryview, offset: int, n: int) -> tuple[list[str], int]:
+    strings = []
+    for _ in range(n):
+        length, = _LENGTH.unpack_from(buf, offset)
+        offset += _LENGTH.size
+        strings.append(str(buf[offset:offset + length], 'utf-8'))
+        offset += length
+    return strings, offset
+
+def load_image(path: str) -> Image:
+    with open(path, 'rb') as f:
+        try:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except ValueError:
+            # an empty file cannot be mapped
+            raise ImageError(f'{path}: not a compiled program')
+    try:
+        magic, version, nprocs, ninsts, nstrs, nbigs = _HEADER.unpack_from(buf)
+        if magic != _MAGIC:
+            raise ImageError(f'{path}: not a compiled program')
+        if version != _VERSION:
+            raise ImageError(f'{path}: compiled program has version {version}, expected {_VERSION}')
+        offset = _HEADER.size
+        ops: Sequence[int] = buf[offset:offset + ninsts]
+        offset += ninsts + _pad(ninsts)
+        args: Sequence[int] = buf[offset:offset + 8 * ninsts].cast('q')
+        offset += 8 * ninsts
+        if len(ops) != ninsts or len(args) != ninsts:
+            raise ImageError(f'{path}: truncated compiled program')
+        table = [_PROC.unpack_from(buf, offset + i * _PROC.size) for i in range(nprocs)]
+        offset += nprocs * _PROC.size
+        strings, offset = _read_strings(buf, offset, nstrs)
+        bigs, offset = _read_strings(buf, offset, nbigs)
+        if offset > len(buf):
+            raise ImageError(f'{path}: truncated compiled program')
+    except (struct.error, TypeError, UnicodeDecodeError):
+        # unpacking past the end or casting a partial operand
+        raise ImageError(f'{path}: truncated compiled program')
+    # the engines trust the image, so whatever they index by must be in range
+    if len(bytes(ops).translate(None, _OPCODES)) > 0:
+        raise ImageError(f'{path}: invalid opcode in compiled program')
+    if nstrs < nprocs + 1:
+        raise ImageError(f'{path}: invalid string table in compiled program')
+    for name, start, _ in table:
+        if start >= ninsts or name >= nstrs:
+            raise ImageError(f'{path}: invalid proc in compiled program')
+    if sys.byteorder != 'little':
+        args = array('q', args)
+        args.byteswap()
+    if nbigs > 0:
+        # only programs with big constants are copied out of the mapping
+        ops = bytearray(ops)
+        args = list(args)
+        for i, op in enumerate(ops):
+            if op & _BIG:
+                if args[i] < 0 or args[i] >= nbigs:
+                    raise ImageError(f'{path}: invalid constant in compiled program')
+                ops[i] = op & ~_BIG
+                args[i] = int(bigs[args[i]])
+    procs = {strings[name]: start for name, start, _ in table}
+    arities = {strings[name]: arity for name, _, arity in table}
+    strtab = strings[:nstrs - nprocs - 1]
+    return Image(strings[nstrs - nprocs - 1], procs, arities, ops, args, strtab)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
-from typing import NamedTuple
+import operator
+
+from array import array
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence, Union
 from enum import IntEnum, auto, unique
 
 @unique
@@ -31,13 +34,102 @@ class Opcode(IntEnum):
     CALL = auto()       # calls[-1] = ip+1; ip = arg
     RET = auto()        # calls[-1] = ip
     POP = auto()
+    CHECK = auto()      # checks[arg](frame) or die
+    # emitted by hldpeephole, the superinstructions pack the opcode of the
+    # fused operation in the low byte of arg and their operands above it
+    POP_JMP_IF = auto()     # if stack.pop() != 0 goto arg
+    POP_JMP_UNLESS = auto() # if stack.pop() == 0 goto arg
+    LOAD_LOAD_OP = auto()   # push(stack[x] op stack[y]), arg = pack(op, x, y)
+    LOAD_CONST_OP = auto()  # push(stack[x] op y), arg = pack(op, x, y)
+    CMP_JMP_UNLESS = auto() # value = pop(); if !(stack.pop() op value) goto x, arg = pack(op, x)
 
 Inst = NamedTuple('Inst', op=Opcode, arg=int)
 
+def pack(op: Opcode, x: int, y: int = 0) -> int:
+    # x must fit in 24 bits unless it is the last operand
+    return op | x << 8 | y << 32
+
+# the operations superinstructions may fuse, by opcode
+binops: list[Optional[Callable[[int, int], int]]] = [None] * len(Opcode)
+binops[Opcode.ADD] = operator.add
+binops[Opcode.SUB] = operator.sub
+binops[Opcode.MUL] = operator.mul
+binops[Opcode.DIV] = operator.floordiv
+binops[Opcode.MOD] = operator.mod
+binops[Opcode.LT] = lambda x, y: int(x < y)
+binops[Opcode.LE] = lambda x, y: int(x <= y)
+binops[Opcode.EQ] = lambda x, y: int(x == y)
+binops[Opcode.NE] = lambda x, y: int(x != y)
+binops[Opcode.GE] = lambda x, y: int(x >= y)
+binops[Opcode.GT] = lambda x, y: int(x > y)
+
+def disassemble(prog: list[Inst]) -> Iterator[str]:
+    for i, (opcode, arg) in enumerate(prog):
+        if opcode == Opcode.LOAD_LOAD_OP or opcode == Opcode.LOAD_CONST_OP:
+            operands = f'{Opcode(arg & 0xff).name} {(arg >> 8) & 0xffffff:04x} {arg >> 32:04x}'
+        elif opcode == Opcode.CMP_JMP_UNLESS:
+            operands = f'{Opcode(arg & 0xff).name} {arg >> 8:04x}'
+        else:
+            operands = f'{arg:04x}'
+        yield f'{i:04x} {opcode.name} {operands}'
+
+# plain ints compare faster than enum members in the FlatVm dispatch loop
+_NOP = int(Opcode.NOP)
+_NEG = int(Opcode.NEG)
+_NOT = int(Opcode.NOT)
+_ADD = int(Opcode.ADD)
+_SUB = int(Opcode.SUB)
+_MUL = int(Opcode.MUL)
+_DIV = int(Opcode.DIV)
+_MOD = int(Opcode.MOD)
+_LT = int(Opcode.LT)
+_LE = int(Opcode.LE)
+_EQ = int(Opcode.EQ)
+_NE = int(Opcode.NE)
+_GE = int(Opcode.GE)
+_GT = int(Opcode.GT)
+_LOAD = int(Opcode.LOAD)
+_STORE = int(Opcode.STORE)
+_CONST = int(Opcode.CONST)
+_JMP = int(Opcode.JMP)
+_JMP_IF = int(Opcode.JMP_IF)
+_JMP_UNLESS = int(Opcode.JMP_UNLESS)
+_ASSERT = int(Opcode.ASSERT)
+_ENTER = int(Opcode.ENTER)
+_FRAME = int(Opcode.FRAME)
+_CALL = int(Opcode.CALL)
+_RET = int(Opcode.RET)
+_POP = int(Opcode.POP)
+_CHECK = int(Opcode.CHECK)
+_POP_JMP_IF = int(Opcode.POP_JMP_IF)
+_POP_JMP_UNLESS = int(Opcode.POP_JMP_UNLESS)
+_LOAD_LOAD_OP = int(Opcode.LOAD_LOAD_OP)
+_LOAD_CONST_OP = int(Opcode.LOAD_CONST_OP)
+_CMP_JMP_UNLESS = int(Opcode.CMP_JMP_UNLESS)
+
+def run_batch(execute: Callable[[list[int]], int], inputs: Iterable[Sequence]) -> Iterator[tuple[list[int], Union[int, ArithmeticError, RuntimeError]]]:
+    # inputs may be any iterable of rows: tuples, csv rows of strings or the
+    # rows of a numpy array, failed runs are yielded instead of raised
+    for row in inputs:
+        args = [int(x) for x in row]
+        try:
+            yield args, execute(args)
+        except (ArithmeticError, RuntimeError) as e:
+            # division by zero, recursion depth, assertions and contracts
+            yield args, e
+
+# contract checks emitted by hldcompiler, called with the stack and the
+# index of the first local of the current frame
+Check = Callable[[list[int], int], None]
+
 class Vm:
-    def __init__(self, prog: list[Inst], strtab: list[str]):
+    def __init__(self, prog: list[Inst], strtab: list[str], checks: Sequence[Check] = ()):
         self.prog = prog
         self.strtab = strtab
+        self.checks = checks
+
+    def run_batch(self, start: int, inputs: Iterable[Sequence]) -> Iterator[tuple[list[int], Union[int, ArithmeticError, RuntimeError]]]:
+        return run_batch(lambda args: self.run(start, args), inputs)
 
     def run(self, start: int, args: list[int]) -> int:
         prog = self.prog
@@ -133,6 +225,27 @@ class Vm:
                 ip = length
         def pop():
             stack.pop()
+        def check():
+            self.checks[inst.arg](stack, 0)
+        def pop_jmp_if():
+            nonlocal ip
+            if stack.pop() != 0:
+                ip = inst.arg - 1
+        def pop_jmp_unless():
+            nonlocal ip
+            if stack.pop() == 0:
+                ip = inst.arg - 1
+        def load_load_op():
+            arg = inst.arg
+            stack.append(binops[arg & 0xff](stack[(arg >> 8) & 0xffffff], stack[arg >> 32]))
+        def load_const_op():
+            arg = inst.arg
+            stack.append(binops[arg & 0xff](stack[(arg >> 8) & 0xffffff], arg >> 32))
+        def cmp_jmp_unless():
+            nonlocal ip
+            value = stack.pop()
+            if not binops[inst.arg & 0xff](stack.pop(), value):
+                ip = (inst.arg >> 8) - 1
         code: list = [None] * len(Opcode)
         code[Opcode.NOP] = nop
         code[Opcode.NEG] = neg
@@ -160,8 +273,158 @@ class Vm:
         code[Opcode.CALL] = call
         code[Opcode.RET] = ret
         code[Opcode.POP] = pop
+        code[Opcode.CHECK] = check
+        code[Opcode.POP_JMP_IF] = pop_jmp_if
+        code[Opcode.POP_JMP_UNLESS] = pop_jmp_unless
+        code[Opcode.LOAD_LOAD_OP] = load_load_op
+        code[Opcode.LOAD_CONST_OP] = load_const_op
+        code[Opcode.CMP_JMP_UNLESS] = cmp_jmp_unless
         while ip < length:
             inst = prog[ip]
             code[inst.op]()
             ip += 1
         return stack[-1]
+
+class StepLimitExceeded(RuntimeError):
+    pass
+
+class FlatVm:
+    def __init__(self, prog: list[Inst], strtab: list[str], checks: Sequence[Check] = (), max_steps: Optional[int] = None):
+        self.ops: Sequence[int] = array('B', (inst.op for inst in prog))
+        self.args: Sequence[int] = [inst.arg for inst in prog]
+        self.strtab = strtab
+        self.checks = checks
+        self.max_steps = max_steps
+
+    @classmethod
+    def from_code(cls, ops: Sequence[int], args: Sequence[int], strtab: list[str], max_steps: Optional[int] = None) -> 'FlatVm':
+        # runs opcodes and operands that are already apart, e.g. the memory
+        # mapped arrays of an image
+        vm = cls([], strtab, max_steps=max_steps)
+        vm.ops = ops
+        vm.args = args
+        return vm
+
+    def run_batch(self, start: int, inputs: Iterable[Sequence]) -> Iterator[tuple[list[int], Union[int, ArithmeticError, RuntimeError]]]:
+        return run_batch(lambda args: self.run(start, args), inputs)
+
+    def run(self, start: int, args: list[int]) -> int:
+        ops = self.ops
+        opargs = self.args
+        fused = binops
+        # locals of the active frame live at stack[fp:], there is no copying
+        # on calls, a frame is dropped by truncating the stack on return
+        stack = args[:]
+        push = stack.append
+        pop = stack.pop
+        fp = 0
+        calls: list[int] = []
+        frames: list[int] = []
+        ip = start
+        # every loop iteration and every call takes an unconditional jump or a
+        # call, so counting those bounds the run; -1 never reaches 0
+        steps = -1 if self.max_steps == None else self.max_steps
+        while True:
+            op = ops[ip]
+            arg = opargs[ip]
+            ip += 1
+            # most frequent opcodes first
+            if op == _LOAD:
+                push(stack[fp + arg])
+            elif op == _CONST:
+                push(arg)
+            elif op == _STORE:
+                stack[fp + arg] = pop()
+            elif op == _LOAD_CONST_OP:
+                push(fused[arg & 0xff](stack[fp + ((arg >> 8) & 0xffffff)], arg >> 32))
+            elif op == _POP_JMP_UNLESS:
+                if pop() == 0:
+                    ip = arg
+            elif op == _LOAD_LOAD_OP:
+                push(fused[arg & 0xff](stack[fp + ((arg >> 8) & 0xffffff)], stack[fp + (arg >> 32)]))
+            elif op == _CMP_JMP_UNLESS:
+                value = pop()
+                if not fused[arg & 0xff](pop(), value):
+                    ip = arg >> 8
+            elif op == _JMP_UNLESS:
+                if stack[-1] == 0:
+                    ip = arg
+            elif op == _POP:
+                pop()
+            elif op == _ADD:
+                value = pop()
+                stack[-1] += value
+            elif op == _SUB:
+                value = pop()
+                stack[-1] -= value
+            elif op == _JMP:
+                ip = arg
+                steps -= 1
+                if steps == 0:
+                    raise StepLimitExceeded(f'step limit of {self.max_steps} exceeded')
+            elif op == _LT:
+                value = pop()
+                stack[-1] = int(stack[-1] < value)
+            elif op == _LE:
+                value = pop()
+                stack[-1] = int(stack[-1] <= value)
+            elif op == _EQ:
+                value = pop()
+                stack[-1] = int(stack[-1] == value)
+            elif op == _NE:
+                value = pop()
+                stack[-1] = int(stack[-1] != value)
+            elif op == _GE:
+                value = pop()
+                stack[-1] = int(stack[-1] >= value)
+            elif op == _GT:
+                value = pop()
+                stack[-1] = int(stack[-1] > value)
+            elif op == _MUL:
+                value = pop()
+                stack[-1] *= value
+            elif op == _DIV:
+                value = pop()
+                stack[-1] //= value
+            elif op == _MOD:
+                value = pop()
+                stack[-1] %= value
+            elif op == _JMP_IF:
+                if stack[-1] != 0:
+                    ip = arg
+            elif op == _POP_JMP_IF:
+                if pop() != 0:
+                    ip = arg
+            elif op == _NOT:
+                stack[-1] = 1 if stack[-1] == 0 else 0
+            elif op == _NEG:
+                stack[-1] = -stack[-1]
+            elif op == _FRAME:
+                frames.append(fp)
+                fp = len(stack) - arg
+            elif op == _CALL:
+                calls.append(ip)
+                ip = arg
+                steps -= 1
+                if steps == 0:
+                    raise StepLimitExceeded(f'step limit of {self.max_steps} exceeded')
+            elif op == _ENTER:
+                n = fp + arg - len(stack)
+                if n > 0:
+                    stack.extend([0] * n)
+            elif op == _RET:
+                value = pop()
+                if len(calls) == 0:
+                    return value
+                ip = calls.pop()
+                del stack[fp:]
+                fp = frames.pop()
+                push(value)
+            elif op == _ASSERT:
+                if pop() == 0:
+                    raise RuntimeError(self.strtab[arg])
+            elif op == _CHECK:
+                self.checks[arg](stack, fp)
+            else:
+                assert op == _NOP
+
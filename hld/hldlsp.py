@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import json
+import pyparsing
+
+from typing import BinaryIO, Optional
+
+from hldast import *
+import hlddebug
+import hldparser
+import hldsemantic
+
+# a language server reporting the errors of open documents as diagnostics.
+# Documents are verified on every change; the verification cache is keyed on
+# the text of each proc and the contracts of its callees, so only the procs
+# an edit can affect are verified again
+
+_ERROR = 1
+_WARNING = 2
+
+_METHOD_NOT_FOUND = -32601
+_INVALID_PARAMS = -32602
+
+class LanguageServer:
+    def __init__(self, input: BinaryIO, output: BinaryIO, cache: Optional[hlddebug.VerificationCache] = None):
+        self.input = input
+        self.output = output
+        self.cache = cache if cache != None else hlddebug.MemoryCache()
+        self.documents: dict[str, str] = {}
+        self.correctness = hlddebug.Correctness.PARTIAL
+        self.options = hlddebug.Options()
+        self.parser = 'pyparsing'
+
+    def read(self) -> Optional[dict]:
+        length = None
+        while True:
+            line = self.input.readline()
+            if line == b'':
+                return None
+            line = line.strip()
+            if line == b'':
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        if length == None:
+            return None
+        return json.loads(self.input.read(length))
+
+    def send(self, message: dict):
+        body = json.dumps({'jsonrpc': '2.0', **message}).encode()
+        self.output.write(f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        self.output.flush()
+
+    def diagnostic(self, src: str, loc: Optional[int], msg: str, severity: int = _ERROR) -> dict:
+        if loc == None:
+            start = {'line': 0, 'character': 0}
+            end = start
+        else:
+            # locations may sit before the whitespace preceding the node
+            while loc < len(src) and src[loc].isspace():
+                loc += 1
+            line = pyparsing.lineno(loc, src) - 1
+            start = {'line': line, 'character': pyparsing.col(loc, src) - 1}
+            end = {'line': line, 'character': len(pyparsing.line(loc, src))}
+        return {'range': {'start': start, 'end': end}, 'severity': severity, 'source': 'hld', 'message': msg}
+
+    def diagnostics(self, src: str) -> list[dict]:
+        # every declaration is reported, not only the first that fails
+        errors: list[HLDError] = []
+        try:
+            decls = hldparser.parse_string(src, self.parser)
+            symtab, call_graph = hldsemantic.check_program(decls, errors)
+            decls = hldsemantic.independent_decls(decls, errors)
+            hlddebug.get_pre(decls, self.correctness, symtab, call_graph, cache=self.cache, options=self.options, errors=errors)
+        except pyparsing.exceptions.ParseBaseException as pe:
+            return [self.diagnostic(src, pe.loc, pe.msg)]
+        except RecursionError:
+            return [self.diagnostic(src, None, 'maximum recursion depth exceeded')]
+        except Exception as e:
+            # a document the server cannot handle must not take it down
+            return [self.diagnostic(src, None, f'{type(e).__name__}: {e}')]
+        return [self.diagnostic(src, e.loc, e.msg or e.args[0], _WARNING if isinstance(e, hlddebug.UnknownResult) else _ERROR)
+                for e in errors]
+
+    def publish(self, uri: str):
+        self.send({'method': 'textDocument/publishDiagnostics', 'params': {
+            'uri': uri, 'diagnostics': self.diagnostics(self.documents[uri]),
+        }})
+
+    def initialize(self, params: dict) -> dict:
+        # clients may pick the correctness, the parser and the hlddebug
+        # options, malformed options raise ValueError
+        init = params.get('initializationOptions') or {}
+        if not isinstance(init, dict) or not isinstance(init.get('options', {}), dict):
+            raise ValueError('malformed initialization options')
+        self.options = hlddebug.options_from_json(init.get('options', {}))
+        if init.get('total', False):
+            self.correctness = hlddebug.Correctness.TOTAL
+        if init.get('parser') in hldparser.parsers:
+            self.parser = init['parser']
+        return {
+            'capabilities': {'textDocumentSync': {'openClose': True, 'change': 1, 'save': True}},
+            'serverInfo': {'name': 'hld'},
+        }
+
+    def notification(self, method: str, params: dict):
+        if method == 'textDocument/didOpen':
+            document = params['textDocument']
+            self.documents[document['uri']] = document['text']
+            self.publish(document['uri'])
+        elif method == 'textDocument/didChange':
+            # full document sync, the last change holds the whole text
+            uri = params['textDocument']['uri']
+            self.documents[uri] = params['contentChanges'][-1]['text']
+            self.publish(uri)
+        elif method == 'textDocument/didClose':
+            uri = params['textDocument']['uri']
+            del self.documents[uri]
+            self.send({'method': 'textDocument/publishDiagnostics', 'params': {'uri': uri, 'diagnostics': []}})
+
+    def serve(self):
+        while True:
+            message = self.read()
+            if message == None:
+                return
+            method = message.get('method')
+            params = message.get('params') or {}
+            if method == 'exit':
+                return
+            if method == None:
+                # a response, the server sends no requests
+                continue
+            if not 'id' in message:
+                self.notification(method, params)
+            elif method == 'initialize':
+                try:
+                    self.send({'id': message['id'], 'result': self.initialize(params)})
+                except ValueError as e:
+                    self.send({'id': message['id'], 'error': {'code': _INVALID_PARAMS, 'message': e.args[0]}})
+            elif method == 'shutdown':
+                self.send({'id': message['id'], 'result': None})
+            else:
+                error = {'code': _METHOD_NOT_FOUND, 'message': f'unknown method `{method}`'}
+                self.send({'id': message['id'], 'error': error})
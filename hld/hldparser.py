@@ -9,16 +9,27 @@ _infix_arith_ops = { '+', '-', '*', '/', '%' }
 _infix_log_ops = { '&&', '||', '->' }
 _infix_rel_ops = { '<', '<=', '==', '!=', '>', '>=' }
 
+# parse actions only get the text, the nodes of a parse share one Source
+_last_source = Source('')
+
+def _source(text: str) -> Source:
+    global _last_source
+    if _last_source.text is not text:
+        _last_source = Source(text)
+    return _last_source
+
 def ternary_ctor(src: str, loc: int, toks: pp.ParseResults) -> TernaryExpr:
+    source = _source(src)
     [cond, q_mark, then_expr, colon, else_expr], = toks
     assert isinstance(cond, Expr)
     assert q_mark == '?'
     assert isinstance(then_expr, Expr)
     assert colon == ':'
     assert isinstance(else_expr, Expr)
-    return TernaryExpr(src, loc, cond, then_expr, else_expr)
+    return TernaryExpr(source, loc, cond, then_expr, else_expr)
 
 def infix_ctor(src: str, loc: int, toks: pp.ParseResults) -> Expr:
+    source = _source(src)
     toks, = toks
     left = toks[0]
     assert isinstance(left, Expr)
@@ -28,23 +39,24 @@ def infix_ctor(src: str, loc: int, toks: pp.ParseResults) -> Expr:
         right = toks[2 * i + 2]
         assert isinstance(right, Expr)
         if op in _infix_arith_ops:
-            left = InfixArithmeticExpr(src, loc, op, left, right)
+            left = InfixArithmeticExpr(source, loc, op, left, right)
         elif op in _infix_log_ops:
-            left = InfixLogicalExpr(src, loc, op, left, right)
+            left = InfixLogicalExpr(source, loc, op, left, right)
         else:
             assert op in _infix_rel_ops
-            left = InfixRelationalExpr(src, loc, op, left, right)
+            left = InfixRelationalExpr(source, loc, op, left, right)
     return left
 
 def prefix_ctor(src: str, loc: int, toks: pp.ParseResults) -> PrefixExpr:
+    source = _source(src)
     [op, expr], = toks
     assert isinstance(op, str)
     assert isinstance(expr, Expr)
     if op in { '+', '-' }:
-        return PrefixArithmeticExpr(src, loc, op, expr)
+        return PrefixArithmeticExpr(source, loc, op, expr)
     else:
         assert op == '!'
-        return PrefixLogicalExpr(src, loc, op, expr)
+        return PrefixLogicalExpr(source, loc, op, expr)
 
 keywords = {
     'assert', 'if', 'else', 'proc', 'fn', 'while', 'true', 'false', 'return', 'result',
@@ -55,12 +67,12 @@ sup_kw = {k: pp.Suppress(v) for k, v in kw.items()}
 
 not_kw = ~pp.MatchFirst(kw.values())
 identifier = not_kw + pp.Regex('[a-zA-z_][a-zA-z0-9_]*')
-identifier.set_parse_action(lambda s, loc, toks: Identifier(s, loc, toks[0]))
+identifier.set_parse_action(lambda s, loc, toks: Identifier(_source(s), loc, toks[0]))
 int_lit = pp.pyparsing_common.integer.copy()
-int_lit.set_parse_action(lambda s, loc, toks: IntLiteral(s, loc, int(toks[0])))
+int_lit.set_parse_action(lambda s, loc, toks: IntLiteral(_source(s), loc, int(toks[0])))
 bool_lit: pp.ParserElement = kw['true'] | kw['false']
-bool_lit.set_parse_action(lambda s, loc, toks: BoolLiteral(s, loc, toks[0] == 'true'))
-result = kw['result'].set_parse_action(lambda s, loc, _: ResultExpr(s, loc))
+bool_lit.set_parse_action(lambda s, loc, toks: BoolLiteral(_source(s), loc, toks[0] == 'true'))
+result = kw['result'].set_parse_action(lambda s, loc, _: ResultExpr(_source(s), loc))
 
 assign = pp.Suppress(':=')
 semi = pp.Suppress(';')
@@ -92,9 +104,9 @@ assoc_table = [
 expr = pp.Forward()
 args = left_paren - pp.Opt(pp.Group(pp.DelimitedList(expr), True), []) - right_paren
 call = identifier - args
-call.set_parse_action(lambda s, loc, toks: CallExpr(s, loc, *toks))
+call.set_parse_action(lambda s, loc, toks: CallExpr(_source(s), loc, *toks))
 quantified = (kw['forall'] | kw['exists']) - identifier[1, ...] - dot - expr
-quantified.set_parse_action(lambda s, loc, toks: QuantifiedExpr(s, loc, toks[0], toks[1:-1], toks[-1]))
+quantified.set_parse_action(lambda s, loc, toks: QuantifiedExpr(_source(s), loc, toks[0], toks[1:-1], toks[-1]))
 primary = quantified | int_lit | bool_lit | result | identifier + ~left_paren | call
 expr <<= pp.infix_notation(primary, assoc_table)
 expr.set_name('expression')
@@ -106,37 +118,52 @@ variant = sup_kw['#variant'] - expr
 
 statement = pp.Forward()
 assignment = identifier - assign - expr - semi
-assignment.set_parse_action(lambda s, loc, toks: Assignment(s, loc, toks[0], toks[1]))
+assignment.set_parse_action(lambda s, loc, toks: Assignment(_source(s), loc, toks[0], toks[1]))
 block = left_brace - pp.Group(statement[...], True) - right_brace
-block.set_parse_action(lambda s, loc, toks: Block(s, loc, *toks))
+block.set_parse_action(lambda s, loc, toks: Block(_source(s), loc, *toks))
 ifelse = pp.Forward()
 ifelse <<= sup_kw['if'] - expr - block - sup_kw['else'] - (ifelse | block)
-ifelse.set_parse_action(lambda s, loc, toks: IfElse(s, loc, *toks))
+ifelse.set_parse_action(lambda s, loc, toks: IfElse(_source(s), loc, *toks))
 while_ = pp.Opt(invariant, None) + pp.Opt(variant, None) + sup_kw['while'] - expr - block
-while_.set_parse_action(lambda s, loc, toks: While(s, loc, *toks))
+while_.set_parse_action(lambda s, loc, toks: While(_source(s), loc, *toks))
 assert_ = sup_kw['assert'] - expr - semi
-assert_.set_parse_action(lambda s, loc, toks: Assert(s, loc, *toks))
+assert_.set_parse_action(lambda s, loc, toks: Assert(_source(s), loc, *toks))
 return_ = sup_kw['return'] - expr - semi
-return_.set_parse_action(lambda s, loc, toks: Return(s, loc, *toks))
+return_.set_parse_action(lambda s, loc, toks: Return(_source(s), loc, *toks))
 statement <<= ifelse | return_ | assert_ | assignment | while_
 
 params = left_paren - pp.Opt(pp.Group(pp.DelimitedList(identifier), True), []) - right_paren
 
 proc = pp.Opt(precondition, None) + pp.Opt(postcondition, None) + pp.Opt(variant, None) +\
     sup_kw['proc'] - identifier - params - block
-proc.set_parse_action(lambda s, loc, toks: Proc(s, loc, *toks))
+proc.set_parse_action(lambda s, loc, toks: Proc(_source(s), loc, *toks))
 proc.set_name('proc')
 
 fn_or_pred_body = identifier - params - assign - expr - semi
 fn = sup_kw['fn'] - fn_or_pred_body
 fn.set_name('fn')
-fn.set_parse_action(lambda s, loc, toks: Fn(s, loc, *toks))
+fn.set_parse_action(lambda s, loc, toks: Fn(_source(s), loc, *toks))
 
 pred = sup_kw['pred'] - fn_or_pred_body
 pred.set_name('pred')
-pred.set_parse_action(lambda s, loc, toks: Pred(s, loc, *toks))
+pred.set_parse_action(lambda s, loc, toks: Pred(_source(s), loc, *toks))
 
 decls = fn | pred | proc
 program = decls[1, ...]
 parser = program
 parser.ignore(pp.dbl_slash_comment)
+
+# the hand written parser of hldpratt builds the same trees much faster
+parsers = ['pyparsing', 'pratt']
+
+def parse_string(src: str, engine: str = 'pyparsing') -> list[Declaration]:
+    if engine == 'pratt':
+        import hldpratt
+        return hldpratt.parse_string(src)
+    decls = parser.parse_string(src, parse_all=True).as_list()
+    assert isinstance(decls, list)
+    return decls
+
+def parse_file(filename: str, engine: str = 'pyparsing') -> list[Declaration]:
+    with open(filename, encoding='utf-8') as f:
+        return parse_string(f.read(), engine)
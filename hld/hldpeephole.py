@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+from typing import Optional, Union
+
+from hldinterpreter import Inst, Opcode, binops, pack
+
+# peephole optimization of the code emitted by hldcompiler. Every pass looks
+# at short windows of instructions, of which only the first may be a jump
+# target, and marks the instructions it removes as None. The program is then
+# compacted, moving the targets of jumps and calls and the starts of procs to
+# the next instruction kept. The passes run until the program no longer
+# changes, the superinstructions are fused last
+#
+# the step limit of FlatVm counts unconditional jumps and calls, so every loop
+# keeps its backward JMP: conditional jumps are only threaded forwards
+
+Prog = list[Optional[Inst]]
+
+_binary = {Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV, Opcode.MOD,
+           Opcode.LT, Opcode.LE, Opcode.EQ, Opcode.NE, Opcode.GE, Opcode.GT}
+_relational = {Opcode.LT, Opcode.LE, Opcode.EQ, Opcode.NE, Opcode.GE, Opcode.GT}
+_jumps = {Opcode.JMP, Opcode.JMP_IF, Opcode.JMP_UNLESS, Opcode.POP_JMP_IF, Opcode.POP_JMP_UNLESS, Opcode.CALL}
+# operands of superinstructions other than the last take 24 bits
+_MAX_SLOT = (1 << 24) - 1
+
+def _target(inst: Inst) -> Optional[int]:
+    if inst.op == Opcode.CMP_JMP_UNLESS:
+        return inst.arg >> 8
+    if inst.op in _jumps:
+        return inst.arg
+    return None
+
+def _retarget(inst: Inst, target: int) -> Inst:
+    if inst.op == Opcode.CMP_JMP_UNLESS:
+        return Inst(inst.op, pack(Opcode(inst.arg & 0xff), target))
+    return Inst(inst.op, target)
+
+def _targets(procs: dict[str, int], prog: list[Inst]) -> set[int]:
+    targets = set(procs.values())
+    for inst in prog:
+        target = _target(inst)
+        if target != None:
+            targets.add(target)
+    return targets
+
+def _match(prog: list[Inst], targets: set[int], i: int, *ops: Union[Opcode, set[Opcode]]) -> bool:
+    if i + len(ops) > len(prog):
+        return False
+    for j, op in enumerate(ops):
+        if prog[i + j].op not in (op if isinstance(op, set) else {op}):
+            return False
+        if j > 0 and i + j in targets:
+            return False
+    return True
+
+def _compact(procs: dict[str, int], prog: Prog) -> tuple[dict[str, int], list[Inst]]:
+    # removed instructions move to the next one kept
+    moved = [0] * (len(prog) + 1)
+    n = 0
+    for i, inst in enumerate(prog):
+        moved[i] = n
+        if inst != None:
+            n += 1
+    moved[len(prog)] = n
+    compacted = []
+    for inst in prog:
+        if inst == None:
+            continue
+        target = _target(inst)
+        compacted.append(inst if target == None else _retarget(inst, moved[target]))
+    return {name: moved[start] for name, start in procs.items()}, compacted
+
+def _fold(prog: list[Inst], targets: set[int]) -> Prog:
+    # evaluates operations and branches on constants
+    out: Prog = list(prog)
+    i = 0
+    while i < len(prog):
+        inst = prog[i]
+        if _match(prog, targets, i, Opcode.CONST, Opcode.CONST, _binary):
+            x, y, op = inst.arg, prog[i + 1].arg, prog[i + 2].op
+            # division by zero is left to fail at run time
+            if y != 0 or not op in {Opcode.DIV, Opcode.MOD}:
+                out[i:i + 3] = [Inst(Opcode.CONST, binops[op](x, y)), None, None]
+                i += 3
+                continue
+        if _match(prog, targets, i, Opcode.CONST, Opcode.NEG):
+            out[i:i + 2] = [Inst(Opcode.CONST, -inst.arg), None]
+            i += 2
+        elif _match(prog, targets, i, Opcode.CONST, Opcode.NOT):
+            out[i:i + 2] = [Inst(Opcode.CONST, int(inst.arg == 0)), None]
+            i += 2
+        elif _match(prog, targets, i, {Opcode.CONST, Opcode.LOAD}, Opcode.POP):
+            out[i:i + 2] = [None, None]
+            i += 2
+        elif _match(prog, targets, i, Opcode.CONST, {Opcode.JMP_IF, Opcode.JMP_UNLESS}):
+            jump = prog[i + 1]
+            taken = (inst.arg != 0) == (jump.op == Opcode.JMP_IF)
+            out[i + 1] = Inst(Opcode.JMP, jump.arg) if taken else None
+            i += 2
+        elif _match(prog, targets, i, Opcode.CONST, {Opcode.POP_JMP_IF, Opcode.POP_JMP_UNLESS}):
+            jump = prog[i + 1]
+            taken = (inst.arg != 0) == (jump.op == Opcode.POP_JMP_IF)
+            out[i:i + 2] = [None, Inst(Opcode.JMP, jump.arg) if taken else None]
+            i += 2
+        else:
+            i += 1
+    return out
+
+def _thread(prog: list[Inst], targets: set[int]) -> Prog:
+    # jumps to jumps go straight to where those lead. A conditional jump that
+    # does not pop finds the same value at a conditional jump it lands on
+    out: Prog = list(prog)
+    for i, inst in enumerate(prog):
+        if not inst.op in {Opcode.JMP, Opcode.JMP_IF, Opcode.JMP_UNLESS, Opcode.POP_JMP_IF, Opcode.POP_JMP_UNLESS}:
+            continue
+        target = inst.arg
+        visited = {i}
+        while target < len(prog) and not target in visited:
+            visited.add(target)
+            next_inst = prog[target]
+            if next_inst.op == Opcode.JMP:
+                if inst.op != Opcode.JMP and next_inst.arg <= i:
+                    break
+                target = next_inst.arg
+            elif inst.op in {Opcode.JMP_IF, Opcode.JMP_UNLESS} and next_inst.op in {Opcode.JMP_IF, Opcode.JMP_UNLESS}:
+                if next_inst.op == inst.op and next_inst.arg <= i:
+                    break
+                target = next_inst.arg if next_inst.op == inst.op else target + 1
+            else:
+                break
+        out[i] = Inst(inst.op, target)
+    return out
+
+def _pop_jumps(prog: list[Inst], targets: set[int]) -> Prog:
+    # a conditional jump followed by a pop on both paths pops the condition
+    # itself, the pop at the target is left to any other jump to it
+    out: Prog = list(prog)
+    popping = {Opcode.JMP_IF: Opcode.POP_JMP_IF, Opcode.JMP_UNLESS: Opcode.POP_JMP_UNLESS}
+    i = 0
+    while i < len(prog):
+        inst = prog[i]
+        if (_match(prog, targets, i, {Opcode.JMP_IF, Opcode.JMP_UNLESS}, Opcode.POP)
+                and inst.arg < len(prog) and prog[inst.arg].op == Opcode.POP):
+            out[i:i + 2] = [Inst(popping[inst.op], inst.arg + 1), None]
+            i += 2
+        else:
+            i += 1
+    return out
+
+def _dead_code(procs: dict[str, int], prog: list[Inst]) -> Prog:
+    # removes what no proc reaches, jumps to the next instruction and nops
+    reachable = set()
+    work = list(procs.values())
+    while len(work) > 0:
+        i = work.pop()
+        if i >= len(prog) or i in reachable:
+            continue
+        reachable.add(i)
+        inst = prog[i]
+        target = _target(inst)
+        if target != None:
+            work.append(target)
+        if inst.op != Opcode.JMP and inst.op != Opcode.RET:
+            work.append(i + 1)
+    out: Prog = []
+    for i, inst in enumerate(prog):
+        if not i in reachable or inst.op == Opcode.NOP:
+            out.append(None)
+        elif inst.op in _jumps and inst.op != Opcode.CALL and inst.arg == i + 1:
+            popping = inst.op in {Opcode.POP_JMP_IF, Opcode.POP_JMP_UNLESS}
+            out.append(Inst(Opcode.POP, 0) if popping else None)
+        else:
+            out.append(inst)
+    return out
+
+def _fuse(prog: list[Inst], targets: set[int]) -> Prog:
+    out: Prog = list(prog)
+    i = 0
+    while i < len(prog):
+        inst = prog[i]
+        if _match(prog, targets, i, Opcode.LOAD, Opcode.LOAD, _binary) and inst.arg <= _MAX_SLOT:
+            out[i:i + 3] = [Inst(Opcode.LOAD_LOAD_OP, pack(prog[i + 2].op, inst.arg, prog[i + 1].arg)), None, None]
+            i += 3
+        elif _match(prog, targets, i, Opcode.LOAD, Opcode.CONST, _binary) and inst.arg <= _MAX_SLOT:
+            out[i:i + 3] = [Inst(Opcode.LOAD_CONST_OP, pack(prog[i + 2].op, inst.arg, prog[i + 1].arg)), None, None]
+            i += 3
+        elif _match(prog, targets, i, _relational, Opcode.POP_JMP_UNLESS):
+            out[i:i + 2] = [Inst(Opcode.CMP_JMP_UNLESS, pack(inst.op, prog[i + 1].arg)), None]
+            i += 2
+        else:
+            i += 1
+    return out
+
+def optimize(procs: dict[str, int], prog: list[Inst]) -> tuple[dict[str, int], list[Inst]]:
+    while True:
+        before = prog
+        for rewrite in [_fold, _thread, _pop_jumps]:
+            procs, prog = _compact(procs, rewrite(prog, _targets(procs, prog)))
+        procs, prog = _compact(procs, _dead_code(procs, prog))
+        if prog == before:
+            break
+    return _compact(procs, _fuse(prog, _targets(procs, prog)))
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+import pyparsing as pp
+import re
+
+from hldast import *
+# the very set of the grammar, unwanted keywords are listed in its order and an
+# equal set may iterate in another order once loaded from bytecode
+from hldparser import keywords
+
+# a hand written tokenizer and pratt parser for the grammar of hldparser. It
+# builds the same trees, down to the locations pyparsing hands to its parse
+# actions, and raises the same pyparsing exceptions on malformed programs.
+#
+# Those locations are where pyparsing started matching an element, which is
+# not always the first character of the node: elements starting with an
+# identifier (and booleans and infix expressions) do not skip the whitespace
+# before them, only the comments. Every token thus records the offset after
+# the comments preceding it, besides its own
+
+_token = re.compile('|'.join([
+    r'(?P<ws>[ \t\r\n]+)',
+    r'(?P<comment>//(?:\\\n|[^\n])*)',
+    r'(?P<int>[0-9]+)',
+    # a keyword is neither preceded nor followed by identifier characters
+    r'(?P<kw>(?<![a-zA-Z0-9_$])(?:%s)(?![a-zA-Z0-9_$]))' % '|'.join(sorted(map(re.escape, keywords))),
+    r'(?P<id>[a-zA-z_][a-zA-z0-9_]*)',
+    r'(?P<op>:=|->|&&|\|\||<=|>=|==|!=|[-+*/%!<>?:;,.(){}])',
+    r'(?P<error>.)',
+]))
+
+_binary_ops = {
+    '*': (7, InfixArithmeticExpr),
+    '/': (7, InfixArithmeticExpr),
+    '%': (7, InfixArithmeticExpr),
+    '+': (6, InfixArithmeticExpr),
+    '-': (6, InfixArithmeticExpr),
+    '<=': (5, InfixRelationalExpr),
+    '<': (5, InfixRelationalExpr),
+    '>=': (5, InfixRelationalExpr),
+    '>': (5, InfixRelationalExpr),
+    '==': (5, InfixRelationalExpr),
+    '!=': (5, InfixRelationalExpr),
+    '&&': (4, InfixLogicalExpr),
+    '||': (3, InfixLogicalExpr),
+    '->': (2, InfixLogicalExpr),
+}
+
+_expected_identifier = "Expected Re:('[a-zA-z_][a-zA-z0-9_]*')"
+
+_keyword_chars = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+
+class __Context:
+    def __init__(self, src: str):
+        self.src = src
+        self.source = Source(src)
+        # kind, value, start and offset after the preceding comments of every
+        # token, the last one marks the end of the source
+        self.kinds: list[str] = []
+        self.values: list = []
+        self.starts: list[int] = []
+        self.skipped: list[int] = []
+        # the operator a right operand was found missing after, so enclosing
+        # expressions do not try it again
+        self.dead = -1
+        self.tokenize()
+
+    def tokenize(self):
+        kinds = self.kinds
+        values = self.values
+        starts = self.starts
+        skipped = self.skipped
+        pos = 0
+        for m in _token.finditer(self.src):
+            kind = m.lastgroup
+            assert kind != None
+            if kind == 'ws':
+                continue
+            if kind == 'comment':
+                pos = m.end()
+                continue
+            text = m.group()
+            if kind == 'int':
+                values.append(int(text))
+            elif kind == 'id' or kind == 'error':
+                values.append(text)
+            else:
+                kind = text
+                values.append(text)
+            kinds.append(kind)
+            starts.append(m.start())
+            skipped.append(pos)
+            pos = m.end()
+        kinds.append('eof')
+        values.append(None)
+        starts.append(len(self.src))
+        skipped.append(pos)
+
+    def error(self, i: int, msg: str) -> pp.ParseException:
+        return pp.ParseException(self.src, self.starts[i], msg)
+
+    def keyword_error(self, i: int, keyword: str) -> pp.ParseException:
+        start = self.starts[i]
+        msg = f'Expected Keyword {keyword!r}'
+        if not self.src.startswith(keyword, start):
+            return pp.ParseException(self.src, start, msg)
+        elif start > 0 and self.src[start - 1] in _keyword_chars:
+            return pp.ParseException(self.src, start - 1, f'{msg}, keyword was immediately preceded by keyword character')
+        return pp.ParseException(self.src, start + len(keyword), f'{msg}, keyword was immediately followed by keyword character')
+
+    def expect(self, i: int, kind: str) -> int:
+        if self.kinds[i] != kind:
+            if kind in keywords:
+                raise self.keyword_error(i, kind)
+            raise self.error(i, f'Expected {kind!r}')
+        return i + 1
+
+    def identifier(self, i: int, loc: int) -> Identifier:
+        if self.kinds[i] != 'id':
+            if self.kinds[i] in keywords:
+                found = ' | '.join(repr(k) for k in keywords)
+                raise pp.ParseException(self.src, self.skipped[i], f'Found unwanted token, {{{found}}}')
+            raise self.error(i, _expected_identifier)
+        return Identifier(self.source, loc, self.values[i])
+
+    def expression(self, i: int, loc: int) -> tuple[Expr, int]:
+        try:
+            return self.ternary(i, loc)
+        except pp.ParseBaseException as pe:
+            pe.msg = 'Expected expression'
+            raise
+
+    # pyparsing looks ahead for a whole ternary, for a prefix operator and its
+    # operand and for the first operator of every precedence and its operands.
+    # Even syntax errors found while looking ahead only mean these are absent
+
+    def ternary(self, i: int, loc: int) -> tuple[Expr, int]:
+        cond, i = self.binary(i, loc, 0)
+        if self.kinds[i] != '?':
+            return cond, i
+        try:
+            then_expr, j = self.ternary(i + 1, self.skipped[i + 1])
+            j = self.expect(j, ':')
+            else_expr, j = self.ternary(j, self.skipped[j])
+        except pp.ParseBaseException:
+            # not a ternary after all, the ? is left for the caller
+            return cond, i
+        return TernaryExpr(self.source, loc, cond, then_expr, else_expr), j
+
+    def binary(self, i: int, loc: int, min_power: int) -> tuple[Expr, int]:
+        left, i = self.unary(i, loc)
+        # the precedence of the operators applied last
+        chain = None
+        while True:
+            op = self.kinds[i]
+            if not op in _binary_ops or i == self.dead:
+                return left, i
+            power, ctor = _binary_ops[op]
+            if power < min_power:
+                return left, i
+            try:
+                right, j = self.binary(i + 1, self.skipped[i + 1], power + 1)
+            except pp.ParseException:
+                # an operator is only taken if an operand follows it
+                self.dead = i
+                return left, i
+            except pp.ParseSyntaxException:
+                if power == chain:
+                    raise
+                self.dead = i
+                return left, i
+            left = ctor(self.source, loc, op, left, right)
+            chain = power
+            i = j
+
+    def unary(self, i: int, loc: int) -> tuple[Expr, int]:
+        op = self.kinds[i]
+        if op != '-' and op != '+' and op != '!':
+            return self.primary(i, loc)
+        try:
+            expr, j = self.unary(i + 1, self.skipped[i + 1])
+        except pp.ParseSyntaxException:
+            raise self.error(i, 'Expected expression') from None
+        ctor = PrefixLogicalExpr if op == '!' else PrefixArithmeticExpr
+        return ctor(self.source, self.starts[i], op, expr), j
+
+    def primary(self, i: int, loc: int) -> tuple[Expr, int]:
+        kind = self.kinds[i]
+        if kind == 'id':
+            if self.kinds[i + 1] == '(':
+                callee = Identifier(self.source, loc, self.values[i])
+                args, j = self.args(i + 1)
+                return CallExpr(self.source, loc, callee, args), j
+            return Identifier(self.source, loc, self.values[i]), i + 1
+        elif kind == 'int':
+            return IntLiteral(self.source, self.starts[i], self.values[i]), i + 1
+        elif kind == 'true' or kind == 'false':
+            return BoolLiteral(self.source, loc, kind == 'true'), i + 1
+        elif kind == 'result':
+            return ResultExpr(self.source, self.starts[i]), i + 1
+        elif kind == 'forall' or kind == 'exists':
+            return self.quantified(i)
+        elif kind == '(':
+            expr, j = self.ternary(i + 1, self.skipped[i + 1])
+            return expr, self.expect(j, ')')
+        elif kind == '->' or kind == '!=':
+            # pyparsing takes the first char for a prefix operator and fails after it
+            raise pp.ParseException(self.src, self.starts[i] + 1, 'Expected expression')
+        raise self.error(i, 'Expected expression')
+
+    def args(self, i: int) -> tuple[list[Expr], int]:
+        try:
+            i = self.expect(i, '(')
+            args = []
+            try:
+                # the first argument starts after the whitespace
+                arg, i = self.expression(i, self.starts[i])
+                args.append(arg)
+                while self.kinds[i] == ',':
+                    try:
+                        arg, j = self.expression(i + 1, self.skipped[i + 1])
+                    except pp.ParseException:
+                        break
+                    args.append(arg)
+                    i = j
+            except pp.ParseException:
+                pass
+            return args, self.expect(i, ')')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+
+    def quantified(self, i: int) -> tuple[QuantifiedExpr, int]:
+        start = i
+        try:
+            bindings = [self.identifier(i + 1, self.skipped[i + 1])]
+            i += 2
+            while self.kinds[i] == 'id':
+                bindings.append(Identifier(self.source, self.skipped[i], self.values[i]))
+                i += 1
+            i = self.expect(i, '.')
+            expr, i = self.expression(i, self.skipped[i])
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return QuantifiedExpr(self.source, self.starts[start], self.kinds[start], bindings, expr), i
+
+    def contract(self, i: int) -> tuple[Expr, int]:
+        try:
+            return self.expression(i + 1, self.skipped[i + 1])
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+
+    def statement(self, i: int, loc: int) -> tuple[Statement, int]:
+        kind = self.kinds[i]
+        if kind == 'id':
+            return self.assignment(i, loc)
+        elif kind == 'if':
+            return self.ifelse(i)
+        elif kind == 'return' or kind == 'assert':
+            return self.return_or_assert(i)
+        elif kind == 'while' or kind == '#invariant' or kind == '#variant':
+            return self.while_(i)
+        raise self.error(i, 'Expected statement')
+
+    def assignment(self, i: int, loc: int) -> tuple[Assignment, int]:
+        dest = Identifier(self.source, loc, self.values[i])
+        try:
+            i = self.expect(i + 1, ':=')
+            value, i = self.expression(i, self.skipped[i])
+            i = self.expect(i, ';')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return Assignment(self.source, loc, dest, value), i
+
+    def ifelse(self, i: int) -> tuple[IfElse, int]:
+        start = i
+        try:
+            cond, i = self.expression(i + 1, self.skipped[i + 1])
+            then_block, i = self.block(i)
+            i = self.expect(i, 'else')
+            if self.kinds[i] == 'if':
+                else_block, i = self.ifelse(i)
+            elif self.kinds[i] == '{':
+                else_block, i = self.block(i)
+            else:
+                raise self.keyword_error(i, 'if')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return IfElse(self.source, self.starts[start], cond, then_block, else_block), i
+
+    def return_or_assert(self, i: int) -> tuple[Union[Return, Assert], int]:
+        start = i
+        try:
+            expr, i = self.expression(i + 1, self.skipped[i + 1])
+            i = self.expect(i, ';')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        ctor = Return if self.kinds[start] == 'return' else Assert
+        return ctor(self.source, self.starts[start], expr), i
+
+    def while_(self, i: int) -> tuple[While, int]:
+        start = i
+        invariant = None
+        variant = None
+        if self.kinds[i] == '#invariant':
+            invariant, i = self.contract(i)
+        if self.kinds[i] == '#variant':
+            variant, i = self.contract(i)
+        i = self.expect(i, 'while')
+        try:
+            cond, i = self.expression(i, self.skipped[i])
+            body, i = self.block(i)
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return While(self.source, self.starts[start], invariant, variant, cond, body), i
+
+    def block(self, i: int) -> tuple[Block, int]:
+        start = i
+        i = self.expect(i, '{')
+        statements = []
+        try:
+            # the first statement starts after the whitespace
+            loc = self.starts[i]
+            while True:
+                try:
+                    statement, i = self.statement(i, loc)
+                except pp.ParseException:
+                    break
+                statements.append(statement)
+                loc = self.skipped[i]
+            i = self.expect(i, '}')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return Block(self.source, self.starts[start], statements), i
+
+    def params(self, i: int) -> tuple[list[Identifier], int]:
+        i = self.expect(i, '(')
+        params = []
+        if self.kinds[i] == 'id':
+            params.append(Identifier(self.source, self.skipped[i], self.values[i]))
+            i += 1
+            while self.kinds[i] == ',' and self.kinds[i + 1] == 'id':
+                params.append(Identifier(self.source, self.skipped[i + 1], self.values[i + 1]))
+                i += 2
+        return params, self.expect(i, ')')
+
+    def proc(self, i: int) -> tuple[Proc, int]:
+        start = i
+        pre = None
+        post = None
+        variant = None
+        if self.kinds[i] == '#pre':
+            pre, i = self.contract(i)
+        if self.kinds[i] == '#post':
+            post, i = self.contract(i)
+        if self.kinds[i] == '#variant':
+            variant, i = self.contract(i)
+        i = self.expect(i, 'proc')
+        try:
+            name = self.identifier(i, self.skipped[i])
+            params, i = self.params(i + 1)
+            body, i = self.block(i)
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        return Proc(self.source, self.starts[start], pre, post, variant, name, params, body), i
+
+    def fn_or_pred(self, i: int) -> tuple[Union[Fn, Pred], int]:
+        start = i
+        try:
+            name = self.identifier(i + 1, self.skipped[i + 1])
+            params, i = self.params(i + 2)
+            i = self.expect(i, ':=')
+            expr, i = self.expression(i, self.skipped[i])
+            i = self.expect(i, ';')
+        except pp.ParseException as pe:
+            raise pp.ParseSyntaxException(self.src, pe.loc, pe.msg) from None
+        ctor = Fn if self.kinds[start] == 'fn' else Pred
+        return ctor(self.source, self.starts[start], name, params, expr), i
+
+    def declaration(self, i: int) -> tuple[Declaration, int]:
+        kind = self.kinds[i]
+        if kind == 'fn' or kind == 'pred':
+            return self.fn_or_pred(i)
+        elif kind in {'proc', '#pre', '#post', '#variant'}:
+            return self.proc(i)
+        # the error found the furthest, pyparsing names the declaration it
+        # expected instead only at the very start
+        pe = max((self.keyword_error(i, keyword) for keyword in ['fn', 'pred', 'proc']), key=lambda pe: pe.loc)
+        if pe.loc == 0:
+            pe.msg = 'Expected {fn | pred | proc}'
+        raise pe
+
+    def program(self) -> list[Declaration]:
+        decl, i = self.declaration(0)
+        decls = [decl]
+        while True:
+            try:
+                decl, i = self.declaration(i)
+            except pp.ParseException:
+                break
+            decls.append(decl)
+        if self.kinds[i] != 'eof':
+            raise self.error(i, 'Expected end of text')
+        return decls
+
+def parse_string(src: str) -> list[Declaration]:
+    # pyparsing expands tabs before parsing, locations are offsets in the
+    # expanded source
+    ctx = __Context(src.expandtabs())
+    return ctx.program()
+
+def parse_file(filename: str) -> list[Declaration]:
+    with open(filename, encoding='utf-8') as f:
+        return parse_string(f.read())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+from functools import singledispatchmethod
+from typing import Callable
+from hldast import *
+
+# HLD identifiers are prefixed in the generated source, so they can never
+# clash with python keywords, builtins or each other
+def _var(id: str) -> str:
+    return f'v_{id}'
+
+def _proc(id: str) -> str:
+    return f'p_{id}'
+
+class __Context:
+    __logical_ops = {
+        '||': 'or',
+        '&&': 'and',
+    }
+    __arith_ops = {
+        '*': '*',
+        '+': '+',
+        '-': '-',
+        '/': '//',
+        '%': '%',
+    }
+
+    def __init__(self):
+        self.lines: list[str] = []
+        self.indent = 0
+
+    def emit(self, line: str):
+        self.lines.append(f'{"    " * self.indent}{line}')
+
+    @singledispatchmethod
+    def expr(self, _: Expr) -> str:
+        raise NotImplementedError
+
+    @expr.register
+    def _(self, expr: BoolLiteral) -> str:
+        return str(int(expr.value))
+
+    @expr.register
+    def _(self, expr: IntLiteral) -> str:
+        return str(expr.value)
+
+    @expr.register
+    def _(self, expr: Identifier) -> str:
+        return _var(expr.value)
+
+    @expr.register
+    def _(self, pref: PrefixArithmeticExpr) -> str:
+        assert pref.op in {'+', '-'}
+        return f'({pref.op}{self.expr(pref.expr)})'
+
+    @expr.register
+    def _(self, pref: PrefixLogicalExpr) -> str:
+        assert pref.op == '!'
+        return f'int(not {self.expr(pref.expr)})'
+
+    @expr.register
+    def _(self, expr: InfixArithmeticExpr) -> str:
+        op = self.__arith_ops[expr.op]
+        return f'({self.expr(expr.left)} {op} {self.expr(expr.right)})'
+
+    @expr.register
+    def _(self, expr: InfixRelationalExpr) -> str:
+        # booleans are the ints 0 and 1, like on the vm
+        return f'int({self.expr(expr.left)} {expr.op} {self.expr(expr.right)})'
+
+    @expr.register
+    def _(self, expr: InfixLogicalExpr) -> str:
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        if expr.op == '->':
+            return f'(int(not {left}) or {right})'
+        op = self.__logical_ops[expr.op]
+        return f'({left} {op} {right})'
+
+    @expr.register
+    def _(self, ternary: TernaryExpr) -> str:
+        cond = self.expr(ternary.cond)
+        then_expr = self.expr(ternary.then_expr)
+        else_expr = self.expr(ternary.else_expr)
+        return f'({then_expr} if {cond} else {else_expr})'
+
+    @expr.register
+    def _(self, call: CallExpr) -> str:
+        args = ', '.join(self.expr(arg) for arg in call.args)
+        return f'{_proc(call.callee.value)}({args})'
+
+    @singledispatchmethod
+    def statement(self, _: Statement):
+        raise NotImplementedError
+
+    @statement.register
+    def _(self, assignment: Assignment):
+        self.emit(f'{_var(assignment.dest.value)} = {self.expr(assignment.value)}')
+
+    @statement.register
+    def _(self, ifelse: IfElse):
+        self.emit(f'if {self.expr(ifelse.cond)}:')
+        self.nested(ifelse.then_block)
+        self.emit('else:')
+        self.nested(ifelse.else_block)
+
+    @statement.register
+    def _(self, while_: While):
+        self.emit(f'while {self.expr(while_.cond)}:')
+        self.nested(while_.body)
+
+    @statement.register
+    def _(self, block: Block):
+        for statement in block.statements:
+            self.statement(statement)
+
+    @statement.register
+    def _(self, assert_: Assert):
+        msg = format_error(assert_.src, assert_.loc, 'assertion failed')
+        self.emit(f'if not {self.expr(assert_.expr)}:')
+        self.indent += 1
+        self.emit(f'raise RuntimeError({msg!r})')
+        self.indent -= 1
+
+    @statement.register
+    def _(self, return_: Return):
+        self.emit(f'return {self.expr(return_.expr)}')
+
+    def nested(self, statement: Statement):
+        self.indent += 1
+        if isinstance(statement, Block) and len(statement.statements) == 0:
+            self.emit('pass')
+        else:
+            self.statement(statement)
+        self.indent -= 1
+
+    def proc(self, proc: Proc):
+        params = ', '.join(_var(param.value) for param in proc.params)
+        self.emit(f'def {_proc(proc.name.value)}({params}):')
+        # locals start at 0 like on the vm, whichever branch assigns them
+        self.indent += 1
+        assigned = [node.dest.value for node in walk(proc.body) if isinstance(node, Assignment)]
+        for name in dict.fromkeys(assigned):
+            if not name in {param.value for param in proc.params}:
+                self.emit(f'{_var(name)} = 0')
+        self.indent -= 1
+        self.nested(proc.body)
+        self.emit('')
+
+    def to_source(self, decls: list[Declaration]) -> str:
+        for decl in decls:
+            if isinstance(decl, Proc):
+                self.proc(decl)
+        return '\n'.join(self.lines)
+
+def to_source(decls: list[Declaration]) -> str:
+    ctx = __Context()
+    return ctx.to_source(decls)
+
+def compile_program(decls: list[Declaration], filename: str = '<hld>') -> dict[str, Callable[..., int]]:
+    code = compile(to_source(decls), filename, 'exec')
+    namespace: dict = {}
+    exec(code, namespace)
+    return {decl.name.value: namespace[_proc(decl.name.value)]
+            for decl in decls if isinstance(decl, Proc)}
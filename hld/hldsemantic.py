@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
 from hldast import *
-from functools import cache, singledispatchmethod
+from functools import singledispatchmethod
 from enum import Enum, IntFlag
+from typing import Optional
 
 class ValueType(Enum):
     Int = 'int'
@@ -14,9 +15,31 @@ class ContextType(IntFlag):
     Postcond = 0b0110
     Assignment = 0b1001
 
-def check_program(decls: list[Declaration]) -> tuple[dict[str, dict[str, ValueType]], dict[str, set[str]]]:
+def check_program(decls: list[Declaration], errors: Optional[list[HLDError]] = None) -> tuple[dict[str, dict[str, ValueType]], dict[str, set[str]]]:
+    # if errors is given, the first error of each declaration is appended to it
+    # instead of raised and the following declarations are still checked
     ctx = __Context()
-    return ctx.check_program(decls)
+    return ctx.check_program(decls, errors)
+
+def independent_decls(decls: list[Declaration], errors: list[HLDError]) -> list[Declaration]:
+    # the declarations without errors that do not refer, even indirectly, to
+    # one with an error, which can be verified on their own
+    failed = set()
+    for err in errors:
+        # errors lie within the last declaration starting before them
+        owners = [decl for decl in decls if err.loc != None and decl.loc <= err.loc]
+        if len(owners) > 0:
+            failed.add(max(owners, key=lambda decl: decl.loc).name.value)
+    refs = {decl.name.value: {node.callee.value for node in walk(decl) if isinstance(node, CallExpr)}
+            for decl in decls}
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in refs.items():
+            if name not in failed and not failed.isdisjoint(callees):
+                failed.add(name)
+                changed = True
+    return [decl for decl in decls if decl.name.value not in failed]
 
 class __Context:
     def __init__(self):
@@ -48,7 +71,6 @@ class __Context:
             expr.error(f'expected {expected.value}, got {actual.value}')
 
     @singledispatchmethod
-    @cache
     def typeof(self, _: Expr) -> ValueType:
         raise NotImplementedError
 
@@ -294,19 +316,35 @@ class __Context:
         assert len(self.variables) == len(decl.params)
         self.params = set(self.variables.keys())
 
-    def check_program(self, decls: list[Declaration]) -> tuple[dict[str, dict[str, ValueType]], dict[str, set[str]]]:
+    def check_program(self, decls: list[Declaration], errors: Optional[list[HLDError]]) -> tuple[dict[str, dict[str, ValueType]], dict[str, set[str]]]:
         symtab: dict[str, dict[str, ValueType]] = {}
         call_graph: dict[str, set[str]] = {}
         for decl in decls:
             assert isinstance(decl, (Fn, Pred, Proc))
             value = decl.name.value
             if value in self.decls:
-                decl.error(f'duplicate declaration `{value}`')
+                try:
+                    decl.error(f'duplicate declaration `{value}`')
+                except HLDError as e:
+                    if errors == None:
+                        raise
+                    errors.append(e)
+                    continue
             self.decls[decl.name.value] = decl
         for decl in decls:
             assert isinstance(decl, (Fn, Pred, Proc))
             value = decl.name.value
-            self.check_declaration(decl)
+            if self.decls[value] is not decl:
+                continue
+            try:
+                self.check_declaration(decl)
+            except HLDError as e:
+                if errors == None:
+                    raise
+                errors.append(e)
+                # the checks stopped halfway through the declaration
+                self.params = set()
+                self.ctx_type = ContextType.Code
             symtab[value] = self.variables
             self.variables = {}
             call_graph[value] = self.callees
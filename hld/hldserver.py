@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import pyparsing
+import socket
+
+from typing import Any, Optional, TextIO
+
+from hldast import *
+import hldcompiler
+import hlddebug
+import hldinterpreter
+import hldparser
+import hldsemantic
+
+# a line based json-rpc server, which keeps the grammar, z3 and the
+# verification cache warm between requests. Every request is a json object on
+# a line of its own, naming a file or giving the source itself:
+#   {"id": 1, "method": "verify", "params": {"file": "fct.hld", "total": true}}
+#   {"id": 2, "method": "run", "params": {"source": "proc f(x) {...}", "call": "f 1"}}
+# and is answered by a line holding either its result or an error message:
+#   {"id": 1, "result": {"calc_fct_iter": "x >= 0", "calc_fct_rec": "x >= 0"}}
+#   {"id": 2, "error": "<source>:1:15: error: ..."}
+
+class RequestError(Exception):
+    pass
+
+# options that would let a client write files wherever it likes
+_unsafe_options = {'emit_smt2'}
+
+class Server:
+    def __init__(self, cache: Optional[hlddebug.VerificationCache] = None, max_steps: int = 1000000):
+        self.cache = cache
+        # one run that does not terminate would block every later client
+        self.max_steps = max_steps
+        self.methods = {
+            'verify': self.verify,
+            'run': self.run,
+            'dis': self.dis,
+        }
+
+    def verify(self, decls: list[Declaration], symtab: dict[str, dict[str, hldsemantic.ValueType]], call_graph: dict[str, set[str]], params: dict) -> dict[str, str]:
+        correctness = hlddebug.Correctness.TOTAL if params.get('total', False) else hlddebug.Correctness.PARTIAL
+        options = params.get('options', {})
+        if not isinstance(options, dict):
+            raise RequestError('malformed options')
+        for name in options:
+            if name in _unsafe_options:
+                raise RequestError(f'option `{name}` is not allowed')
+        try:
+            debug_options = hlddebug.options_from_json(options)
+        except ValueError as e:
+            raise RequestError(e.args[0])
+        pres = hlddebug.get_pre(decls, correctness, symtab, call_graph, params.get('jobs', 1), self.cache, debug_options)
+        return {name: str(pre) for name, pre in pres.items()}
+
+    def run(self, decls: list[Declaration], symtab: dict[str, dict[str, hldsemantic.ValueType]], call_graph: dict[str, set[str]], params: dict) -> int:
+        try:
+            proc, *args = params['call'].split()
+            args = list(map(int, args))
+        except (KeyError, ValueError):
+            raise RequestError('malformed entry point argument')
+        arities = {decl.name.value: len(decl.params) for decl in decls if isinstance(decl, Proc)}
+        if not proc in arities:
+            raise RequestError(f'proc `{proc}` is not defined')
+        if len(args) != arities[proc]:
+            raise RequestError(f'proc `{proc}` expects {arities[proc]} arguments, but was given {len(args)}')
+        engine = params.get('engine', 'stack')
+        contracts = params.get('contracts', False)
+        if not engine in {'stack', 'flat', 'python'}:
+            raise RequestError(f'unknown engine `{engine}`')
+        if engine == 'python' and contracts:
+            raise RequestError('contracts cannot be checked with the python engine')
+        # every engine computes the same results, but only the flat one can
+        # stop after a number of steps
+        checks = [] if contracts else None
+        procs, prog, strtab = hldcompiler.compile_program(decls, checks)
+        vm = hldinterpreter.FlatVm(prog, strtab, checks or (), self.max_steps)
+        try:
+            return vm.run(procs[proc], args)
+        except hldinterpreter.StepLimitExceeded as e:
+            raise RequestError(e.args[0])
+
+    def dis(self, decls: list[Declaration], symtab: dict[str, dict[str, hldsemantic.ValueType]], call_graph: dict[str, set[str]], params: dict) -> list[str]:
+        _, prog, _ = hldcompiler.compile_program(decls)
+        return list(hldinterpreter.disassemble(prog))
+
+    def handle(self, request: Any) -> dict:
+        if not isinstance(request, dict) or not isinstance(request.get('params', {}), dict):
+            return {'id': None, 'error': 'error: malformed request'}
+        id = request.get('id')
+        params = request.get('params', {})
+        filename = params.get('file', '<source>')
+        try:
+            if not request.get('method') in self.methods:
+                raise RequestError(f'unknown method `{request.get("method")}`')
+            method = self.methods[request['method']]
+            parser = params.get('parser', 'pyparsing')
+            if not parser in hldparser.parsers:
+                raise RequestError(f'unknown parser `{parser}`')
+            if 'source' in params:
+                decls = hldparser.parse_string(params['source'], parser)
+            elif 'file' in params:
+                decls = hldparser.parse_file(params['file'], parser)
+            else:
+                raise RequestError('either a file or a source is required')
+            symtab, call_graph = hldsemantic.check_program(decls)
+            return {'id': id, 'result': method(decls, symtab, call_graph, params)}
+        except RequestError as e:
+            return {'id': id, 'error': f'error: {e}'}
+        except OSError as os_err:
+            return {'id': id, 'error': f'error: {os_err.filename}: {os_err.strerror}'}
+        except pyparsing.exceptions.ParseBaseException as pe:
+            return {'id': id, 'error': pe.explain(depth=0)}
+        except RecursionError:
+            return {'id': id, 'error': 'error: maximum recursion depth exceeded'}
+        except RuntimeError as e:
+            # HLDErrors and failures while running
+            return {'id': id, 'error': f'{filename}:{e.args[0]}'}
+        except Exception as e:
+            # a bad request must not take the server down with it
+            return {'id': id, 'error': f'error: {type(e).__name__}: {e}'}
+
+    def serve(self, input: TextIO, output: TextIO) -> bool:
+        # answers the requests read from input until it ends, returns whether
+        # a shutdown was requested
+        for line in input:
+            if line.strip() == '':
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if isinstance(request, dict) and request.get('method') == 'shutdown':
+                output.write(json.dumps({'id': request.get('id'), 'result': None}) + '\n')
+                output.flush()
+                return True
+            output.write(json.dumps(self.handle(request)) + '\n')
+            output.flush()
+        return False
+
+def serve_unix(server: Server, path: str):
+    # connections are served one at a time, z3 is not thread safe
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+        try:
+            sock.listen()
+            while True:
+                conn, _ = sock.accept()
+                try:
+                    with conn, conn.makefile('r') as input, conn.makefile('w') as output:
+                        if server.serve(input, output):
+                            return
+                except OSError:
+                    # the client went away, wait for the next one
+                    pass
+        finally:
+            os.unlink(path)
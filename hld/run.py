@@ -1,18 +1,16 @@
 #!/usr/bin/env python3
 
-import hldast
-import hldcompiler
-import hldparser
-import hldsemantic
-
+import csv
+import json
 import optparse
-import pyparsing
+import os
 import sys
+import time
 
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
 def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
-    usage = 'usage: %prog [options] filename'
+    usage = 'usage: %prog [options] filename [filenames or directories...]'
     p = optparse.OptionParser(usage=usage)
     p.add_option('--total',
                  action='store_const',
@@ -21,6 +19,110 @@ def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
                  dest='correctness',
                  help='enforce total correctness instead of partial'
                  )
+    p.add_option('-j', '--jobs',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=1,
+                 help='verify procs in N worker processes, or N files at a time when given several'
+                 )
+    p.add_option('-k', '--keep-going',
+                 action='store_true',
+                 default=False,
+                 help='report the errors of every declaration rather than stopping at the first'
+                 )
+    p.add_option('--lazy-checks',
+                 action='store_true',
+                 default=False,
+                 help='check preconditions for satisfiability at block boundaries only'
+                 )
+    p.add_option('--concrete-tests',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=0,
+                 help='run each proc on N inputs satisfying its precondition before verifying it'
+                 )
+    p.add_option('--emit-smt2',
+                 metavar='DIR',
+                 action='store',
+                 type='string',
+                 help='write every solver query to DIR as an smt-lib2 file, listed in DIR/manifest.jsonl'
+                 )
+    p.add_option('--timeout',
+                 metavar='MS',
+                 action='store',
+                 type='int',
+                 help='give up on a solver query after MS milliseconds'
+                 )
+    p.add_option('--rlimit',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 help='give up on a solver query after N units of solver resources'
+                 )
+    p.add_option('--retry',
+                 metavar='TACTIC[,TACTIC...]',
+                 action='store',
+                 type='string',
+                 default='',
+                 help='retry queries the solver gave up on with each z3 TACTIC in turn, e.g. qfnia,smt'
+                 )
+    p.add_option('--full-simplify',
+                 action='store_true',
+                 default=False,
+                 help='simplify the preconditions reported with the solver, slower on large formulas'
+                 )
+    p.add_option('--simplify-limit',
+                 metavar='N',
+                 action='store',
+                 type='int',
+                 default=500,
+                 help='with --full-simplify, only simplify formulas of at most N nodes with the solver (default: %default)'
+                 )
+    p.add_option('--vcgen',
+                 action='store',
+                 type='choice',
+                 choices=['wp', 'ssa'],
+                 default='wp',
+                 help='generate verification conditions by substitution, or in passive single assignment form, which keeps them linear in the size of procedures with many if statements but only checks preconditions for satisfiability at the start of procedures, branches and loop bodies rather than at every statement, and so takes no --lazy-checks (default: %default)'
+                 )
+    p.add_option('--stats',
+                 metavar='FORMAT',
+                 action='store',
+                 type='choice',
+                 choices=['json', 'table'],
+                 help='print the time, size and solver statistics of every query to stderr as json or as a table'
+                 )
+    p.add_option('--summary',
+                 metavar='FORMAT',
+                 action='store',
+                 type='choice',
+                 choices=['json', 'table'],
+                 default='table',
+                 help='when verifying several files, print their status and time as json or as a table (default: %default)'
+                 )
+    p.add_option('--parser',
+                 action='store',
+                 type='choice',
+                 # hldparser.parsers, without loading the grammar when it is
+                 # not needed
+                 choices=['pyparsing', 'pratt'],
+                 default='pyparsing',
+                 help='parse with the pyparsing grammar or with the faster hand written pratt parser (default: %default)'
+                 )
+    p.add_option('--no-cache',
+                 action='store_false',
+                 default=True,
+                 dest='cache',
+                 help='do not use the verification cache'
+                 )
+    p.add_option('--cache-dir',
+                 metavar='DIR',
+                 action='store',
+                 type='string',
+                 help='store verification results in DIR (default: ~/.cache/hld)'
+                 )
     p.add_option('--trace',
                  action='store_true',
                  default=False,
@@ -32,6 +134,51 @@ def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
                  type='string',
                  help='run program with entry point FN with ARGS'
                  )
+    p.add_option('--batch',
+                 metavar='FILE',
+                 action='store',
+                 type='string',
+                 help='with --run FN, call FN once per line of the csv FILE of arguments (- for stdin)'
+                 )
+    p.add_option('--check-contracts',
+                 action='store_true',
+                 default=False,
+                 help='with --run, check preconditions, postconditions, invariants and variants while running'
+                 )
+    p.add_option('--engine',
+                 action='store',
+                 type='choice',
+                 choices=['stack', 'flat', 'python'],
+                 default='stack',
+                 help='execution engine used by --run: stack, flat or python (default: stack)'
+                 )
+    p.add_option('--no-optimize',
+                 action='store_false',
+                 default=True,
+                 dest='optimize',
+                 help='with --run, --dis and --compile-only, skip the peephole optimization of the compiled code'
+                 )
+    p.add_option('--compile-only',
+                 action='store_true',
+                 default=False,
+                 help='write the compiled program to FILE with a .hldc suffix, which --run and --dis take in place of the source'
+                 )
+    p.add_option('--serve',
+                 action='store_true',
+                 default=False,
+                 help='answer json requests read from stdin, or from the --socket, one per line'
+                 )
+    p.add_option('--lsp',
+                 action='store_true',
+                 default=False,
+                 help='run a language server on stdin and stdout'
+                 )
+    p.add_option('--socket',
+                 metavar='PATH',
+                 action='store',
+                 type='string',
+                 help='with --serve, listen on the unix socket PATH'
+                 )
     p.add_option('--dis',
                  action='store_true',
                  default=False,
@@ -49,53 +196,266 @@ def parse_args(argv: list[str]) -> tuple[optparse.Values, list[str]]:
     )
     return p.parse_args(argv)
 
-def run(filename: str, call: str) -> Optional[int]:
-    import hldinterpreter
-    decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
-    assert isinstance(decls, list)
-    hldsemantic.check_program(decls)
+def read_batch(batch: str, proc: str, arity: int) -> Iterator[list[int]]:
+    with (sys.stdin if batch == '-' else open(batch, newline='')) as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if len(row) == 0:
+                continue
+            try:
+                args = [int(x) for x in row]
+            except ValueError:
+                print(f'error: {batch}:{reader.line_num}: malformed arguments', file=sys.stderr)
+                exit(1)
+            if len(args) != arity:
+                print(f'error: {batch}:{reader.line_num}: proc `{proc}` expects {arity} arguments, but was given {len(args)}', file=sys.stderr)
+                exit(1)
+            yield args
+
+def parse_call(call: str) -> tuple[str, list[int]]:
     try:
         proc, *args = call.split()
-        args = list(map(int, args))
+        return proc, list(map(int, args))
     except ValueError:
         print('error: malformed entry point argument', file=sys.stderr)
         exit(1)
-    procs, prog, strtab = hldcompiler.compile_program(decls)
-    try:
-        start = procs[proc]
-    except KeyError:
+
+def check_call(proc: str, args: list[int], arities: dict[str, int], batch: Optional[str]) -> Optional[int]:
+    if not proc in arities:
         print(f'error: proc `{proc}` is not defined', file=sys.stderr)
         return 1
-    vm = hldinterpreter.Vm(prog, strtab)
-    try:
-        result = vm.run(start, args)
-        print(result)
-    except RuntimeError as e:
-        print(f'{filename}:{e.args[0]}', file=sys.stderr)
+    if batch != None and len(args) != 0:
+        print('error: the arguments of --run are read from the --batch file', file=sys.stderr)
+        return 1
+    if batch == None and len(args) != arities[proc]:
+        print(f'error: proc `{proc}` expects {arities[proc]} arguments, but was given {len(args)}', file=sys.stderr)
         return 1
 
-def dis(filename: str) -> Optional[int]:
-    decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
-    assert isinstance(decls, list)
+def execute_call(filename: str, proc: str, args: list[int], arity: int, execute: Callable[[list[int]], int], batch: Optional[str]) -> Optional[int]:
+    import hldinterpreter
+    if batch == None:
+        try:
+            print(execute(args))
+        except RecursionError:
+            print('error: maximum recursion depth exceeded', file=sys.stderr)
+            return 1
+        except ArithmeticError as e:
+            print(f'error: {e}', file=sys.stderr)
+            return 1
+        except RuntimeError as e:
+            print(f'{filename}:{e.args[0]}', file=sys.stderr)
+            return 1
+        return
+    # one csv row per input: the arguments followed by the result or by the
+    # first line of the error
+    status = None
+    writer = csv.writer(sys.stdout)
+    for args, result in hldinterpreter.run_batch(execute, read_batch(batch, proc, arity)):
+        if isinstance(result, RecursionError):
+            result = 'error: maximum recursion depth exceeded'
+            status = 1
+        elif isinstance(result, ArithmeticError):
+            result = f'error: {result}'
+            status = 1
+        elif isinstance(result, RuntimeError):
+            result = f'{filename}:{result.args[0].splitlines()[0]}'
+            status = 1
+        writer.writerow([*args, result])
+    return status
+
+def run(filename: str, parser: str, call: str, engine: str, batch: Optional[str], contracts: bool, optimize: bool) -> Optional[int]:
+    import hldast
+    import hldcompiler
+    import hldinterpreter
+    import hldparser
+    import hldsemantic
+    decls = hldparser.parse_file(filename, parser)
     hldsemantic.check_program(decls)
-    _, prog, _ = hldcompiler.compile_program(decls)
-    for i, (opcode, arg) in enumerate(prog):
-        print(f'{i:04x} {opcode.name} {arg:04x}')
+    proc, args = parse_call(call)
+    arities = {decl.name.value: len(decl.params) for decl in decls if isinstance(decl, hldast.Proc)}
+    status = check_call(proc, args, arities, batch)
+    if status != None:
+        return status
+    if engine == 'python' and contracts:
+        print('error: contracts cannot be checked with the python engine', file=sys.stderr)
+        return 1
+    if engine == 'python':
+        import hldpycompiler
+        fn = hldpycompiler.compile_program(decls, filename)[proc]
+        execute = lambda args: fn(*args)
+    else:
+        checks = [] if contracts else None
+        procs, prog, strtab = hldcompiler.compile_program(decls, checks, optimize=optimize)
+        if engine == 'flat':
+            vm = hldinterpreter.FlatVm(prog, strtab, checks or ())
+        else:
+            vm = hldinterpreter.Vm(prog, strtab, checks or ())
+        start = procs[proc]
+        execute = lambda args: vm.run(start, args)
+    return execute_call(filename, proc, args, arities[proc], execute, batch)
 
-def debug(filename: str, correctness_str: str):
+def run_image(filename: str, call: str, engine: str, batch: Optional[str], contracts: bool) -> Optional[int]:
+    # neither the parser nor the compiler is loaded, the program is run from
+    # the mapped image
+    import hldimage
+    import hldinterpreter
+    image = hldimage.load_image(filename)
+    proc, args = parse_call(call)
+    status = check_call(proc, args, image.arities, batch)
+    if status != None:
+        return status
+    if engine == 'python' or contracts:
+        print('error: compiled programs cannot be run with the python engine or with contracts checked', file=sys.stderr)
+        return 1
+    if engine == 'flat':
+        vm = hldinterpreter.FlatVm.from_code(image.ops, image.args, image.strtab)
+    else:
+        vm = hldinterpreter.Vm(image.prog(), image.strtab)
+    start = image.procs[proc]
+    execute = lambda args: vm.run(start, args)
+    # errors point into the source the image was compiled from
+    return execute_call(image.source, proc, args, image.arities[proc], execute, batch)
+
+def compile_only(filename: str, parser: str, optimize: bool) -> Optional[int]:
+    import hldast
+    import hldcompiler
+    import hldimage
+    import hldparser
+    import hldsemantic
+    decls = hldparser.parse_file(filename, parser)
+    hldsemantic.check_program(decls)
+    procs, prog, strtab = hldcompiler.compile_program(decls, optimize=optimize)
+    arities = {decl.name.value: len(decl.params) for decl in decls if isinstance(decl, hldast.Proc)}
+    hldimage.write_image(image_name(filename), filename, procs, arities, prog, strtab)
+
+def image_name(filename: str) -> str:
+    return os.path.splitext(filename)[0] + '.hldc'
+
+def dis(filename: str, parser: str, optimize: bool) -> Optional[int]:
+    import hldinterpreter
+    if filename.endswith('.hldc'):
+        import hldimage
+        prog = hldimage.load_image(filename).prog()
+    else:
+        import hldcompiler
+        import hldparser
+        import hldsemantic
+        decls = hldparser.parse_file(filename, parser)
+        hldsemantic.check_program(decls)
+        _, prog, _ = hldcompiler.compile_program(decls, optimize=optimize)
+    for line in hldinterpreter.disassemble(prog):
+        print(line)
+
+def print_stats(stats: list[dict], format: str):
+    if format == 'json':
+        print(json.dumps(stats, indent=2), file=sys.stderr)
+        return
+    # slowest queries first, then the total of each proc
+    queries = [record for record in stats if record['kind'] != 'terms']
+    print(f'{"seconds":>10} {"size":>7} {"result":<7} {"kind":<12} location', file=sys.stderr)
+    for record in sorted(queries, key=lambda record: record['seconds'], reverse=True):
+        result = record['result'] or '-'
+        location = f'{record["proc"]}:{record["line"]}:{record["col"]}'
+        print(f'{record["seconds"]:>10.6f} {record["size"]:>7} {result:<7} {record["kind"]:<12} {location}', file=sys.stderr)
+    totals: dict[str, float] = {}
+    for record in queries:
+        totals[record['proc']] = totals.get(record['proc'], 0) + record['seconds']
+    print(file=sys.stderr)
+    for proc, seconds in sorted(totals.items(), key=lambda total: total[1], reverse=True):
+        print(f'{seconds:>10.6f} total of {proc}', file=sys.stderr)
+    hits = sum(record['hits'] for record in stats if record['kind'] == 'terms')
+    misses = sum(record['misses'] for record in stats if record['kind'] == 'terms')
+    print(f'term cache: {hits} hits, {misses} misses', file=sys.stderr)
+
+def make_debug_options(options: optparse.Values):
+    # None after reporting an unknown tactic or options that do not go together
     import hlddebug
-    correctness = hlddebug.Correctness(correctness_str)
-    decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
-    assert isinstance(decls, list)
-    symtab, call_graph = hldsemantic.check_program(decls)
-    pres = hlddebug.get_pre(decls, correctness, symtab, call_graph)
+    import z3
+    if options.emit_smt2 != None:
+        os.makedirs(options.emit_smt2, exist_ok=True)
+        open(os.path.join(options.emit_smt2, 'manifest.jsonl'), 'w').close()
+    if options.lazy_checks and options.vcgen == 'ssa':
+        print('error: --lazy-checks only applies to --vcgen wp', file=sys.stderr)
+        return None
+    retry = tuple(tactic for tactic in options.retry.split(',') if tactic != '')
+    for tactic in retry:
+        if tactic not in z3.tactics():
+            print(f'error: unknown tactic `{tactic}`', file=sys.stderr)
+            return None
+    return hlddebug.Options(lazy_checks=options.lazy_checks, concrete_tests=options.concrete_tests,
+                            emit_smt2=options.emit_smt2, timeout=options.timeout,
+                            rlimit=options.rlimit, retry=retry, full_simplify=options.full_simplify,
+                            simplify_limit=options.simplify_limit, vcgen=options.vcgen)
+
+def debug(filename: str, options: optparse.Values) -> Optional[int]:
+    import hldast
+    import hlddebug
+    import hldparser
+    import hldsemantic
+    correctness = hlddebug.Correctness(options.correctness)
+    # queries are only made, and so emitted, on cache misses
+    use_cache = options.cache and options.emit_smt2 == None
+    cache = hlddebug.VerificationCache(options.cache_dir) if use_cache else None
+    debug_options = make_debug_options(options)
+    if debug_options == None:
+        return 1
+    decls = hldparser.parse_file(filename, options.parser)
+    errors: Optional[list[hldast.HLDError]] = [] if options.keep_going else None
+    symtab, call_graph = hldsemantic.check_program(decls, errors)
+    if errors != None:
+        # declarations depending on one that failed the checks are not verified
+        decls = hldsemantic.independent_decls(decls, errors)
+    stats = [] if options.stats != None else None
+    try:
+        pres = hlddebug.get_pre(decls, correctness, symtab, call_graph, options.jobs, cache, debug_options, stats, errors)
+    finally:
+        if stats != None:
+            print_stats(stats, options.stats)
     for sym, pre in pres.items():
         print(f'proc {sym}(...) {{...}} requires `{pre}`')
+    if errors != None and len(errors) > 0:
+        for err in sorted(errors, key=lambda err: err.loc if err.loc != None else -1):
+            print(f'{filename}:{err.args[0]}', file=sys.stderr)
+        print(f'{len(errors)} error{"s" if len(errors) > 1 else ""}', file=sys.stderr)
+        return 1
+
+def debug_files(paths: list[str], options: optparse.Values) -> Optional[int]:
+    import hldbatch
+    import hlddebug
+    correctness = hlddebug.Correctness(options.correctness)
+    use_cache = options.cache and options.emit_smt2 == None
+    debug_options = make_debug_options(options)
+    if debug_options == None:
+        return 1
+    filenames = hldbatch.find_files(paths)
+    start = time.perf_counter()
+    records = []
+    if options.summary == 'table':
+        print(f'{"status":<9} {"seconds":>10}  file')
+    for record in hldbatch.verify_files(filenames, options.parser, correctness, options.jobs,
+                                        options.cache_dir, use_cache, debug_options):
+        records.append(record)
+        if options.summary == 'table':
+            # errors follow their line as they come, the table stays on stdout
+            print(f'{record["status"]:<9} {record["seconds"]:>10.3f}  {record["file"]}', flush=True)
+            if 'message' in record:
+                print(record['message'], file=sys.stderr, flush=True)
+    seconds = time.perf_counter() - start
+    counts = {status: 0 for status in ['verified', 'failed', 'unknown', 'error']}
+    for record in records:
+        counts[record['status']] += 1
+    if options.summary == 'json':
+        print(json.dumps({'files': records, 'counts': counts, 'seconds': round(seconds, 6)}, indent=2))
+    else:
+        print(', '.join(f'{n} {status}' for status, n in counts.items()) + f' in {seconds:.3f}s')
+    return 0 if counts['verified'] == len(records) else 1
 
-def ai(filename: str, correctness_str: str, interactive: bool) -> Optional[int]:
-    import os
+def ai(filename: str, parser: str, correctness_str: str, interactive: bool) -> Optional[int]:
     import hldai
+    import hldast
     import hlddebug
+    import hldparser
+    import hldsemantic
     import openai
     def ask(filename: str, err: str, client: openai.Client, assistant, thread) -> Optional[str]:
         try:
@@ -117,8 +477,7 @@ def ai(filename: str, correctness_str: str, interactive: bool) -> Optional[int]:
     assistant = client.beta.assistants.retrieve(assistant_id)
     thread = client.beta.threads.create()
     while True:
-        decls = hldparser.parser.parse_file(filename, parse_all=True).as_list()
-        assert isinstance(decls, list)
+        decls = hldparser.parse_file(filename, parser)
         symtab, call_graph = hldsemantic.check_program(decls)
         try:
             pres = hlddebug.get_pre(decls, correctness, symtab, call_graph)
@@ -133,23 +492,72 @@ def ai(filename: str, correctness_str: str, interactive: bool) -> Optional[int]:
             if not interactive or not hldai.update_program(response, filename):
                 return 1
 
+def serve(options: optparse.Values) -> Optional[int]:
+    import hlddebug
+    import hldserver
+    cache = hlddebug.VerificationCache(options.cache_dir) if options.cache else None
+    server = hldserver.Server(cache)
+    if options.socket != None:
+        hldserver.serve_unix(server, options.socket)
+    else:
+        server.serve(sys.stdin, sys.stdout)
+
+def lsp(options: optparse.Values) -> Optional[int]:
+    import hlddebug
+    import hldlsp
+    cache = hlddebug.VerificationCache(options.cache_dir) if options.cache else None
+    hldlsp.LanguageServer(sys.stdin.buffer, sys.stdout.buffer, cache).serve()
+
 def main(argv: list[str]) -> Optional[int]:
     options, args = parse_args(argv)
+    if options.serve or options.lsp:
+        try:
+            return serve(options) if options.serve else lsp(options)
+        except OSError as os_err:
+            print(f'error: {os_err.filename}: {os_err.strerror}', file=sys.stderr)
+            return 1
     try:
         filename = args[1]
     except IndexError:
         print('error: no file provided', file=sys.stderr)
         return 1
+    if len(args) > 2 or os.path.isdir(filename):
+        if options.run != None or options.dis or options.ai or options.compile_only:
+            print('error: --run, --dis, --ai and --compile-only take a single file', file=sys.stderr)
+            return 1
+        if options.stats != None or options.keep_going:
+            print('error: --stats and --keep-going take a single file', file=sys.stderr)
+            return 1
+        return debug_files(args[1:], options)
+    if filename.endswith('.hldc'):
+        if options.run == None and not options.dis:
+            print('error: compiled programs only take --run and --dis', file=sys.stderr)
+            return 1
+        import hldimage
+        try:
+            if options.run != None:
+                return run_image(filename, options.run, options.engine, options.batch, options.check_contracts)
+            return dis(filename, options.parser, options.optimize)
+        except OSError as os_err:
+            print(f'error: {os_err.filename}: {os_err.strerror}', file=sys.stderr)
+            return 1
+        except hldimage.ImageError as e:
+            print(f'error: {e.args[0]}', file=sys.stderr)
+            return 1
+    import hldast
+    import pyparsing
     try:
-        if options.run != None:
+        if options.compile_only:
+            return compile_only(filename, options.parser, options.optimize)
+        elif options.run != None:
             assert isinstance(options.run, str)
-            return run(filename, options.run)
+            return run(filename, options.parser, options.run, options.engine, options.batch, options.check_contracts, options.optimize)
         elif options.dis:
-            return dis(filename)
+            return dis(filename, options.parser, options.optimize)
         elif options.ai:
-            return ai(filename, options.correctness, options.interactive)
+            return ai(filename, options.parser, options.correctness, options.interactive)
         else:
-            return debug(filename, options.correctness)
+            return debug(filename, options)
     except OSError as os_err:
         print(f'error: {os_err.filename}: {os_err.strerror}', file=sys.stderr)
         return 1
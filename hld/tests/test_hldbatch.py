@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+import hldbatch
+import hlddebug
+
+class TestHldBatch(unittest.TestCase):
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+
+    def test_find_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ['b.hld', 'a.hld', 'notes.txt', os.path.join('sub', 'c.hld')]:
+                os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+                open(os.path.join(tmp, name), 'w').close()
+            files = hldbatch.find_files([tmp, 'x.hld'])
+            self.assertEqual([os.path.relpath(f, tmp) for f in files[:-1]], ['a.hld', 'b.hld', os.path.join('sub', 'c.hld')])
+            self.assertEqual(files[-1], 'x.hld')
+
+    def test_verify_files(self):
+        # fct.hld and mutual_rec.hld define fct differently, whatever worker
+        # verifies both must not mix the definitions
+        dirs = [os.path.join(self.root, 'examples'), os.path.join(self.root, 'buggy')]
+        filenames = hldbatch.find_files(dirs) + ['missing.hld']
+        records = list(hldbatch.verify_files(filenames, 'pratt', hlddebug.Correctness.PARTIAL, 2, use_cache=False))
+        self.assertEqual([record['file'] for record in records], filenames)
+        statuses = {os.path.basename(record['file']): record['status'] for record in records}
+        failed = {'ifelse.hld', 'intlog.hld', 'isqrt.hld'}
+        for name, status in statuses.items():
+            expected = 'error' if name == 'missing.hld' else 'failed' if name in failed else 'verified'
+            self.assertEqual(status, expected, name)
+        pres = {os.path.basename(record['file']): record.get('pres') for record in records}
+        self.assertEqual(pres['fct.hld']['calc_fct_iter'], '0 <= x')
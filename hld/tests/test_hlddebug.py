@@ -1,6 +1,14 @@
 #!usr/bin/env python3
 
+import gc
+import glob
+import json
+import os
+import pyparsing
+import tempfile
+import time
 import unittest
+import weakref
 import z3
 
 import hldast
@@ -136,3 +144,651 @@ proc sum_rec(n) {
         s = z3.Solver()
         s.add(expected != pre)
         self.assertEqual(s.check(), z3.unsat)
+
+    def test_parallel(self):
+        program = '''
+fn fct(n) := n <= 1 ? 1 : n * fct(n-1);
+
+#pre x > 0
+#post result == fct(x-1)
+#variant 2 * x
+proc delegate(x) {
+  y := calc_fct(x-1);
+  return y;
+}
+
+#pre x >= 0
+#post result == fct(x)
+#variant 2 * x + 1
+proc calc_fct(x) {
+  if x == 0 {
+    return 1;
+  } else {
+    y := delegate(x);
+    return y * x;
+  }
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        expected = hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph)
+        pres = hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph, jobs=2)
+        self.assertEqual(pres.keys(), expected.keys())
+        for name, pre in pres.items():
+            s = z3.Solver()
+            s.add(pre != expected[name])
+            self.assertEqual(s.check(), z3.unsat)
+
+    def test_parallel_error(self):
+        program = '''
+#post result == x + 1
+proc inc(x) {
+  return x;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        with self.assertRaises(hldast.HLDError):
+            hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, jobs=2)
+
+    def test_cache(self):
+        program = '''
+#post result == x + 1
+proc inc(x) {
+  y := x + 1;
+  return y;
+}
+
+#post result == x + 1
+proc bad(x) {
+  return x;
+}
+'''
+        def verify(program: str, cache: hlddebug.VerificationCache) -> str:
+            ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+            self.assertIsInstance(ast, list)
+            decls, call_graph = hldsemantic.check_program(ast)
+            with self.assertRaises(hldast.HLDError) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, cache=cache)
+            return cm.exception.args[0]
+        with tempfile.TemporaryDirectory() as path:
+            cache = hlddebug.VerificationCache(path)
+            first = verify(program, cache)
+            self.assertTrue(first.startswith('10:3: error:'))
+            entries = sum(len(files) for _, _, files in os.walk(path))
+            self.assertEqual(entries, 2)
+            moved = verify('// moved\n' + program, cache)
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(path)), entries)
+            self.assertTrue(moved.startswith('11:3: error:'))
+            self.assertEqual(first[first.index('\n'):], moved[moved.index('\n'):])
+
+    def test_fresh_solver(self):
+        program = '''
+#post result == n * (n - 1)
+proc sum(n) {
+  i := 0;
+  total := 0;
+  #invariant total == i * (i - 1)
+  #variant n - i
+  while i != n {
+    total := total + 2 * i;
+    i := i + 1;
+  }
+  return total;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        options = hlddebug.Options(incremental=False)
+        pre = hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph, options=options)['sum']
+        expected = hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph)['sum']
+        s = z3.Solver()
+        s.add(expected != pre)
+        self.assertEqual(s.check(), z3.unsat)
+
+    def test_lazy_checks(self):
+        program = '''
+#post result == 4
+proc f(x) {
+  y := x;
+  y := 2;
+  z := y + 1;
+  return z;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        messages = []
+        for lazy_checks in [False, True]:
+            options = hlddebug.Options(lazy_checks=lazy_checks)
+            with self.assertRaises(hldast.HLDError) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=options)
+            messages.append(cm.exception.args[0])
+        self.assertIn('`4 == 2 + 1`', messages[0])
+        self.assertEqual(messages[0], messages[1])
+
+    def test_concrete_tests(self):
+        program = '''
+#pre n >= 0
+#post result == n * (n + 1) / 2
+proc sum(n) {
+  i := 0;
+  s := 0;
+  #invariant 0 <= i && i <= n && s == i * (i + 1) / 2
+  #variant n - i
+  while i < n {
+    i := i + 1;
+    s := s + i;
+  }
+  return s;
+}
+
+#pre n >= 0
+#post result == n * n
+proc wrong(n) {
+  r := n + n;
+  return r;
+}
+
+#pre n >= 1
+#post result == n * n
+proc caller(n) {
+  r := wrong(n);
+  return r;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        options = hlddebug.Options(concrete_tests=50)
+        with self.assertRaises(hldast.HLDError) as cm:
+            hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph, options=options)
+        self.assertIn('postcondition violated\ncounter-example: [n = 1]', cm.exception.args[0])
+        self.assertEqual(cm.exception.loc, ast[1].post.loc)
+        # the caller is correct given the postcondition of the callee, so the
+        # failure of the callee is not reported for the caller
+        procs = [ast[0], ast[2]]
+        self.assertIsNone(hlddebug._test_concrete(procs, ast, hlddebug.Correctness.TOTAL, options))
+
+    def test_emit_smt2(self):
+        program = '''
+fn double(n) := 2 * n;
+
+#pre n >= 0
+#post result == double(n)
+proc f(n) {
+  i := 0;
+  r := 0;
+  #invariant 0 <= i && i <= n && r == double(i)
+  while i < n {
+    i := i + 1;
+    r := r + 2;
+  }
+  return r;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        with tempfile.TemporaryDirectory() as tmp:
+            options = hlddebug.Options(emit_smt2=tmp)
+            hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=options)
+            with open(os.path.join(tmp, 'manifest.jsonl')) as f:
+                records = [json.loads(line) for line in f]
+            kinds = {record['kind'] for record in records}
+            self.assertEqual(kinds, {'satisfiable', 'loop-exit', 'loop-body', 'precondition'})
+            for record in records:
+                self.assertEqual(record['proc'], 'f')
+                self.assertEqual(record['result'], record['expected'])
+                # the files are standalone, solved in a fresh context
+                s = z3.Solver(ctx=z3.Context())
+                s.from_file(os.path.join(tmp, record['file']))
+                self.assertEqual(str(s.check()), record['result'])
+
+    def test_unknown_result(self):
+        program = '''
+#pre true
+#post result == 0
+proc f(x, y, z) {
+  assert x * x * x + y * y * y + z * z * z != 33;
+  return 0;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        for options in [hlddebug.Options(rlimit=100000), hlddebug.Options(rlimit=100000, retry=('qfnia', 'smt'))]:
+            with self.assertRaises(hlddebug.UnknownResult) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=options)
+            self.assertEqual(cm.exception.msg, 'could not decide whether precondition implies assertion found: resource limit exceeded')
+        with tempfile.TemporaryDirectory() as tmp:
+            # giving up is not cached, a larger limit may still decide the query
+            cache = hlddebug.VerificationCache(tmp)
+            with self.assertRaises(hlddebug.UnknownResult):
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, cache=cache, options=hlddebug.Options(rlimit=100000))
+            self.assertEqual(os.listdir(tmp), [])
+        # the incremental attempt is bounded by the timeout of the query
+        start = time.perf_counter()
+        with self.assertRaises(hlddebug.UnknownResult):
+            hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=hlddebug.Options(timeout=50, incremental_timeout=5000))
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_restarts(self):
+        # the loop body query of pow takes from a tenth of a second to minutes
+        # depending on the seed and on the terms alive, without any timeout
+        filename = os.path.join(os.path.dirname(__file__), '..', '..', 'examples', 'pow.hld')
+        ast = hldparser.parser.parse_file(filename, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        for _ in range(3):
+            start = time.perf_counter()
+            pre = hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph)['calc_pow']
+            self.assertEqual(str(pre), '0 <= n')
+            self.assertLess(time.perf_counter() - start, 30)
+
+    def test_stats(self):
+        program = '''
+#pre n >= 0
+#post result == 2 * n
+proc f(n) {
+  i := 0;
+  r := 0;
+  #invariant 0 <= i && i <= n && r == 2 * i
+  while i < n {
+    i := i + 1;
+    r := r + 2;
+  }
+  return r;
+}
+
+#pre n >= 0
+#post result == 2 * n
+proc g(n) {
+  r := f(n);
+  return r;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        for jobs in [1, 2]:
+            stats = []
+            hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, jobs, stats=stats)
+            kinds = {(record['proc'], record['kind']) for record in stats}
+            self.assertEqual(kinds, {
+                ('f', 'satisfiable'), ('f', 'loop-exit'), ('f', 'loop-body'), ('f', 'precondition'), ('f', 'simplify'),
+                ('g', 'satisfiable'), ('g', 'precondition'), ('g', 'simplify'), ('f', 'terms'), ('g', 'terms'),
+            })
+            for record in stats:
+                if record['kind'] == 'terms':
+                    self.assertGreater(record['misses'], 0)
+                    continue
+                self.assertGreater(record['size'], 0)
+                self.assertGreaterEqual(record['seconds'], 0)
+                if record['kind'] != 'simplify':
+                    self.assertEqual(record['result'], hlddebug._expected_results[record['kind']])
+                    self.assertIn('rlimit count', record['solver'])
+
+    def test_stats_of_failed_procs(self):
+        program = '''
+#pre n >= 0
+#post result == 1
+proc bad(n) {
+  return n;
+}
+
+#post result == 2
+proc good(n) {
+  return 2;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        for jobs in [1, 2]:
+            stats, errors = [], []
+            pres = hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, jobs, stats=stats, errors=errors)
+            self.assertEqual(list(pres), ['good'])
+            self.assertEqual(len(errors), 1)
+            # the queries of the failed proc are recorded as well
+            self.assertEqual({record['proc'] for record in stats}, {'bad', 'good'})
+
+    def test_simplify(self):
+        program = '''
+#pre x >= 1
+#post result == x
+proc f(x) {
+  assert x >= 0;
+  assert x >= 1;
+  return x;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        # conjuncts implied by the others are dropped
+        pre = hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph)['f']
+        self.assertEqual(str(pre), '1 <= x')
+        pre = hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=hlddebug.Options(full_simplify=True))['f']
+        self.assertEqual(str(pre), 'And(1 <= x, 0 <= x)')
+        # above the limit, the cheap simplification is used
+        stats = []
+        options = hlddebug.Options(full_simplify=True, simplify_limit=1)
+        pre = hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=options, stats=stats)['f']
+        self.assertEqual(str(pre), '1 <= x')
+        simplified = [record for record in stats if record['kind'] == 'simplify']
+        self.assertGreater(simplified[-1]['size'], 1)
+
+    def test_term_cache(self):
+        program = '''
+fn double(n) := 2 * n;
+
+#pre n >= 0
+#post result == double(n)
+proc f(n) {
+  r := n + n;
+  return r;
+}
+
+#pre n >= 0
+#post result == double(n) + 1
+proc g(n) {
+  r := f(n);
+  r := r + 1;
+  return r;
+}
+
+#pre n >= 0
+#post result == double(n) + 1
+proc h(n) {
+  r := f(n);
+  r := r + 1;
+  return r;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        stats = []
+        hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, stats=stats)
+        terms = {record['proc']: record for record in stats if record['kind'] == 'terms'}
+        # h repeats g, down to the contracts of f
+        self.assertEqual(terms['h']['misses'], 0)
+        self.assertEqual(terms['h']['hits'], terms['g']['hits'] + terms['g']['misses'])
+        # the least recently used terms are dropped first
+        cache = hlddebug.TermCache(2)
+        for key in ['a', 'b', 'a', 'c']:
+            cache.get(key, lambda: z3.Int(key))
+        self.assertEqual(list(cache.terms), ['a', 'c'])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_vcgen(self):
+        program = '''
+fn sum(n) := n <= 0 ? 0 : n + sum(n - 1);
+
+#post result == sum(n)
+#variant n
+proc sum_rec(n) {
+  if n <= 0 {
+    return 0;
+  } else {
+    t := sum_rec(n - 1);
+    return t + n;
+  }
+}
+
+#pre n >= 0
+#post result >= 0 && result <= n + 3
+proc clamp(n) {
+  x := n;
+  i := 0;
+  #invariant 0 <= i && i <= 3 && 0 <= x && x <= n + i
+  #variant 3 - i
+  while i < 3 {
+    if x > i {
+      x := x - i;
+    } else {
+      x := x + 1;
+    }
+    i := i + 1;
+  }
+  if x > n {
+    y := x / 2;
+  } else {
+    t := sum_rec(x);
+    y := x + t - t;
+  }
+  return y;
+}
+
+#pre n >= 0
+#post result == (n > 0 ? 2 : 1)
+proc branch_loop(n) {
+  c := n;
+  i := 0;
+  #invariant c == n && 0 <= i && i <= 1
+  #variant 1 - i
+  while i < 1 {
+    i := i + 1;
+  }
+  if c > 0 {
+    #invariant c >= 0 && n > 0
+    #variant c
+    while c > 0 {
+      c := c - 1;
+    }
+    r := 2;
+  } else {
+    r := 1;
+  }
+  return r;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        for correctness in hlddebug.Correctness:
+            expected = hlddebug.get_pre(ast, correctness, decls, call_graph)
+            pres = hlddebug.get_pre(ast, correctness, decls, call_graph, options=hlddebug.Options(vcgen='ssa'))
+            for name in expected:
+                s = z3.Solver()
+                s.add(expected[name] != pres[name])
+                self.assertEqual(s.check(), z3.unsat)
+        # the branch is taken on the value of c before the loop in it, which
+        # assigns c
+        wrong = program.replace('#post result == (n > 0 ? 2 : 1)', '#post result == 1')
+        ast = hldparser.parser.parse_string(wrong, parse_all=True).as_list()
+        decls, call_graph = hldsemantic.check_program(ast)
+        for correctness in hlddebug.Correctness:
+            for vcgen in hlddebug.vcgens:
+                with self.assertRaises(hldast.HLDError):
+                    hlddebug.get_pre(ast, correctness, decls, call_graph, options=hlddebug.Options(vcgen=vcgen))
+
+    def test_vcgen_errors(self):
+        program = '''
+#pre n >= 0
+#post result >= 0
+proc f(n) {
+  x := n;
+  i := 0;
+  #invariant 0 <= i && i <= 3
+  while i < 3 {
+    if x > i {
+      x := x - i;
+    } else {
+      x := x + i;
+    }
+    i := i + 1;
+  }
+  return x;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        messages = []
+        for vcgen in hlddebug.vcgens:
+            options = hlddebug.Options(vcgen=vcgen)
+            with self.assertRaises(hldast.HLDError) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=options)
+            messages.append(cm.exception.args[0])
+        self.assertIn('invariant and guard negation do not imply post condition', messages[0])
+        # the counter-examples list the same variables in any order
+        self.assertEqual(messages[0].split('counter-example')[0], messages[1].split('counter-example')[0])
+        names = [sorted(assign.split(' = ')[0] for assign in message.split('counter-example: [')[1].rstrip(']').split(', '))
+                 for message in messages]
+        self.assertEqual(names[0], names[1])
+
+    def test_vcgen_unsatisfiable_branch(self):
+        program = '''
+#pre x == 3
+#post result == 3
+proc foo(x) {
+  if x != 3 {
+    y := 2;
+  } else {
+    y := x;
+  }
+  return y;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        messages = []
+        for vcgen in hlddebug.vcgens:
+            with self.assertRaises(hldast.HLDError) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=hlddebug.Options(vcgen=vcgen))
+            messages.append(cm.exception.args[0])
+        self.assertTrue(messages[0].startswith('6:5: error: precondition `3 == 2` found is unsatisfiable'))
+        self.assertEqual(messages[1], messages[0])
+        # within a loop, the precondition is stated over the variables rather
+        # than over their fresh versions and the values assigned to them
+        program = '''
+#pre x >= 0
+#post result * result <= x && x < (result + 1) * (result + 1)
+proc isqrt(x) {
+  l := 0;
+  r := x + 1;
+  #invariant l * l <= x && x < r * r
+  while l != r - 1 {
+    m := (l + r) / 2;
+    if m * m <= x {
+      r := m;
+    } else {
+      l := m;
+    }
+  }
+  return l;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        messages = []
+        for vcgen in hlddebug.vcgens:
+            with self.assertRaises(hldast.HLDError) as cm:
+                hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph, options=hlddebug.Options(vcgen=vcgen))
+            messages.append(cm.exception.args[0])
+        self.assertIn('And(l*l <= x, x < m*m)', messages[0])
+        self.assertEqual(messages[1], messages[0])
+        with self.assertRaises(ValueError):
+            hlddebug.Options(vcgen='ssa', lazy_checks=True)
+
+    def test_vcgen_size(self):
+        # each if statement doubles the substituted condition
+        lines = ['#pre n >= 0', '#post result >= 0', 'proc f(n) {', 'x := n;']
+        for i in range(1, 9):
+            lines.append(f'if x > {i} {{ x := x - {i}; }} else {{ x := x + {i}; }}')
+        lines += ['return x;', '}']
+        ast = hldparser.parser.parse_string('\n'.join(lines), parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        decls, call_graph = hldsemantic.check_program(ast)
+        sizes = {}
+        for vcgen in hlddebug.vcgens:
+            stats = []
+            hlddebug.get_pre(ast, hlddebug.Correctness.PARTIAL, decls, call_graph,
+                             options=hlddebug.Options(vcgen=vcgen), stats=stats)
+            sizes[vcgen] = max(record['size'] for record in stats if record['kind'] == 'precondition')
+        self.assertGreater(sizes['wp'], 2 ** 8)
+        self.assertLess(sizes['ssa'], 20 * 8)
+
+    def test_keep_going(self):
+        program = '''
+#post result == x + 1
+proc inc(x) {
+  return x + 2;
+}
+
+#post result == y
+proc typo(x) {
+  return x;
+}
+
+#pre x >= 0
+#post result == x + 1
+proc uses_inc(x) {
+  y := inc(x);
+  return y;
+}
+
+#post result >= 0
+proc uses_typo(x) {
+  y := typo(x);
+  return y;
+}
+
+#pre x >= 0
+#post result > x
+proc same(x) {
+  return x;
+}
+
+#post result == 3
+proc three(x) {
+  return 3;
+}
+'''
+        ast = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        with self.assertRaises(hldast.HLDError):
+            hldsemantic.check_program(ast)
+        for options in [hlddebug.Options(), hlddebug.Options(concrete_tests=10)]:
+            for jobs in [1, 2]:
+                errors = []
+                decls, call_graph = hldsemantic.check_program(ast, errors)
+                self.assertEqual(len(errors), 1)
+                # uses_typo calls a proc that failed the checks
+                checked = hldsemantic.independent_decls(ast, errors)
+                self.assertEqual([decl.name.value for decl in checked], ['inc', 'uses_inc', 'same', 'three'])
+                pres = hlddebug.get_pre(checked, hlddebug.Correctness.PARTIAL, decls, call_graph, jobs, options=options, errors=errors)
+                # uses_inc relies on the contract of inc, which does not hold
+                self.assertEqual(list(pres), ['uses_inc', 'three'])
+                # the concrete tests report the postcondition of same
+                line = '26' if options.concrete_tests > 0 else '28'
+                self.assertEqual([err.args[0].split(':')[0] for err in errors], ['7', '4', line])
+
+    def test_memory(self):
+        # nothing of a verified program outlives its verification, so that
+        # verifying many files in one process does not grow without bound
+        examples = os.path.join(os.path.dirname(__file__), '..', '..', 'examples')
+        refs = []
+        for _ in range(2):
+            for filename in sorted(glob.glob(os.path.join(examples, '*.hld'))):
+                ast = hldparser.parser.parse_file(filename, parse_all=True).as_list()
+                self.assertIsInstance(ast, list)
+                decls, call_graph = hldsemantic.check_program(ast)
+                try:
+                    hlddebug.get_pre(ast, hlddebug.Correctness.TOTAL, decls, call_graph)
+                except hldast.HLDError:
+                    pass
+                refs.extend(weakref.ref(decl) for decl in ast)
+                del ast, decls, call_graph
+        # the packrat cache of the parser holds on to the last file parsed
+        pyparsing.ParserElement.reset_cache()
+        gc.collect()
+        self.assertEqual([ref() for ref in refs if ref() != None], [])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+import hldcompiler
+import hldimage
+import hldinterpreter
+import hldparser
+import hldsemantic
+
+class TestHldImage(unittest.TestCase):
+    program = '''
+proc gcd(a, b) {
+  if b == 0 {
+    return a;
+  } else {
+    r := a % b;
+    g := gcd(b, r);
+    return g;
+  }
+}
+
+proc big(x) {
+  assert x != 0;
+  y := x * 100000000000000000000000000000 - 9223372036854775808;
+  return y;
+}
+'''
+
+    def _write(self, tmp: str) -> tuple[str, dict[str, int], list[hldinterpreter.Inst], list[str]]:
+        decls = hldparser.parse_string(self.program, 'pratt')
+        hldsemantic.check_program(decls)
+        procs, prog, strtab = hldcompiler.compile_program(decls)
+        path = os.path.join(tmp, 'prog.hldc')
+        hldimage.write_image(path, 'prog.hld', procs, {'gcd': 2, 'big': 1}, prog, strtab)
+        return path, procs, prog, strtab
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, procs, prog, strtab = self._write(tmp)
+            image = hldimage.load_image(path)
+            self.assertEqual(image.source, 'prog.hld')
+            self.assertEqual(image.procs, procs)
+            self.assertEqual(image.arities, {'gcd': 2, 'big': 1})
+            self.assertEqual(image.strtab, strtab)
+            self.assertEqual(image.prog(), prog)
+            vms = [hldinterpreter.Vm(image.prog(), image.strtab),
+                   hldinterpreter.FlatVm.from_code(image.ops, image.args, image.strtab)]
+            for vm in vms:
+                self.assertEqual(vm.run(image.procs['gcd'], [1071, 462]), 21)
+                self.assertEqual(vm.run(image.procs['big'], [2]), 200000000000000000000000000000 - 9223372036854775808)
+                with self.assertRaises(RuntimeError) as cm:
+                    vm.run(image.procs['big'], [0])
+                self.assertIn('assertion failed', cm.exception.args[0])
+
+    def test_malformed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path, _, _, _ = self._write(tmp)
+            with open(path, 'rb') as f:
+                data = f.read()
+            _, _, nprocs, ninsts, _, _ = hldimage._HEADER.unpack_from(data)
+            op = hldimage._HEADER.size
+            table = op + ninsts + hldimage._pad(ninsts) + 8 * ninsts
+            cases = [(b'', 'not a compiled program'),
+                     (data[:op] + b'\x7f' + data[op + 1:], 'invalid opcode'),
+                     (data[:table + 4] + hldimage._LENGTH.pack(ninsts) + data[table + 8:], 'invalid proc'),
+                     (data[:table] + hldimage._LENGTH.pack(1000) + data[table + 4:], 'invalid proc'),
+                     (b'HLDX' + data[4:], 'not a compiled program'),
+                     (data[:4] + b'\x09' + data[5:], 'version 9'),
+                     (data[:40], 'truncated'),
+                     (data[:-1], 'truncated')]
+            for contents, message in cases:
+                with open(path, 'wb') as f:
+                    f.write(contents)
+                with self.assertRaises(hldimage.ImageError) as cm:
+                    hldimage.load_image(path)
+                self.assertIn(message, cm.exception.args[0])
+
+if __name__ == '__main__':
+    unittest.main()
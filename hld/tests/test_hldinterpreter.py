@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import unittest
+import z3
+
+from typing import Union
+
+import hldcompiler
+import hldinterpreter
+import hldparser
+import hldpycompiler
+import hldsemantic
+
+class TestHldInterpreter(unittest.TestCase):
+    program = '''
+proc gcd(a, b) {
+  if b == 0 {
+    return a;
+  } else {
+    r := a % b;
+    g := gcd(b, r);
+    return g;
+  }
+}
+
+proc sum(n) {
+  i := 0;
+  total := 0;
+  while i < n && true {
+    i := i + 1;
+    total := total + i;
+  }
+  return total;
+}
+
+proc checked(x) {
+  assert x > 0 || x == -1;
+  y := -x;
+  return y;
+}
+'''
+
+    def _parse(self) -> list:
+        ast = hldparser.parser.parse_string(self.program, parse_all=True).as_list()
+        self.assertIsInstance(ast, list)
+        hldsemantic.check_program(ast)
+        return ast
+
+    def _compile(self) -> tuple[dict[str, int], list[hldinterpreter.Inst], list[str]]:
+        return hldcompiler.compile_program(self._parse())
+
+    def _test_engines(self, proc: str, args: list[int], expected: int):
+        procs, prog, strtab = self._compile()
+        for engine in [hldinterpreter.Vm, hldinterpreter.FlatVm]:
+            vm = engine(prog, strtab)
+            self.assertEqual(vm.run(procs[proc], args), expected)
+        fns = hldpycompiler.compile_program(self._parse())
+        self.assertEqual(fns[proc](*args), expected)
+
+    def test_call(self):
+        self._test_engines('gcd', [1071, 462], 21)
+        self._test_engines('gcd', [462, 1071], 21)
+
+    def test_while(self):
+        self._test_engines('sum', [100], 5050)
+        self._test_engines('sum', [0], 0)
+
+    def test_assert(self):
+        self._test_engines('checked', [-1], 1)
+        procs, prog, strtab = self._compile()
+        for engine in [hldinterpreter.Vm, hldinterpreter.FlatVm]:
+            vm = engine(prog, strtab)
+            with self.assertRaises(RuntimeError) as cm:
+                vm.run(procs['checked'], [0])
+            self.assertIn('assertion failed', cm.exception.args[0])
+        fns = hldpycompiler.compile_program(self._parse())
+        with self.assertRaises(RuntimeError) as cm:
+            fns['checked'](0)
+        self.assertIn('assertion failed', cm.exception.args[0])
+
+    def test_python_floor_division(self):
+        self.program = '''
+proc divmod(a, b) {
+  q := a / b;
+  r := a % b;
+  return q * 1000 + r;
+}
+'''
+        self._test_engines('divmod', [-7, 2], -4 * 1000 + 1)
+        self._test_engines('divmod', [7, -2], -4 * 1000 - 1)
+
+    def test_python_locals_and_booleans(self):
+        self.program = '''
+proc f(c) {
+  if c > 0 {
+    x := 1;
+  } else {
+    y := 2;
+  }
+  return x;
+}
+
+proc g(c) {
+  b := c > 0;
+  n := !b;
+  i := b -> c > 5;
+  return (b ? 1 : 0) + (n ? 10 : 0) + (i ? 100 : 0);
+}
+'''
+        self._test_engines('f', [1], 1)
+        self._test_engines('f', [0], 0)
+        self._test_engines('g', [-1], 110)
+        self._test_engines('g', [3], 1)
+        self._test_engines('g', [7], 101)
+
+    def test_run_batch(self):
+        procs, prog, strtab = self._compile()
+        inputs = [(1071, 462), ['10', '4'], (0, 5)]
+        expected = [([1071, 462], 21), ([10, 4], 2), ([0, 5], 5)]
+        for engine in [hldinterpreter.Vm, hldinterpreter.FlatVm]:
+            vm = engine(prog, strtab)
+            self.assertEqual(list(vm.run_batch(procs['gcd'], inputs)), expected)
+        results = list(hldinterpreter.Vm(prog, strtab).run_batch(procs['checked'], [(2,), (0,), (-1,)]))
+        self.assertEqual(results[0], ([2], -2))
+        self.assertIsInstance(results[1][1], RuntimeError)
+        self.assertIn('assertion failed', results[1][1].args[0])
+        self.assertEqual(results[2], ([-1], 1))
+
+    def test_run_batch_division_by_zero(self):
+        self.program = '''
+proc ratio(a, b) {
+  q := a / b;
+  return q;
+}
+'''
+        procs, prog, strtab = self._compile()
+        execute = hldpycompiler.compile_program(self._parse())['ratio']
+        runs = [hldinterpreter.Vm(prog, strtab).run_batch(procs['ratio'], [(4, 2), (1, 0), (6, 3)]),
+                hldinterpreter.FlatVm(prog, strtab).run_batch(procs['ratio'], [(4, 2), (1, 0), (6, 3)]),
+                hldinterpreter.run_batch(lambda args: execute(*args), [(4, 2), (1, 0), (6, 3)])]
+        for run in runs:
+            results = list(run)
+            # the failed row does not stop the rows after it
+            self.assertEqual([results[0], results[2]], [([4, 2], 2), ([6, 3], 2)])
+            self.assertIsInstance(results[1][1], ZeroDivisionError)
+
+    contracts = '''
+pred sorted_upto(a, n) := forall i. 0 <= i && i < n -> i * a <= (i + 1) * a;
+fn fct(n) := n <= 0 ? 1 : n * fct(n - 1);
+
+#pre n >= 0
+#post result == fct(n) && sorted_upto(a, n)
+#variant n
+proc rec(n, a) {
+  if n == 0 {
+    return 1;
+  } else {
+    m := n - 1;
+    r := rec(m, a);
+    s := r * n;
+    return s;
+  }
+}
+
+#pre true
+#post result == (n < 0 ? 0 : n)
+proc loop(n, step, bad) {
+  i := 0;
+  #invariant i <= n || n < 0
+  #variant n - i
+  while i < n {
+    i := i + step;
+  }
+  r := i + bad;
+  return r;
+}
+'''
+
+    def _test_contracts(self, proc: str, args: list[int], expected: Union[int, str]):
+        decls = hldparser.parser.parse_string(self.contracts, parse_all=True).as_list()
+        hldsemantic.check_program(decls)
+        checks = []
+        procs, prog, strtab = hldcompiler.compile_program(decls, checks)
+        for engine in [hldinterpreter.Vm, hldinterpreter.FlatVm]:
+            vm = engine(prog, strtab, checks)
+            if isinstance(expected, int):
+                self.assertEqual(vm.run(procs[proc], args), expected)
+            else:
+                with self.assertRaises(RuntimeError) as cm:
+                    vm.run(procs[proc], args)
+                self.assertIn(expected, cm.exception.args[0])
+        # without checks, contracts are ignored
+        procs, prog, strtab = hldcompiler.compile_program(decls)
+        self.assertNotIn(hldinterpreter.Opcode.CHECK, (inst.op for inst in prog))
+
+    def test_contracts(self):
+        self._test_contracts('rec', [5, 1], 120)
+        self._test_contracts('rec', [-1, 1], 'precondition violated')
+        self._test_contracts('rec', [5, -1], 'postcondition violated')
+        self._test_contracts('loop', [10, 1, 0], 10)
+        self._test_contracts('loop', [-3, 1, 0], 'variant is negative')
+        self._test_contracts('loop', [10, 1, 1], 'postcondition violated')
+        self._test_contracts('loop', [10, 3, 0], 'invariant violated')
+        self._test_contracts('loop', [10, 0, 0], 'variant does not decrease')
+        self._test_contracts('loop', [10, -1, 0], 'variant does not decrease')
+
+    def test_smt_division(self):
+        program = '''
+proc divmod(a, b) {
+  q := a / b;
+  r := a % b;
+  s := q * 1000 + r;
+  return s;
+}
+'''
+        decls = hldparser.parser.parse_string(program, parse_all=True).as_list()
+        hldsemantic.check_program(decls)
+        procs, prog, strtab = hldcompiler.compile_program(decls, smt_division=True)
+        vm = hldinterpreter.FlatVm(prog, strtab)
+        for a, b in [(7, 2), (-7, 2), (7, -2), (-7, -2), (6, -3)]:
+            q, r = z3.simplify(z3.IntVal(a) / b).as_long(), z3.simplify(z3.IntVal(a) % b).as_long()
+            self.assertEqual(vm.run(procs['divmod'], [a, b]), q * 1000 + r)
+
+    def test_step_limit(self):
+        procs, prog, strtab = self._compile()
+        vm = hldinterpreter.FlatVm(prog, strtab, max_steps=50)
+        self.assertEqual(vm.run(procs['sum'], [10]), 55)
+        with self.assertRaises(hldinterpreter.StepLimitExceeded):
+            vm.run(procs['sum'], [100])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import unittest
+
+import hlddebug
+import hldlsp
+
+class TestHldLsp(unittest.TestCase):
+    program = '''
+#pre n >= 0
+#post result == n + 1
+proc inc(n) {
+  r := n + 1;
+  return r;
+}
+
+#pre n >= 0
+#post result == n + 2
+proc inc2(n) {
+  r := inc(n);
+  r := inc(r);
+  return r;
+}
+'''
+
+    def frame(self, message: dict) -> bytes:
+        body = json.dumps(message).encode()
+        return f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+
+    def serve(self, *messages, cache=None) -> list[dict]:
+        input = io.BytesIO(b''.join(self.frame(message) for message in messages))
+        output = io.BytesIO()
+        hldlsp.LanguageServer(input, output, cache).serve()
+        output.seek(0)
+        server = hldlsp.LanguageServer(output, io.BytesIO())
+        responses = []
+        while True:
+            message = server.read()
+            if message == None:
+                return responses
+            responses.append(message)
+
+    def change(self, version: int, text: str) -> dict:
+        return {'jsonrpc': '2.0', 'method': 'textDocument/didChange', 'params': {
+            'textDocument': {'uri': 'file:///inc.hld', 'version': version},
+            'contentChanges': [{'text': text}],
+        }}
+
+    def test_diagnostics(self):
+        cache = hlddebug.MemoryCache()
+        responses = self.serve(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {'capabilities': {}}},
+            {'jsonrpc': '2.0', 'method': 'initialized', 'params': {}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {'textDocument': {
+                'uri': 'file:///inc.hld', 'languageId': 'hld', 'version': 1, 'text': self.program,
+            }}},
+            self.change(2, self.program.replace('r := inc(r);', 'r := inc(n);')),
+            self.change(3, self.program.replace('r := inc(r);', 'r := inc(r')),
+            self.change(4, self.program),
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'hover', 'params': {}},
+            {'jsonrpc': '2.0', 'id': 3, 'method': 'shutdown'},
+            {'jsonrpc': '2.0', 'method': 'exit'},
+            cache=cache,
+        )
+        self.assertEqual(responses[0]['result']['capabilities']['textDocumentSync']['change'], 1)
+        diagnostics = [response['params']['diagnostics'] for response in responses[1:5]]
+        self.assertEqual(diagnostics[0], [])
+        self.assertEqual(len(diagnostics[1]), 1)
+        self.assertEqual(diagnostics[1][0]['range']['start'], {'line': 12, 'character': 2})
+        self.assertTrue(diagnostics[1][0]['message'].startswith('precondition'))
+        self.assertEqual(len(diagnostics[2]), 1)
+        self.assertEqual(diagnostics[2][0]['range']['start']['line'], 13)
+        self.assertEqual(diagnostics[3], [])
+        self.assertEqual(responses[5]['error']['code'], -32601)
+        self.assertEqual(responses[6], {'jsonrpc': '2.0', 'id': 3, 'result': None})
+        # inc was verified once, inc2 once per version that parsed, the last
+        # version is the first one again
+        self.assertEqual(len(cache.entries), 3)
+
+    def test_all_errors(self):
+        program = self.program.replace('r := n + 1;', 'r := n + 2;').replace('result == n + 2', 'result == m + 2')
+        responses = self.serve(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {'capabilities': {}}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {'textDocument': {
+                'uri': 'file:///inc.hld', 'languageId': 'hld', 'version': 1, 'text': program + self.program.replace('inc', 'dec'),
+            }}},
+            {'jsonrpc': '2.0', 'method': 'exit'},
+        )
+        diagnostics = responses[1]['params']['diagnostics']
+        # the typo in inc2 and the body of inc, the dec procs verify
+        self.assertEqual([d['range']['start']['line'] for d in diagnostics], [9, 4])
+
+    def test_bad_requests(self):
+        nested = 'proc f(x) { return ' + '(' * 5000 + 'x' + ')' * 5000 + '; }'
+        responses = self.serve(
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {'initializationOptions': {'options': {'timeout': 'soon'}}}},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'initialize', 'params': {'initializationOptions': {'options': {'bogus': 1}}}},
+            {'jsonrpc': '2.0', 'id': 3, 'method': 'initialize', 'params': {'initializationOptions': {'options': {'retry': ['bogus']}}}},
+            {'jsonrpc': '2.0', 'id': 4, 'method': 'initialize', 'params': {'initializationOptions': {'options': {'timeout': 1000}}}},
+            {'jsonrpc': '2.0', 'method': 'textDocument/didOpen', 'params': {'textDocument': {
+                'uri': 'file:///nested.hld', 'languageId': 'hld', 'version': 1, 'text': nested,
+            }}},
+            {'jsonrpc': '2.0', 'method': 'exit'},
+        )
+        # the server answers with an error and keeps serving
+        self.assertEqual([response['error']['message'] for response in responses[:3]],
+                         ['option `timeout` must be of type int', 'unknown option `bogus`', 'unknown tactic `bogus`'])
+        self.assertEqual(responses[0]['error']['code'], -32602)
+        self.assertIn('result', responses[3])
+        diagnostics = responses[4]['params']['diagnostics']
+        self.assertEqual([d['message'] for d in diagnostics], ['maximum recursion depth exceeded'])
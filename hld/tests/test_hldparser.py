@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import pickle
 import unittest
 import pyparsing as pp
 
@@ -105,3 +106,25 @@ class TestHldParser(unittest.TestCase):
 
     def test_pred(self):
         self._test(hldparser.pred, 'pred foo() := false;', hldast.Pred, {'name.value': 'foo'})
+
+    def test_source(self):
+        src = 'proc foo(x) {\n  // comment\n\n  y := x + 1;\n  return y;\n}\n'
+        decls = hldparser.parse_string(src)
+        # every node of a parse refers to one shared source
+        self.assertEqual({id(node.src) for node in hldast.walk(decls[0])}, {id(decls[0].src)})
+        for loc in range(len(src) + 1):
+            self.assertEqual(decls[0].src.lineno(loc), pp.lineno(loc, src))
+            self.assertEqual(decls[0].src.col(loc), pp.col(loc, src))
+            self.assertEqual(decls[0].src.line(loc), pp.line(loc, src))
+
+    def test_node_equality(self):
+        # nodes compare by their location and children, not by the source
+        first, = hldparser.parse_string('fn foo(x) := x + 1;')
+        second, = hldparser.parse_string('fn foo(x) := x + 1; ')
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first.expr), hash(second.expr))
+        self.assertNotEqual(first.expr, hldparser.parse_string('fn foo(x) :=  x + 1;')[0].expr)
+        self.assertFalse(hasattr(first.expr, '__dict__'))
+        copy = pickle.loads(pickle.dumps(first))
+        self.assertEqual(copy, first)
+        self.assertIs(copy.expr.src, copy.src)
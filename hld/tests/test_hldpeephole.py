@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import hldcompiler
+import hldinterpreter
+import hldparser
+import hldsemantic
+
+from hldinterpreter import Opcode
+
+class TestHldPeephole(unittest.TestCase):
+    program = '''
+proc count(n, m) {
+  i := 0;
+  c := 0;
+  while i < n && c * 2 < n + m {
+    r := i % 3;
+    if (r == 0 || i > m) && !(2 * 3 < 5) {
+      c := c + 1;
+    } else {
+      c := c + (1 > 2 ? 100 : 0);
+    }
+    i := i + 1;
+  }
+  return c;
+}
+
+proc twice(x) {
+  y := count(x, 4);
+  z := count(x, 4);
+  t := y + z;
+  return t;
+}
+
+proc flag(x) {
+  b := x > 0 -> x < 10 ? 1 : 0;
+  return b;
+}
+'''
+
+    def _compile(self, optimize: bool) -> tuple[dict[str, int], list[hldinterpreter.Inst], list[str]]:
+        decls = hldparser.parse_string(self.program, 'pratt')
+        hldsemantic.check_program(decls)
+        return hldcompiler.compile_program(decls, optimize=optimize)
+
+    def test_same_results(self):
+        procs, prog, strtab = self._compile(False)
+        opt_procs, opt_prog, opt_strtab = self._compile(True)
+        self.assertLess(len(opt_prog), len(prog))
+        calls = [('count', [n, m]) for n in range(8) for m in [-1, 2, 5]]
+        calls += [('twice', [n]) for n in range(6)] + [('flag', [x]) for x in [-5, 0, 5, 10, 20]]
+        for engine in [hldinterpreter.Vm, hldinterpreter.FlatVm]:
+            vm = engine(prog, strtab)
+            opt_vm = engine(opt_prog, opt_strtab)
+            for proc, args in calls:
+                self.assertEqual(opt_vm.run(opt_procs[proc], args), vm.run(procs[proc], args), (proc, args))
+
+    def test_rewrites(self):
+        procs, prog, _ = self._compile(True)
+        ops = [inst.op for inst in prog[procs['count']:procs['twice']]]
+        # the constant condition and the constant branch are folded away
+        self.assertNotIn(Opcode.MUL, ops)
+        self.assertNotIn(Opcode.NOT, ops)
+        self.assertNotIn(100, [inst.arg for inst in prog if inst.op == Opcode.CONST])
+        # conditions are popped by the jumps on them
+        self.assertNotIn(Opcode.POP, ops)
+        self.assertIn(Opcode.LOAD_LOAD_OP, ops)
+        self.assertIn(Opcode.LOAD_CONST_OP, ops)
+        self.assertIn(Opcode.CMP_JMP_UNLESS, ops)
+        # no jump lands on an unconditional jump
+        for inst in prog:
+            if inst.op in {Opcode.JMP, Opcode.JMP_IF, Opcode.JMP_UNLESS}:
+                self.assertNotEqual(prog[inst.arg].op, Opcode.JMP)
+
+    def test_step_limit(self):
+        # the loop keeps its backward jump, so it still counts as a step
+        procs, prog, strtab = self._compile(True)
+        vm = hldinterpreter.FlatVm(prog, strtab, max_steps=20)
+        self.assertEqual(vm.run(procs['count'], [10, 100]), 4)
+        with self.assertRaises(hldinterpreter.StepLimitExceeded):
+            vm.run(procs['count'], [100, 100])
+
+if __name__ == '__main__':
+    unittest.main()
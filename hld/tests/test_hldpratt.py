@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import ast
+import glob
+import os
+import pyparsing
+import unittest
+
+import hldparser
+import hldpratt
+
+class TestHldPratt(unittest.TestCase):
+    root = os.path.join(os.path.dirname(__file__), '..', '..')
+
+    def parse(self, parse, src: str):
+        try:
+            return parse(src)
+        except pyparsing.ParseBaseException as pe:
+            return type(pe), pe.loc, pe.msg
+
+    def _test(self, src: str):
+        # trees compare equal down to their locations
+        expected = self.parse(lambda src: hldparser.parser.parse_string(src, parse_all=True).as_list(), src)
+        self.assertEqual(self.parse(hldpratt.parse_string, src), expected, src)
+
+    def test_files(self):
+        for dir in ['examples', 'buggy']:
+            for filename in sorted(glob.glob(os.path.join(self.root, dir, '*.hld'))):
+                with open(filename) as f:
+                    self._test(f.read())
+
+    def test_tests(self):
+        # every string of the tests, most of which are programs
+        for filename in sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'test_*.py'))):
+            with open(filename) as f:
+                tree = ast.parse(f.read())
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                    self._test(node.value)
+
+    def test_locations(self):
+        self._test('proc f( a ,\tb ) {  x := g( a,  b); y := ( a) ; z := - a; w := true  ; // c\n  v := 1 // d\n ; }')
+        self._test('#pre x > 0 // c\n#post result == (x < 0 ? -x : x)\nproc f(x) { return x * 2 + 1 - 3 && !(x / 2 > 1) -> true; }')
+        self._test('fn f(x, y) := x; pred p(i) := forall i j. exists k . f(i, j) == k;')
+        self._test('proc f(n) {\n  #invariant n >= 0\n  #variant n\n  while n > 0 { n := n - 1; }\n  if n == 0 {} else if n < 0 { assert false; } else {}\n  return n;\n}')
+
+    def test_errors(self):
+        for src in ['', 'x', '  x', 'proc f(x) { x := 1 }', 'proc f(x) { x := ; }', 'proc f(x) { return x; ',
+                    'proc f(x { }', 'proc (x) {}', 'proc if() {}', 'fn f(x) := x', 'proc f() { if x {} }',
+                    'proc f() { if x {} else x }', 'proc f() { x := (1 + 2; }', 'proc f() { x := 1 +; }',
+                    'proc f() {} garbage', 'proc f() { x := g(1,); }', 'proc f() { x = 1; }', 'proc f(x,) {}',
+                    '#pre x > \nproc f() {}', 'proc f() { x := forall . 1; }', 'proc f() { x := 1 ? 2; }',
+                    'proc f() { #invariant x x := 1; }', 'proc f() { while {} }', 'procf() {}', '1proc f() {}',
+                    'fn f(x) := 1 + f(:);', 'fn f(x) := 1 + 2 + f(:);', 'fn f(x) := -f(:);',
+                    'fn f(x) := x ? 1 : f(:);', 'proc f() { if x {} elseif x {} else {} }',
+                    'fn f(x) := ->x;', 'fn f(x) := 1 + != 2;', 'fn f(x) := (\n->x);']:
+            self._test(src)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import hldserver
+
+class TestHldServer(unittest.TestCase):
+    program = '''
+#pre n >= 0
+#post result == n + 1
+proc inc(n) {
+  r := n + 1;
+  return r;
+}
+'''
+
+    def serve(self, *requests) -> list[dict]:
+        input = io.StringIO(''.join(json.dumps(request) + '\n' for request in requests))
+        output = io.StringIO()
+        hldserver.Server().serve(input, output)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_requests(self):
+        responses = self.serve(
+            {'id': 1, 'method': 'verify', 'params': {'source': self.program}},
+            {'id': 2, 'method': 'run', 'params': {'source': self.program, 'call': 'inc 41', 'engine': 'flat'}},
+            {'id': 3, 'method': 'dis', 'params': {'source': self.program}},
+        )
+        self.assertEqual(responses[0], {'id': 1, 'result': {'inc': 'True'}})
+        self.assertEqual(responses[1], {'id': 2, 'result': 42})
+        self.assertEqual(responses[2]['id'], 3)
+        self.assertEqual(responses[2]['result'][0], '0000 ENTER 0002')
+
+    def test_errors(self):
+        responses = self.serve(
+            {'id': 1, 'method': 'verify', 'params': {'file': 'inc.hld', 'source': self.program.replace('n + 1;', 'n + 2;')}},
+            {'id': 2, 'method': 'run', 'params': {'source': self.program, 'call': 'inc'}},
+            {'id': 3, 'method': 'verify', 'params': {'source': 'proc f(x) {'}},
+            {'id': 4, 'method': 'prove', 'params': {'source': self.program}},
+            {'id': 5, 'method': 'verify', 'params': {'source': self.program, 'options': {'retry': ['bogus']}}},
+        )
+        self.assertTrue(responses[0]['error'].startswith('inc.hld:5:3: error: precondition `n + 2 == n + 1` found is unsatisfiable'))
+        self.assertEqual(responses[1]['error'], 'error: proc `inc` expects 1 arguments, but was given 0')
+        self.assertIn('Expected \'}\'', responses[2]['error'])
+        self.assertEqual(responses[3]['error'], 'error: unknown method `prove`')
+        self.assertEqual(responses[4]['error'], 'error: unknown tactic `bogus`')
+
+    def test_limits(self):
+        loop = '''
+proc spin(n) {
+  i := n;
+  while i == i {
+    i := i + 1;
+  }
+  return i;
+}
+'''
+        input = io.StringIO(''.join(json.dumps(request) + '\n' for request in [
+            {'id': 1, 'method': 'run', 'params': {'source': loop, 'call': 'spin 0', 'engine': engine}}
+            for engine in ['stack', 'flat', 'python']] + [
+            {'id': 2, 'method': 'verify', 'params': {'source': self.program, 'options': {'emit_smt2': '/tmp'}}},
+            {'id': 3, 'method': 'run', 'params': {'source': self.program, 'call': 'inc 1'}}]))
+        output = io.StringIO()
+        hldserver.Server(max_steps=1000).serve(input, output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        for response in responses[:3]:
+            self.assertEqual(response, {'id': 1, 'error': 'error: step limit of 1000 exceeded'})
+        self.assertEqual(responses[3], {'id': 2, 'error': 'error: option `emit_smt2` is not allowed'})
+        self.assertEqual(responses[4], {'id': 3, 'result': 2})
+        # the server keeps answering after malformed requests
+        input = io.StringIO('not json\n' + json.dumps({'id': 1, 'method': 'run', 'params': {'source': self.program, 'call': 'inc 1'}}) + '\n')
+        output = io.StringIO()
+        self.assertFalse(hldserver.Server().serve(input, output))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0]), {'id': None, 'error': 'error: malformed request'})
+        self.assertEqual(json.loads(lines[1]), {'id': 1, 'result': 2})
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'hld.sock')
+            thread = threading.Thread(target=hldserver.serve_unix, args=(hldserver.Server(), path))
+            thread.start()
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            # each connection is a session of its own
+            for request, expected in [({'id': 1, 'method': 'run', 'params': {'source': self.program, 'call': 'inc 1'}}, 2),
+                                      ({'id': 2, 'method': 'shutdown'}, None)]:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(path)
+                    with sock.makefile('rw') as f:
+                        f.write(json.dumps(request) + '\n')
+                        f.flush()
+                        self.assertEqual(json.loads(f.readline()), {'id': request['id'], 'result': expected})
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertFalse(os.path.exists(path))